@@ -0,0 +1,568 @@
+"""Headless benchmarks for SmartHomeApp view builds and state transitions.
+
+The app runs against a real ft.Page whose connection only records what it
+would have sent, so no Flet client is needed. For every synthetic home size
+each view and interaction reports build time, control count, peak Python
+memory and the serialized size of the page updates it caused.
+
+    python benchmark.py
+    python benchmark.py --sizes 10 100 --repeat 5
+"""
+import argparse
+import asyncio
+import bisect
+import itertools
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import wait
+from types import SimpleNamespace
+
+# Keep benchmark history and logs out of the real data directory
+os.environ.setdefault("SMARTNEST_DATA", tempfile.mkdtemp(prefix="smartnest-bench-"))
+
+import flet as ft
+import numpy as np
+from flet.core.connection import Connection
+from flet.core.page import Page
+from flet.core.protocol import CommandEncoder, PageCommandResponsePayload, PageCommandsBatchResponsePayload
+
+from smartNest import (
+    CARD_STYLES, DEVICE_PROTOCOLS, ChangeBus, ControlTemplate, CostEngine, DeviceChange, DeviceIO, DeviceRegistry, EnergyStore,
+    Fan, Home, Light, Lock, RuleEngine, SceneEngine, SmartHomeApp, ThermalModel, Thermostat, count_controls, week_hours,
+)
+
+
+class RecordingConnection(Connection):
+    """Accepts every page command and counts the bytes a real client would receive"""
+
+    def __init__(self, delay=0.0):
+        super().__init__()
+        self.ids = itertools.count(1)
+        self.bytes_sent = 0
+        # Simulated time for a client to take each batch, and when batches were taken
+        self.delay = delay
+        self.sent_at = []
+
+    def send_command(self, session_id, command):
+        self.bytes_sent += len(json.dumps(command, cls=CommandEncoder, separators=(",", ":")))
+        return PageCommandResponsePayload(result="", error="")
+
+    def send_commands(self, session_id, commands):
+        self.bytes_sent += len(json.dumps(commands, cls=CommandEncoder, separators=(",", ":")))
+        if self.delay:
+            time.sleep(self.delay)
+        self.sent_at.append(time.perf_counter())
+        # The client answers every "add" with the ids of the controls it created
+        results = [
+            " ".join(f"_{next(self.ids)}" for _ in command.commands)
+            for command in commands
+            if command.name == "add"
+        ]
+        return PageCommandsBatchResponsePayload(results=results, error="")
+
+
+def synthetic_home(count):
+    """`count` devices in rooms of eight: four lights, two fans, a lock and a thermostat each"""
+    devices = []
+    for i in range(count):
+        room = f"Room {i // 8 + 1}"
+        slot = i % 8
+        if slot < 4:
+            devices.append(Light(f"light_{i}", f"Light {i}", room, "ON" if i % 3 else "OFF", brightness=20 + i % 80))
+        elif slot < 6:
+            devices.append(Fan(f"fan_{i}", f"Fan {i}", room, speed=i % 4))
+        elif slot == 6:
+            devices.append(Lock(f"lock_{i}", f"Lock {i}", room, locked=bool(i % 2)))
+        else:
+            devices.append(Thermostat(f"thermostat_{i}", f"Thermostat {i}", room, "Heating", current=20, target=21))
+
+    def actions(kind, command, limit):
+        return [f"{d.id}: {command}" for d in devices if d.kind == kind][:limit]
+
+    scenes = [
+        {"name": "Away Mode", "devices": actions("light", "off", 30) + actions("lock", "lock", 5) + actions("thermostat", "set (18)", 5)},
+        {"name": "Good Morning", "devices": actions("light", "on", 20) + actions("thermostat", "set (22)", 5)},
+    ]
+    for scene in scenes:
+        scene["actions"] = len(scene["devices"])
+    return devices, scenes
+
+
+def reset_views(app):
+    """Drop every cached view so the next show_* call builds from scratch"""
+    app.view_cache.clear()
+    app.dashboard = None
+    app.bindings.clear()
+    app.topic_bindings.clear()
+    app.card_cache.clear()
+
+
+def measure(app, conn, run, repeat):
+    """Median wall time over `repeat` runs, then one traced run for memory, controls and bytes"""
+    def settled():
+        run()
+        # Send the batched page update now instead of on the next frame
+        app.updates.flush()
+
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        settled()
+        times.append(time.perf_counter() - started)
+
+    sent = conn.bytes_sent
+    tracemalloc.start()
+    settled()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "ms": statistics.median(times) * 1000,
+        "controls": count_controls(app.main_content.content),
+        "peak_kb": peak / 1024,
+        "update_kb": (conn.bytes_sent - sent) / 1024,
+    }
+
+
+def bench_home(size, repeat):
+    devices, scenes = synthetic_home(size)
+    conn = RecordingConnection()
+    page = Page(conn, "bench", asyncio.new_event_loop())
+    app = SmartHomeApp(page, devices=devices, scenes=scenes, rules=[], schedules=[])
+
+    light = app.devices.find(kind="light")[0]
+    thermostat = app.devices.find(kind="thermostat")[0]
+
+    def view(show):
+        def run():
+            reset_views(app)
+            show()
+        return run
+
+    def bound(device_id, control_type):
+        return next(c for c, *_ in app.bindings[device_id] if isinstance(c, control_type))
+
+    def toggle():
+        button = bound(light.id, ft.ElevatedButton)
+        button.on_click(SimpleNamespace(control=button))
+
+    def slider_drag():
+        slider = bound(thermostat.id, ft.Slider)
+        event = SimpleNamespace(control=slider)
+        for tick in range(30):
+            slider.value = 15 + tick % 15
+            slider.on_change(event)
+        slider.on_change_end(event)
+
+    scenarios = [
+        ("dashboard", view(app.show_dashboard)),
+        ("statistics", view(app.show_statistics)),
+        ("profile", view(app.show_profile)),
+        ("scenes", view(app.show_scenes)),
+        ("thermostat details", view(lambda: app.show_thermostat_details(thermostat.id))),
+        ("light details", view(lambda: app.show_light_details(light.id, light.name))),
+    ]
+    results = [(name, measure(app, conn, run, repeat)) for name, run in scenarios]
+
+    app.show_dashboard()
+    for name, run in [
+        ("toggle", toggle),
+        ("slider drag", slider_drag),
+        ("scene activation", lambda: app.activate_scene("Away Mode").result()),
+    ]:
+        results.append((name, measure(app, conn, run, repeat)))
+    return results
+
+
+def bench_cards(count):
+    """Build time and allocated memory blocks per card, built from scratch and copied from CARD_TEMPLATES"""
+    devices, scenes = synthetic_home(count)
+    app = SmartHomeApp(Page(RecordingConnection(), "cards", asyncio.new_event_loop()), devices=devices, scenes=scenes, rules=[], schedules=[])
+    switches = [device for device in app.devices if device.kind in CARD_STYLES]
+    factories = [
+        ("device card", switches, lambda d: app.create_device_card(d.name, d.id, *CARD_STYLES[d.kind], d.kind)),
+        ("thermostat card", app.devices.find(kind="thermostat"), lambda d: app.create_thermostat_card(d.id)),
+        ("fan card", app.devices.find(kind="fan"), lambda d: app.create_fan_card(d.id)),
+        ("stat card", range(count), lambda i: app.create_stat_card("Total Actions", str(i), "#1a2332")),
+        ("large stat card", range(count), lambda i: app.create_large_stat_card(ft.Icons.BOLT, str(i), "kWh", "#e3f2fd")),
+        ("mode button", range(count), lambda i: app.create_mode_button("Heat", ft.Icons.WB_SUNNY, "heat", ("heat", "cool")[i % 2], None)),
+        ("info row", range(count), lambda i: app.create_info_row("Firmware", f"v{i}")),
+    ]
+    results = {}
+    enabled = ControlTemplate.enabled
+    for templates in (False, True):
+        ControlTemplate.enabled = templates
+        for name, items, make in factories:
+            app.bindings.clear()
+            started = time.perf_counter()
+            for item in items:
+                make(item)
+            elapsed = time.perf_counter() - started
+            app.bindings.clear()
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            cards = [make(item) for item in items]
+            blocks = sum(stat.count_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+            tracemalloc.stop()
+            results.setdefault(name, {})["template" if templates else "built"] = {
+                "us": elapsed / len(cards) * 1e6,
+                "blocks": blocks / len(cards),
+            }
+    ControlTemplate.enabled = enabled
+    return results
+
+
+def bench_startup(size):
+    """Cold start of one session: shell, state load, then the dashboard section by section"""
+    devices, scenes = synthetic_home(size)
+    conn = RecordingConnection()
+    shell = {}
+
+    def load_home():
+        # Called once the shell has been sent
+        shell["kb"] = conn.bytes_sent / 1024
+        return Home(devices, scenes, rules=[], schedules=[], start=False)
+
+    app = SmartHomeApp(Page(conn, "startup", asyncio.new_event_loop()), load_home=load_home)
+    result = {"devices": size}
+    result.update({f"{milestone}_ms": at * 1000 for milestone, at in app.timeline.marks.items()})
+    result.update({"shell_kb": shell["kb"], "total_kb": conn.bytes_sent / 1024, "sends": len(conn.sent_at)})
+    return result
+
+
+def bench_rules(rule_count, rate, seconds):
+    """Offer `rate` state changes per second to `rule_count` rules and report how the engine keeps up"""
+    devices = DeviceRegistry(synthetic_home(max(rule_count // 4, 8))[0])
+    lights = devices.find(kind="light")
+    locks = devices.find(kind="lock")
+    applied = []
+    engine = RuleEngine(SceneEngine(devices, None).parse, lambda *action: applied.append(action))
+    # Every rule watches a lock and switches a light, a quarter of them only at night
+    for i in range(rule_count):
+        rule = {"name": f"rule {i}", "when": f"{locks[i % len(locks)].id}: {'unlock' if i % 2 else 'lock'}", "then": [f"{lights[i % len(lights)].id}: on"]}
+        if i % 4 == 0:
+            rule.update(after="22:00", before="06:00")
+        engine.add(rule)
+
+    events = rate * seconds
+    started = time.perf_counter()
+    for i in range(events):
+        # Pace the producer at the offered rate
+        delay = started + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        engine.notify(locks[i % len(locks)].id, "locked", bool(i % 3), "user")
+    offered = time.perf_counter() - started
+    engine.wait_idle()
+    drained = time.perf_counter() - started
+
+    burst = time.perf_counter()
+    for i in range(events):
+        engine.notify(locks[i % len(locks)].id, "locked", bool(i % 3), "user")
+    engine.wait_idle()
+    burst = time.perf_counter() - burst
+    return {
+        "rules": rule_count,
+        "offered_per_s": events / offered,
+        "backlog_ms": (drained - offered) * 1000,
+        "max_per_s": events / burst,
+        "rules_checked_per_event": engine.stats["evaluated"] / engine.stats["events"],
+        "fired": engine.stats["fired"],
+    }
+
+
+def bench_costs(device_count, days):
+    """Price `days` of hourly history for `device_count` devices and simulate two savings tips"""
+    store = EnergyStore(tempfile.mkdtemp(prefix="smartnest-costs-"))
+    now = time.time()
+    store.origin = int(now - days * 86400) // 3600 * 3600
+    series = [f"device_{i}" for i in range(device_count)]
+    for name in series:
+        store._row(name)
+    # Write the hourly rollup chunks directly; recording samples would take far longer than pricing them
+    width = store.LEVELS["hour"][1]
+    hours = days * 24
+    history = np.random.default_rng(0).random((len(store.rows), -(-hours // width) * width)) * 100
+    for number in range(history.shape[1] // width):
+        history[:, number * width:(number + 1) * width].astype("<f8").tofile(os.path.join(store.root, "hour", f"{number}.wh"))
+
+    costs = CostEngine(store)
+    what_ifs = [
+        (np.full(device_count, 0.5), week_hours((9, 17), "weekdays")),
+        (np.ones(device_count), week_hours((22, 6))),
+    ]
+    started = time.perf_counter()
+    costs.cost(series, store.origin, now)
+    priced = time.perf_counter()
+    costs.savings(series, store.origin, now, what_ifs)
+    simulated = time.perf_counter()
+    store.close()
+    return {"devices": device_count, "days": days, "cost_ms": (priced - started) * 1000, "savings_ms": (simulated - priced) * 1000}
+
+
+def bench_fanout(client_count, slow_count, rate, seconds, slow_delay=0.1):
+    """Sessions sharing one home: time from a change to the page update each client receives"""
+    devices, scenes = synthetic_home(64)
+    home = Home(devices, scenes, rules=[], schedules=[])
+    clients = []
+    for i in range(client_count):
+        conn = RecordingConnection(delay=slow_delay if i < slow_count else 0.0)
+        app = SmartHomeApp(Page(conn, f"client-{i}", asyncio.new_event_loop()), home=home)
+        app.updates.flush()
+        clients.append((app, conn))
+    driver = clients[-1][0]
+    lights = [device.id for device in home.devices.find(kind="light")[:8]]
+
+    changes = []
+    started = time.perf_counter()
+    for i in range(rate * seconds):
+        delay = started + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        device = home.devices[lights[i % len(lights)]]
+        changes.append(time.perf_counter())
+        driver.update_device(device.id, "status", "OFF" if device.status == "ON" else "ON")
+    time.sleep(slow_delay * 3)
+    for app, _ in clients:
+        app.subscription.wait_idle(5)
+        app.updates.flush()
+
+    def latencies(conns):
+        # Each change reaches a client with the first page update sent after it
+        result = []
+        for conn in conns:
+            sends = sorted(conn.sent_at)
+            for changed in changes:
+                i = bisect.bisect_left(sends, changed)
+                if i < len(sends):
+                    result.append(sends[i] - changed)
+        return sorted(result)
+
+    def percentiles(values):
+        return {"p50_ms": values[len(values) // 2] * 1000, "p99_ms": values[int(len(values) * 0.99)] * 1000} if values else {}
+
+    fast = [conn for app, conn in clients[slow_count:]]
+    slow = [conn for app, conn in clients[:slow_count]]
+    sends = lambda conns: statistics.mean(len(conn.sent_at) for conn in conns) if conns else 0
+    return {
+        "clients": client_count,
+        "slow_clients": slow_count,
+        "changes": len(changes),
+        "fast": dict(percentiles(latencies(fast)), sends=sends(fast)),
+        "slow": dict(percentiles(latencies(slow)), sends=sends(slow)),
+        "deferred_sends": sum(app.updates.stats["deferred"] for app, _ in clients),
+        "conflated_changes": sum(app.subscription.stats["conflated"] for app, _ in clients),
+    }
+
+
+def bench_navigation(size, clicks):
+    """A session moving between views while state changes in the background.
+
+    Reports view cache hits and builds, and per click the page updates
+    requested (each one a send without the UpdateScheduler) against those
+    the scheduler actually flushed.
+    """
+    devices, scenes = synthetic_home(size)
+    conn = RecordingConnection()
+    app = SmartHomeApp(Page(conn, "bench", asyncio.new_event_loop()), devices=devices, scenes=scenes, rules=[], schedules=[])
+    home = app.home
+    light = app.devices.find(kind="light")[0]
+    thermostat = app.devices.find(kind="thermostat")[0]
+    views = [
+        app.show_dashboard,
+        app.show_statistics,
+        app.show_profile,
+        app.show_scenes,
+        app.show_rooms,
+        app.show_automations,
+        lambda: app.show_thermostat_details(thermostat.id),
+        lambda: app.show_light_details(light.id, light.name),
+    ]
+    app.updates.flush()
+    before = dict(app.updates.stats)
+    # Energy samples and thermal forecasts arrive between clicks, a device changes every third one
+    for click in range(clicks):
+        views[click * 5 % len(views)]()
+        home.publish("energy", "thermal")
+        if click % 3 == 0:
+            app.update_device(light.id, "brightness", click % 100)
+        app.subscription.wait_idle(5)
+        app.updates.flush()
+
+    report = app.view_cache_report()
+    builds = sum(view["builds"] for view in report.values())
+    hits = sum(view["hits"] for view in report.values())
+    per_click = {stat: (app.updates.stats[stat] - before[stat]) / clicks for stat in before}
+    return {
+        "devices": size,
+        "clicks": clicks,
+        "hit_rate": hits / (builds + hits),
+        "builds": builds,
+        "views": report,
+        "requested_per_click": per_click["requested"],
+        "coalesced_per_click": per_click["coalesced"],
+        "updates_per_click": per_click["flushed"],
+    }
+
+
+def bench_polling(device_count):
+    """Command then poll `device_count` simulated devices split between the MQTT and HTTP drivers"""
+    kinds = list(DEVICE_PROTOCOLS)
+    io = DeviceIO(route=lambda device_id: DEVICE_PROTOCOLS[kinds[int(device_id.split("_")[1]) % len(kinds)]])
+    device_ids = [f"device_{i}" for i in range(device_count)]
+    started = time.perf_counter()
+    commands = [io.submit(device_id, "status", "ON") for device_id in device_ids]
+    wait(commands)
+    commanded = time.perf_counter()
+    sent = {name: driver.stats["requests"] for name, driver in io.drivers.items()}
+    reports = io.poll(device_ids).result()
+    polled = time.perf_counter()
+    return {
+        "devices": device_count,
+        "command_ms": (commanded - started) * 1000,
+        "commands_failed": io.stats["failed"],
+        "poll_ms": (polled - commanded) * 1000,
+        "polled": len(reports),
+        "poll_requests": {name: driver.stats["requests"] - sent[name] for name, driver in io.drivers.items()},
+        "connections": {name: driver.stats["connections"] for name, driver in io.drivers.items()},
+    }
+
+
+def bench_thermal(zone_count):
+    """Forecast `zone_count` thermostat zones over the full horizon, with a preheating schedule for every other zone"""
+    model = ThermalModel()
+    now = time.time()
+    modes = ["heat", "cool", "auto"]
+    zones = [Thermostat(f"zone_{i}", f"Zone {i}", f"Room {i}", "Idle", current=18 + i % 5, target=20 + i % 3, mode=modes[i % 3]) for i in range(zone_count)]
+    schedules = [
+        SimpleNamespace(id=f"zone_{i}-morning", device_id=f"zone_{i}", action=SimpleNamespace(field="target", value=23), due=now + 6 * 3600)
+        for i in range(0, zone_count, 2)
+    ]
+    started = time.perf_counter()
+    forecast = model.forecast(zones, schedules, now)
+    elapsed = time.perf_counter() - started
+    return {
+        "zones": zone_count,
+        "steps": model.steps,
+        "forecast_ms": elapsed * 1000,
+        "reaching": int((forecast["reaches"] >= 0).sum()),
+        "preheats": len(forecast["preheat"]),
+    }
+
+
+def bench_bus(listener_count, change_count):
+    """Publish changes on a bus with `listener_count` listeners, each on its own (device, field) pair"""
+    bus = ChangeBus()
+    fields = ("status", "brightness", "speed", "current")
+    for i in range(listener_count):
+        bus.subscribe(lambda change: None, f"device_{i // len(fields)}", fields[i % len(fields)])
+    changes = [DeviceChange(f"device_{i % (listener_count // len(fields))}", "status", "OFF", "ON", "user", 0.0) for i in range(change_count)]
+    started = time.perf_counter()
+    for change in changes:
+        bus.publish(change)
+    elapsed = time.perf_counter() - started
+    return {
+        "listeners": listener_count,
+        "changes": change_count,
+        "publish_us": elapsed / change_count * 1e6,
+        "delivered_per_change": bus.stats["delivered"] / change_count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="device counts to benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per scenario")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--rules", type=int, default=10000, help="automation rules for the rule engine run")
+    parser.add_argument("--rate", type=int, default=1000, help="state changes per second offered to the rules")
+    parser.add_argument("--clients", type=int, default=50, help="sessions sharing one home in the fan-out run")
+    args = parser.parse_args()
+
+    report = {size: bench_home(size, args.repeat) for size in args.sizes}
+    startup = [bench_startup(size) for size in args.sizes]
+    cards = bench_cards(400)
+    rules = bench_rules(args.rules, args.rate, seconds=2)
+    costs = bench_costs(1000, 365)
+    fanout = bench_fanout(args.clients, slow_count=max(args.clients // 10, 1), rate=100, seconds=2)
+    navigation = bench_navigation(100, 200)
+    polling = bench_polling(1000)
+    thermal = bench_thermal(500)
+    bus = bench_bus(10000, 100000)
+    if args.json:
+        print(json.dumps({
+            "views": {size: dict(results) for size, results in report.items()},
+            "startup": startup,
+            "cards": cards,
+            "rules": rules,
+            "costs": costs,
+            "fanout": fanout,
+            "navigation": navigation,
+            "polling": polling,
+            "thermal": thermal,
+            "bus": bus,
+        }, indent=2))
+        return
+
+    print(f"{'devices':>8}  {'scenario':<20}{'ms':>10}{'controls':>10}{'peak KB':>10}{'update KB':>11}")
+    for size, results in report.items():
+        for name, r in results:
+            print(f"{size:>8}  {name:<20}{r['ms']:>10.2f}{r['controls']:>10}{r['peak_kb']:>10.0f}{r['update_kb']:>11.1f}")
+
+    print()
+    print(f"{'card':<20}{'built us':>10}{'blocks':>10}{'copied us':>11}{'blocks':>10}")
+    for name, r in cards.items():
+        built, copied = r["built"], r["template"]
+        print(f"{name:<20}{built['us']:>10.1f}{built['blocks']:>10.0f}{copied['us']:>11.1f}{copied['blocks']:>10.0f}")
+    print()
+    for r in startup:
+        print(
+            f"startup, {r['devices']} devices: first paint {r['first paint_ms']:.0f} ms ({r['shell_kb']:.1f} KB), "
+            f"state load {r['state load_ms']:.0f} ms, interactive {r['interactive_ms']:.0f} ms "
+            f"({r['total_kb']:.0f} KB in {r['sends']} sends)"
+        )
+    print(
+        f"{rules['rules']} rules at {rules['offered_per_s']:.0f} changes/s: backlog {rules['backlog_ms']:.1f} ms after the last change, "
+        f"{rules['max_per_s']:.0f} changes/s max, {rules['rules_checked_per_event']:.1f} rules checked per change, {rules['fired']} fired"
+    )
+    print(
+        f"{costs['days']} days x {costs['devices']} devices: cost {costs['cost_ms']:.0f} ms, "
+        f"savings simulation {costs['savings_ms']:.0f} ms"
+    )
+    for kind in ("fast", "slow"):
+        r = fanout[kind]
+        print(
+            f"{fanout['changes']} changes to {fanout['clients']} clients, {kind} clients: "
+            f"p50 {r.get('p50_ms', 0):.1f} ms, p99 {r.get('p99_ms', 0):.1f} ms, {r['sends']:.0f} page updates each"
+        )
+    print(f"deferred sends {fanout['deferred_sends']}, conflated changes {fanout['conflated_changes']}")
+    print(
+        f"{navigation['clicks']} navigation clicks, {navigation['devices']} devices: view cache hit rate "
+        f"{navigation['hit_rate']:.0%}, {navigation['builds']} builds"
+    )
+    for name, r in navigation["views"].items():
+        print(f"  {name:<20}{r['builds']:>6} builds{r['hits']:>6} hits{r['avg_build_ms']:>10.2f} ms per build")
+    print(
+        f"  page updates per click: {navigation['requested_per_click']:.1f} requested, "
+        f"{navigation['coalesced_per_click']:.1f} coalesced, {navigation['updates_per_click']:.1f} sent"
+    )
+    print(
+        f"{polling['devices']} devices: commands {polling['command_ms']:.0f} ms ({polling['commands_failed']} failed), "
+        f"poll {polling['poll_ms']:.0f} ms in {sum(polling['poll_requests'].values())} requests, "
+        f"connections {polling['connections']}"
+    )
+    print(
+        f"{thermal['zones']} thermostat zones x {thermal['steps']} steps: forecast {thermal['forecast_ms']:.0f} ms, "
+        f"{thermal['reaching']} reach their target, {thermal['preheats']} preheats"
+    )
+    print(
+        f"change bus with {bus['listeners']} listeners: {bus['publish_us']:.2f} us per change, "
+        f"{bus['delivered_per_change']:.0f} listener called per change"
+    )
+
+
+if __name__ == "__main__":
+    main()
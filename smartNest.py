@@ -1,37 +1,3316 @@
+import time
+# Start of the startup timeline; taken before the heavier imports below
+PROCESS_STARTED = time.perf_counter()
+
+import abc
+import asyncio
+import atexit
+import dataclasses
+import enum
 import flet as ft
-from datetime import datetime
+import heapq
+import itertools
+import json
+import logging
+import marshal
+import math
+import mmap
+import numpy as np
+import os
+import queue
+import random
+import re
+import struct
+import threading
+import zlib
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from datetime import date, datetime, time as day_time, timedelta, timezone
+from flet.core.event_handler import EventHandler
+from flet.core.protocol import CommandEncoder
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Flet release line whose control internals ControlTemplate copies were verified against;
+# on any other release cards are built from scratch
+FLET_VERIFIED = "0.25."
+# Seconds a slider must rest before its value is committed to the device
+SLIDER_QUIET_PERIOD = 0.25
+# Minimum seconds between local label refreshes while dragging
+SLIDER_FRAME_INTERVAL = 1 / 30
+# Page updates requested within one frame are sent together
+UPDATE_FRAME_INTERVAL = 1 / 60
+# Seconds a scene may take before its unfinished actions are reported as timed out
+SCENE_TIMEOUT = 5.0
+# Longest chain of rules firing rules; changes caused deeper than this are not evaluated
+RULE_CHAIN_DEPTH = 3
+# Device command timeout per attempt (seconds), retries after the first attempt and base backoff
+DEVICE_IO_TIMEOUT = 2.0
+DEVICE_IO_RETRIES = 2
+DEVICE_IO_BACKOFF = 0.1
+# Commands in flight per device, and pipelined connections pooled per HTTP device host
+DEVICE_IO_PER_DEVICE = 1
+DEVICE_IO_POOL_SIZE = 4
+# Devices per bulk state read, and seconds between polls of every device
+DEVICE_BULK_SIZE = 250
+DEVICE_POLL_INTERVAL = 60
+# Driver (see DeviceIO) each kind of device is reached through
+DEVICE_PROTOCOLS = {"light": "mqtt", "fan": "mqtt", "lock": "http", "thermostat": "http"}
+# Round-trip range (seconds) and dropped-connection rate of the simulated devices
+SIMULATED_LATENCY = (0.02, 0.08)
+SIMULATED_DROP_RATE = 0.02
+# Record handler/view/update histograms from the start, and the port of the local metrics endpoint
+INSTRUMENT = os.environ.get("SMARTNEST_INSTRUMENT") == "1"
+METRICS_PORT = int(os.environ.get("SMARTNEST_METRICS_PORT", 9464))
+# Where persistent data (energy history, logs, state) is kept
+DATA_DIR = os.environ.get("SMARTNEST_DATA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "smartnest_data"))
+# Seconds between power samples of every device
+ENERGY_SAMPLE_INTERVAL = 10
+# Electricity price in $ per kWh outside the time-of-use periods below
+ENERGY_PRICE = 0.12
+# Time-of-use periods: local hours [start, end), days (see Schedule.DAYS) and $ per kWh
+ENERGY_TARIFF = [
+    {"hours": (16, 21), "days": "weekdays", "price": 0.24},
+    {"hours": (0, 7), "days": "everyday", "price": 0.08},
+]
+# Past rollup chunks kept mapped for reads (least recently used are closed first)
+ENERGY_READ_CHUNKS = 8
+# Usage History ranges (days) and how many chart columns a series is reduced to
+USAGE_RANGES = {"Last 7 Days": 7, "Last 30 Days": 30, "Last 3 Months": 90}
+USAGE_CHART_COLUMNS = 300
+# Assumptions behind the savings tips: when the home is empty, when it sleeps,
+# and the share of heating energy saved per degree the thermostat is lowered
+AWAY_HOURS = {"hours": (9, 17), "days": "weekdays"}
+NIGHT_HOURS = {"hours": (22, 6), "days": "everyday"}
+HEATING_SAVING_PER_DEGREE = 0.1
+# Seconds between fsyncs of the state log (the most a crash can lose)
+STATE_FSYNC_INTERVAL = 0.2
+# Log size in bytes after which it is folded into a new snapshot
+STATE_COMPACT_BYTES = 1 << 20
+# Home location, used for sunrise/sunset schedules
+HOME_LATITUDE = 40.71
+HOME_LONGITUDE = -74.01
+# Schedules missed while the app was down are still run if they are at most this many seconds late
+SCHEDULE_CATCHUP = 3600
+# Thermal model step (seconds) and how far ahead thermostats are forecast
+THERMAL_STEP = 60
+THERMAL_HORIZON = 24 * 3600
+# Zone heat loss to outdoors (1/h), full-power heating and cooling rates (°C/h) and thermostat deadband (°C)
+THERMAL_LOSS = 0.08
+THERMAL_HEAT_RATE = 2.5
+THERMAL_COOL_RATE = 2.0
+THERMAL_DEADBAND = 0.3
+# Outdoor temperature assumed by the thermal model: daily mean (°C), swing either side and coldest hour
+OUTDOOR_MEAN = 8.0
+OUTDOOR_SWING = 4.0
+OUTDOOR_COLDEST_HOUR = 5
+# Device cards or rows shown per page, and built dashboard cards kept for reuse
+DEVICE_PAGE_SIZE = 24
+DEVICE_CARD_CACHE = 96
+# Built views (pages and device detail views) kept per session; least recently shown are dropped first
+VIEW_CACHE_SIZE = 16
+# Above this many rooms the room filter is a search field instead of a dropdown
+ROOM_DROPDOWN_LIMIT = 50
+# Number of recent actions kept in memory for the Action Log panel
+ACTION_LOG_SIZE = 100
+# Watts drawn per device kind, see device_power()
+POWER_RATINGS = {"light": 60, "lock": 5, "thermostat_idle": 3, "thermostat_active": 1200, "fan_step": 20}
+
+
+class Device:
+    """Base device record, kept compact with __slots__"""
+    __slots__ = ("id", "name", "room", "status")
+    kind = "device"
+    
+    def __init__(self, device_id, name, room, status="OFF"):
+        self.id = device_id
+        self.name = name
+        self.room = room
+        self.status = status
+    
+    @classmethod
+    def fields(cls):
+        return Device.__slots__ + (cls.__slots__ if cls is not Device else ())
+    
+    def to_record(self):
+        """Plain tuple form used by the state snapshot"""
+        return (self.kind,) + tuple(getattr(self, field) for field in self.fields())
+    
+    @staticmethod
+    def from_record(record):
+        cls = DEVICE_KINDS[record[0]]
+        device = cls.__new__(cls)
+        for field, value in zip(cls.fields(), record[1:]):
+            setattr(device, field, value)
+        return device
+
+
+class Light(Device):
+    __slots__ = ("brightness", "color_temp")
+    kind = "light"
+    
+    def __init__(self, device_id, name, room, status="OFF", brightness=100, color_temp=4000):
+        super().__init__(device_id, name, room, status)
+        self.brightness = brightness
+        self.color_temp = color_temp
+
+
+class Lock(Device):
+    __slots__ = ("locked",)
+    kind = "lock"
+    
+    def __init__(self, device_id, name, room, status="OFF", locked=True):
+        super().__init__(device_id, name, room, status)
+        self.locked = locked
+
+
+class Thermostat(Device):
+    __slots__ = ("current", "target", "mode", "fan")
+    kind = "thermostat"
+    
+    def __init__(self, device_id, name, room, status="Idle", current=21, target=21, mode="auto", fan="auto"):
+        super().__init__(device_id, name, room, status)
+        self.current = current
+        self.target = target
+        self.mode = mode
+        self.fan = fan
+
+
+class Fan(Device):
+    __slots__ = ("speed",)
+    kind = "fan"
+    
+    def __init__(self, device_id, name, room, status="OFF", speed=0):
+        super().__init__(device_id, name, room, status)
+        self.speed = speed
+
+
+DEVICE_KINDS = {cls.kind: cls for cls in (Light, Lock, Thermostat, Fan)}
+
+
+class DeviceChange:
+    """One write to a device field, as published on a ChangeBus"""
+    __slots__ = ("device_id", "field", "old", "value", "source", "when")
+    
+    def __init__(self, device_id, field, old, value, source, when):
+        self.device_id = device_id
+        self.field = field
+        self.old = old
+        self.value = value
+        self.source = source
+        self.when = when
+
+
+class ChangeBus:
+    """In-process notifications of device field writes.
+    
+    Listeners subscribe to one (device, field) pair, or leave either side
+    None to match any device or any field. They are kept in a dict by that
+    pair, so publishing a change looks up four keys and calls only the
+    listeners that match, however many others there are. Listener lists are
+    replaced rather than mutated, so publishing needs no lock. Listeners run
+    on the writing thread, in the order exact pair, device, field, all.
+    """
+    
+    def __init__(self):
+        self.listeners = {}
+        self.lock = threading.Lock()
+        self.stats = {"published": 0, "delivered": 0}
+    
+    def subscribe(self, listener, device_id=None, field=None):
+        """Call `listener(change)` for matching changes; returns a token for unsubscribe"""
+        key = (device_id, field)
+        with self.lock:
+            self.listeners[key] = self.listeners.get(key, ()) + (listener,)
+        return key, listener
+    
+    def unsubscribe(self, token):
+        key, listener = token
+        with self.lock:
+            listeners = tuple(l for l in self.listeners.get(key, ()) if l is not listener)
+            if listeners:
+                self.listeners[key] = listeners
+            else:
+                self.listeners.pop(key, None)
+    
+    def publish(self, change):
+        self.stats["published"] += 1
+        listeners = self.listeners
+        for key in ((change.device_id, change.field), (change.device_id, None), (None, change.field), (None, None)):
+            for listener in listeners.get(key, ()):
+                self.stats["delivered"] += 1
+                try:
+                    listener(change)
+                except Exception:
+                    logger.exception("Change listener failed for %s.%s", change.device_id, change.field)
+
+
+class DeviceRegistry:
+    """Devices by id with secondary indexes by type, room and status.
+    
+    Index buckets are dicts used as insertion-ordered sets, so views keep
+    a stable device order. Fields must be written through set() so the
+    indexes stay current and `bus` listeners see every change.
+    """
+    INDEXED = ("kind", "room", "status")
+    
+    def __init__(self, devices=(), bus=None):
+        self.by_id = {}
+        self.indexes = {field: {} for field in self.INDEXED}
+        self.lock = threading.RLock()
+        self.bus = ChangeBus() if bus is None else bus
+        for device in devices:
+            self.add(device)
+    
+    def __getitem__(self, device_id):
+        return self.by_id[device_id]
+    
+    def __contains__(self, device_id):
+        return device_id in self.by_id
+    
+    def __iter__(self):
+        return iter(self.by_id.values())
+    
+    def __len__(self):
+        return len(self.by_id)
+    
+    def add(self, device):
+        with self.lock:
+            self.by_id[device.id] = device
+            for field, index in self.indexes.items():
+                index.setdefault(getattr(device, field), {})[device.id] = None
+    
+    def remove(self, device_id):
+        with self.lock:
+            device = self.by_id.pop(device_id)
+            for field, index in self.indexes.items():
+                self._unindex(index, getattr(device, field), device_id)
+        return device
+    
+    def set(self, device_id, field, value, source="user"):
+        """Write a device field, keeping indexes in sync, and publish the change. Returns the old value."""
+        with self.lock:
+            device = self.by_id[device_id]
+            old = getattr(device, field)
+            if old == value:
+                return old
+            setattr(device, field, value)
+            index = self.indexes.get(field)
+            if index is not None:
+                self._unindex(index, old, device_id)
+                index.setdefault(value, {})[device_id] = None
+            # Under the lock, so listeners see writes to a field in the order they happened
+            self.bus.publish(DeviceChange(device_id, field, old, value, source, time.time()))
+        return old
+    
+    def _unindex(self, index, value, device_id):
+        bucket = index[value]
+        del bucket[device_id]
+        if not bucket:
+            del index[value]
+    
+    def find(self, kind=None, room=None, status=None):
+        """Devices matching every given field, e.g. find(kind="light", status="ON")"""
+        buckets = [self.indexes[field].get(value, {}) for field, value in self._filters(kind, room, status)]
+        if not buckets:
+            return list(self.by_id.values())
+        buckets.sort(key=len)
+        smallest, rest = buckets[0], buckets[1:]
+        return [self.by_id[i] for i in smallest if all(i in b for b in rest)]
+    
+    def count(self, kind=None, room=None, status=None):
+        """Same as len(find(...)) but O(1) when filtering on a single field"""
+        filters = self._filters(kind, room, status)
+        if len(filters) == 1:
+            field, value = filters[0]
+            return len(self.indexes[field].get(value, ()))
+        return len(self.find(kind, room, status))
+    
+    def _filters(self, kind, room, status):
+        return [(f, v) for f, v in (("kind", kind), ("room", room), ("status", status)) if v is not None]
+
+class UpdateScheduler:
+    """Batches page updates so at most one is sent per frame.
+    
+    request(*controls) marks controls dirty, request() with no controls
+    marks the whole page. The first request of a frame arms a timer; all
+    requests made until it fires go out in a single page.update(). While
+    a send is still in flight (a slow client) nothing new is sent; dirty
+    controls accumulate and go out together once it completes.
+    
+    `stats` counts requests, requests coalesced into an armed frame, page
+    updates flushed and flushes deferred behind a send; with `metrics` set
+    they are also counted there as updates.<stat>.
+    """
+    
+    def __init__(self, page, interval=UPDATE_FRAME_INTERVAL, metrics=None):
+        self.page = page
+        self.interval = interval
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.dirty = {}
+        self.full = False
+        self.timer = None
+        self.sending = False
+        self.stats = {"requested": 0, "coalesced": 0, "flushed": 0, "deferred": 0}
+    
+    def _count(self, stat):
+        self.stats[stat] += 1
+        if self.metrics is not None:
+            self.metrics.add(f"updates.{stat}")
+    
+    def request(self, *controls):
+        with self.lock:
+            self._count("requested")
+            if controls:
+                for control in controls:
+                    self.dirty[id(control)] = control
+            else:
+                self.full = True
+            if self.timer is None and not self.sending:
+                self._arm()
+            else:
+                self._count("coalesced")
+    
+    def _arm(self):
+        self.timer = threading.Timer(self.interval, self.flush)
+        self.timer.daemon = True
+        self.timer.start()
+    
+    def flush(self):
+        """Send everything requested so far right away"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if self.sending:
+                # The send in flight re-arms the timer when it is done
+                self._count("deferred")
+                return
+            full, dirty = self.full, list(self.dirty.values())
+            self.full = False
+            self.dirty.clear()
+            self.sending = True
+        
+        try:
+            if full:
+                self.page.update()
+                self._count("flushed")
+            else:
+                # Controls may have been detached since they were requested
+                dirty = [control for control in dirty if control.page]
+                if dirty:
+                    self.page.update(*dirty)
+                    self._count("flushed")
+        finally:
+            with self.lock:
+                self.sending = False
+                if (self.full or self.dirty) and self.timer is None:
+                    self._arm()
+
+
+class SliderCoalescer:
+    """Collapses a slider drag into a single committed value.
+    
+    Every tick refreshes the label through `preview` (throttled to the frame
+    interval), but only the last value reaches `commit`, either after the
+    quiet period or when the drag ends. Ticks only move a deadline; a single
+    timer per drag checks it and sleeps again until the slider has rested.
+    Ticks, commits and superseded (dropped) values are counted as
+    slider.ticks, slider.committed and slider.dropped in `metrics`.
+    """
+    
+    def __init__(self, preview, commit, metrics, quiet=SLIDER_QUIET_PERIOD, frame=SLIDER_FRAME_INTERVAL):
+        self.preview = preview
+        self.commit = commit
+        self.metrics = metrics
+        self.quiet = quiet
+        self.frame = frame
+        self.pending = None
+        self.deadline = 0.0
+        self.timer = None
+        self.last_preview = 0.0
+        self.lock = threading.Lock()
+    
+    def on_change(self, e):
+        value = int(e.control.value)
+        with self.lock:
+            self.metrics.add("slider.ticks")
+            if self.pending is not None:
+                self.metrics.add("slider.dropped")
+            self.pending = value
+            self.deadline = time.monotonic() + self.quiet
+            if self.timer is None:
+                self._arm(self.quiet)
+        
+        now = time.monotonic()
+        if now - self.last_preview >= self.frame:
+            self.last_preview = now
+            self.preview(value)
+    
+    def on_change_end(self, e):
+        self.flush()
+    
+    def _arm(self, delay):
+        self.timer = threading.Timer(delay, self._expire)
+        self.timer.daemon = True
+        self.timer.start()
+    
+    def _expire(self):
+        with self.lock:
+            if self.timer is not threading.current_thread():
+                return
+            remaining = self.deadline - time.monotonic()
+            if remaining > 0:
+                # Moved since the timer was set; wait out the rest of the quiet period
+                self._arm(remaining)
+                return
+            self.timer = None
+        self.flush()
+    
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            value, self.pending = self.pending, None
+            if value is not None:
+                self.metrics.add("slider.committed")
+        if value is not None:
+            self.preview(value)
+            self.commit(value)
+
+
+class SceneAction:
+    __slots__ = ("text", "device_id", "field", "value")
+    
+    def __init__(self, text, device_id, field, value):
+        self.text = text
+        self.device_id = device_id
+        self.field = field
+        self.value = value
+
+
+class SceneEngine:
+    """Parses scene definitions once and runs their actions concurrently.
+    
+    Definitions are strings like "light1: off", "door1: lock" or
+    "thermostat: set (21)". `apply(device_id, field, value, source)`
+    starts a single action and returns a Future for its device command;
+    all actions of a scene are started at once, so a scene takes about one
+    device round trip however many devices it touches. Nothing blocks on
+    them: activate() returns a Future of the scene's results.
+    """
+    COMMANDS = {
+        "on": ("status", "ON"),
+        "off": ("status", "OFF"),
+        "lock": ("locked", True),
+        "unlock": ("locked", False),
+    }
+    # Field written by "set (n)" for each device kind
+    SET_FIELDS = {"light": "brightness", "thermostat": "target", "fan": "speed"}
+    PATTERN = re.compile(r"^\s*([\w-]+)\s*:\s*(\w+)\s*(?:\(\s*(-?\d+)\s*\))?\s*$")
+    
+    def __init__(self, devices, apply, aliases=None, timeout=SCENE_TIMEOUT):
+        self.devices = devices
+        self.apply = apply
+        self.aliases = aliases or {}
+        self.timeout = timeout
+        self.scenes = {}
+    
+    def load(self, scenes):
+        for scene in scenes:
+            self.scenes[scene["name"]] = [self.parse(text) for text in scene["devices"]]
+    
+    def parse(self, text):
+        match = self.PATTERN.match(text)
+        if not match:
+            raise ValueError(f"Cannot parse scene action {text!r}")
+        name, command, arg = match.groups()
+        device_id = self.aliases.get(name, name)
+        if device_id not in self.devices:
+            raise ValueError(f"Unknown device {name!r} in scene action {text!r}")
+        
+        command = command.lower()
+        if command == "set" and arg is not None:
+            field = self.SET_FIELDS.get(self.devices[device_id].kind)
+            if field is None:
+                raise ValueError(f"{device_id} has no settable value in {text!r}")
+            return SceneAction(text, device_id, field, int(arg))
+        if command in self.COMMANDS:
+            field, value = self.COMMANDS[command]
+            return SceneAction(text, device_id, field, value)
+        raise ValueError(f"Unknown command {command!r} in scene action {text!r}")
+    
+    def activate(self, name):
+        """Start every action of a scene and return a Future of its per-action results and overall latency.
+        
+        The Future resolves once every action has finished, or after
+        `timeout` with the unfinished actions cancelled and reported as
+        timed out.
+        """
+        started = time.perf_counter()
+        scene = Future()
+        finished = {}
+        futures = []
+        lock = threading.Lock()
+        
+        def complete():
+            with lock:
+                if scene.done():
+                    return
+                timer.cancel()
+                results = []
+                for future, action in futures:
+                    if action in finished:
+                        if future.cancelled():
+                            error = "cancelled"
+                        else:
+                            error = None if future.exception() is None else str(future.exception())
+                        latency = finished[action] - started
+                    else:
+                        error, latency = "timeout", self.timeout
+                    results.append({"action": action.text, "ok": error is None, "error": error, "latency": latency})
+                scene.set_result({
+                    "scene": name,
+                    "ok": all(r["ok"] for r in results),
+                    "results": results,
+                    "latency": time.perf_counter() - started,
+                })
+            for future, action in futures:
+                if action not in finished:
+                    future.cancel()
+        
+        def action_done(future, action):
+            with lock:
+                if scene.done():
+                    return
+                finished[action] = time.perf_counter()
+                if len(finished) < len(futures):
+                    return
+            complete()
+        
+        timer = threading.Timer(self.timeout, complete)
+        timer.daemon = True
+        actions = self.scenes[name]
+        for action in actions:
+            futures.append((self.apply(action.device_id, action.field, action.value, f"scene: {name}"), action))
+        timer.start()
+        for future, action in futures:
+            future.add_done_callback(lambda f, action=action: action_done(f, action))
+        if not futures:
+            complete()
+        return scene
+
+
+class Rule:
+    __slots__ = ("name", "definition", "trigger", "after", "before", "actions", "enabled", "fired", "last_fired")
+    
+    def __init__(self, name, definition, trigger, after, before, actions, enabled=True):
+        self.name = name
+        self.definition = definition
+        self.trigger = trigger
+        self.after = after
+        self.before = before
+        self.actions = actions
+        self.enabled = enabled
+        self.fired = 0
+        self.last_fired = None
+    
+    def in_window(self, minute):
+        """Whether a minute of the day falls in the rule's after/before window"""
+        if self.after is None and self.before is None:
+            return True
+        after = 0 if self.after is None else self.after
+        before = 24 * 60 if self.before is None else self.before
+        if after <= before:
+            return after <= minute < before
+        # Window wraps past midnight, e.g. after 22:00 before 06:00
+        return minute >= after or minute < before
+
+
+class RuleEngine:
+    """Runs automation rules when device state changes.
+    
+    A rule is {"name", "when", "then", "after"?, "before"?}, where "when" and
+    each "then" entry use the scene action syntax, e.g. "door1: unlock" fires
+    when the lock's `locked` field becomes False. Rules are indexed by the
+    (device, field) of their trigger, so a change only looks at the rules it
+    can fire; given a `bus`, the engine listens for exactly those pairs.
+    Changes are queued by `notify` and evaluated on a worker thread.
+    Reverts of failed commands are ignored, a rule never fires on its own
+    writes, and changes caused by rules may fire other rules only up to
+    `max_depth` rules deep, so rules cannot loop.
+    """
+    TIME = re.compile(r"^(\d{1,2}):(\d{2})$")
+    # Sources whose changes never fire rules
+    IGNORED_SOURCES = ("revert",)
+    
+    def __init__(self, parse, apply, on_fire=None, bus=None, max_depth=RULE_CHAIN_DEPTH):
+        self.parse = parse
+        self.apply = apply
+        self.on_fire = on_fire
+        self.bus = bus
+        self.rules = {}
+        self.index = {}
+        # (device, field) -> bus subscription
+        self.listening = {}
+        self.max_depth = max_depth
+        # How many rules deep the actions being applied on the worker thread are
+        self.chain = threading.local()
+        self.events = queue.Queue()
+        self.stats = {"events": 0, "evaluated": 0, "fired": 0, "ignored": 0}
+        threading.Thread(target=self._run, daemon=True).start()
+    
+    def load(self, rules):
+        for rule in rules:
+            self.add(rule)
+    
+    def add(self, definition):
+        trigger = self.parse(definition["when"])
+        rule = Rule(
+            definition["name"],
+            definition,
+            trigger,
+            self.parse_time(definition.get("after")),
+            self.parse_time(definition.get("before")),
+            [self.parse(text) for text in definition["then"]],
+            definition.get("enabled", True),
+        )
+        if rule.name in self.rules:
+            self.remove(rule.name)
+        self.rules[rule.name] = rule
+        self.index.setdefault((trigger.device_id, trigger.field), []).append(rule)
+        if self.bus is not None and (trigger.device_id, trigger.field) not in self.listening:
+            self.listening[(trigger.device_id, trigger.field)] = self.bus.subscribe(self.on_change, trigger.device_id, trigger.field)
+        return rule
+    
+    def remove(self, name):
+        rule = self.rules.pop(name)
+        bucket = self.index[(rule.trigger.device_id, rule.trigger.field)]
+        bucket.remove(rule)
+        if not bucket:
+            del self.index[(rule.trigger.device_id, rule.trigger.field)]
+            token = self.listening.pop((rule.trigger.device_id, rule.trigger.field), None)
+            if token is not None:
+                self.bus.unsubscribe(token)
+    
+    def on_change(self, change):
+        self.notify(change.device_id, change.field, change.value, change.source, change.when)
+    
+    def parse_time(self, text):
+        if text is None:
+            return None
+        match = self.TIME.match(text.strip())
+        if not match or int(match.group(1)) > 23 or int(match.group(2)) > 59:
+            raise ValueError(f"Cannot parse rule time {text!r}")
+        return int(match.group(1)) * 60 + int(match.group(2))
+    
+    def notify(self, device_id, field, value, source, when=None):
+        """Queue a state change for evaluation; returns immediately"""
+        # Rule actions are applied on the worker thread, which knows how deep the chain is
+        depth = getattr(self.chain, "depth", 0) if source.startswith("rule:") else 0
+        if source in self.IGNORED_SOURCES or depth > self.max_depth:
+            self.stats["ignored"] += 1
+            return
+        self.events.put((device_id, field, value, time.time() if when is None else when, source, depth))
+    
+    def evaluate(self, device_id, field, value, when, source="user", depth=0):
+        """Fire every enabled rule that matches one change; returns the rules fired.
+        
+        `depth` is the number of rules that led to the change, 0 for any other
+        source.
+        """
+        candidates = self.index.get((device_id, field))
+        self.stats["events"] += 1
+        if not candidates:
+            return []
+        local = time.localtime(when)
+        minute = local.tm_hour * 60 + local.tm_min
+        fired = []
+        for rule in candidates:
+            self.stats["evaluated"] += 1
+            own = f"rule: {rule.name}"
+            if rule.enabled and rule.trigger.value == value and source != own and rule.in_window(minute):
+                self.chain.depth = depth + 1
+                try:
+                    for action in rule.actions:
+                        self.apply(action.device_id, action.field, action.value, own)
+                finally:
+                    self.chain.depth = 0
+                rule.fired += 1
+                rule.last_fired = when
+                fired.append(rule)
+        self.stats["fired"] += len(fired)
+        if fired and self.on_fire is not None:
+            self.on_fire(fired)
+        return fired
+    
+    def wait_idle(self):
+        """Block until every queued change has been evaluated"""
+        self.events.join()
+    
+    def _run(self):
+        while True:
+            event = self.events.get()
+            try:
+                self.evaluate(*event)
+            except Exception:
+                logger.exception("Rule evaluation failed for %s", event)
+            finally:
+                self.events.task_done()
+
+
+def sun_times(day, latitude=HOME_LATITUDE, longitude=HOME_LONGITUDE):
+    """Sunrise and sunset of a date as timestamps (NOAA approximation, about a minute accurate)"""
+    gamma = 2 * math.pi / 365 * (day.timetuple().tm_yday - 1)
+    eqtime = 229.18 * (0.000075 + 0.001868 * math.cos(gamma) - 0.032077 * math.sin(gamma)
+                       - 0.014615 * math.cos(2 * gamma) - 0.040849 * math.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * math.cos(gamma) + 0.070257 * math.sin(gamma)
+            - 0.006758 * math.cos(2 * gamma) + 0.000907 * math.sin(2 * gamma)
+            - 0.002697 * math.cos(3 * gamma) + 0.00148 * math.sin(3 * gamma))
+    lat = math.radians(latitude)
+    cos_ha = math.cos(math.radians(90.833)) / (math.cos(lat) * math.cos(decl)) - math.tan(lat) * math.tan(decl)
+    # Polar day/night: clamp to sun always up (ha = 180°) or always down (ha = 0°)
+    ha = math.degrees(math.acos(max(-1.0, min(1.0, cos_ha))))
+    midnight = datetime.combine(day, day_time(), timezone.utc).timestamp()
+    sunrise = midnight + (720 - 4 * (longitude + ha) - eqtime) * 60
+    sunset = midnight + (720 - 4 * (longitude - ha) - eqtime) * 60
+    return sunrise, sunset
+
+
+class Schedule:
+    __slots__ = ("id", "definition", "device_id", "action", "days", "at", "sun", "offset", "enabled", "due")
+    
+    DAYS = {"everyday": range(7), "weekdays": range(5), "weekends": range(5, 7)}
+    AT = re.compile(r"^(?:(\d{1,2}):(\d{2})|(sunrise|sunset)\s*(?:([+-])\s*(\d+))?)$")
+    
+    def __init__(self, definition, action):
+        match = self.AT.match(definition["at"].strip().lower())
+        if not match or definition.get("days", "everyday") not in self.DAYS:
+            raise ValueError(f"Cannot parse schedule {definition!r}")
+        hour, minute, sun, sign, offset = match.groups()
+        self.id = definition["id"]
+        self.definition = definition
+        self.device_id = action.device_id
+        self.action = action
+        self.days = self.DAYS[definition.get("days", "everyday")]
+        self.at = None if sun else day_time(int(hour), int(minute))
+        self.sun = sun
+        self.offset = int(offset or 0) * (-60 if sign == "-" else 60)
+        self.enabled = definition.get("enabled", True)
+        self.due = None
+    
+    def next_due(self, after):
+        """First run strictly after the timestamp `after`"""
+        day = datetime.fromtimestamp(after).date()
+        for _ in range(8):
+            if day.weekday() in self.days:
+                if self.sun:
+                    due = sun_times(day)[self.sun == "sunset"] + self.offset
+                else:
+                    due = datetime.combine(day, self.at).timestamp()
+                if due > after:
+                    return due
+            day += timedelta(days=1)
+        return None
+    
+    def label(self):
+        if self.sun:
+            if not self.offset:
+                return self.sun.capitalize()
+            return f"{self.sun.capitalize()} {self.offset // 60:+d} min"
+        return self.at.strftime("%I:%M %p").lstrip("0")
+
+
+class Scheduler:
+    """Runs recurring per-device schedules from a heap of due times.
+    
+    A schedule is {"id", "device", "action", "at", "days"?, "enabled"?},
+    where "action" uses the scene syntax ("on", "set (22)"), "at" is
+    "HH:MM", "sunrise" or "sunset-30" and "days" one of everyday, weekdays
+    or weekends. The worker sleeps until the earliest due time; schedules
+    due at the same instant go to `run(due, schedules)` as one batch.
+    `last_run` is the latest instant handled; on start every schedule
+    resumes after it, so a restart neither repeats a run nor skips one
+    missed by at most `catchup` seconds.
+    """
+    
+    def __init__(self, parse, run, last_run=None, catchup=SCHEDULE_CATCHUP):
+        self.parse = parse
+        self.run = run
+        self.last_run = time.time() if last_run is None else last_run
+        self.catchup = catchup
+        self.schedules = {}
+        self.by_device = {}
+        self.heap = []
+        self.wakeup = threading.Condition()
+        self.stats = {"wakeups": 0, "batches": 0, "runs": 0, "skipped": 0}
+    
+    def load(self, definitions):
+        for definition in definitions:
+            self.add(definition)
+    
+    def add(self, definition):
+        schedule = Schedule(definition, self.parse(f"{definition['device']}: {definition['action']}"))
+        with self.wakeup:
+            if schedule.id in self.schedules:
+                self.remove(schedule.id)
+            self.schedules[schedule.id] = schedule
+            self.by_device.setdefault(schedule.device_id, []).append(schedule)
+            if schedule.enabled:
+                self._push(schedule, self.last_run)
+        return schedule
+    
+    def remove(self, schedule_id):
+        with self.wakeup:
+            schedule = self.schedules.pop(schedule_id)
+            self.by_device[schedule.device_id].remove(schedule)
+            # Its heap entry is skipped when popped since `due` no longer matches
+            schedule.due = None
+    
+    def set_enabled(self, schedule_id, enabled):
+        with self.wakeup:
+            schedule = self.schedules[schedule_id]
+            schedule.enabled = schedule.definition["enabled"] = enabled
+            schedule.due = None
+            if enabled:
+                self._push(schedule, max(self.last_run, time.time()))
+    
+    def for_device(self, device_id):
+        return self.by_device.get(device_id, [])
+    
+    def start(self):
+        threading.Thread(target=self._loop, daemon=True).start()
+    
+    def _push(self, schedule, after):
+        schedule.due = schedule.next_due(after)
+        if schedule.due is not None:
+            heapq.heappush(self.heap, (schedule.due, schedule.id))
+            # The worker may be asleep waiting for a later schedule
+            self.wakeup.notify()
+    
+    def _loop(self):
+        while True:
+            with self.wakeup:
+                while not self.heap or self.heap[0][0] > time.time():
+                    self.wakeup.wait(None if not self.heap else self.heap[0][0] - time.time())
+                self.stats["wakeups"] += 1
+                due = self.heap[0][0]
+                batch = []
+                while self.heap and self.heap[0][0] == due:
+                    _, schedule_id = heapq.heappop(self.heap)
+                    schedule = self.schedules.get(schedule_id)
+                    if schedule is None or schedule.due != due:
+                        continue
+                    batch.append(schedule)
+                    self._push(schedule, due)
+                self.last_run = due
+            if not batch:
+                continue
+            if time.time() - due > self.catchup:
+                self.stats["skipped"] += len(batch)
+                batch = []
+            self.stats["batches"] += 1
+            self.stats["runs"] += len(batch)
+            try:
+                self.run(due, batch)
+            except Exception:
+                logger.exception("Scheduled run at %s failed", datetime.fromtimestamp(due))
+
+
+class ThermalModel:
+    """First-order thermal model of every thermostat zone, solved for all zones in one batch.
+    
+    A zone's temperature T follows dT/dt = loss·(outdoor − T) + rate·u,
+    where u is 1 while heating, −1 while cooling and 0 when idle. With u
+    held over a step this has the exact solution T' = eq + (T − eq)·decay,
+    eq = outdoor + rate·u / loss, so a horizon is one vector update over
+    all zones per step. Thermostats switch on beyond target ± deadband and
+    off once they reach the target; the mode limits u to heating, cooling
+    or both.
+    """
+    
+    MODES = {"heat": (0, 1), "cool": (-1, 0), "auto": (-1, 1)}
+    HEATING = {"Heating": 1, "Cooling": -1}
+    STATUS = {1: "Heating", -1: "Cooling", 0: "Idle"}
+    
+    def __init__(self, step=THERMAL_STEP, horizon=THERMAL_HORIZON, loss=THERMAL_LOSS, heat_rate=THERMAL_HEAT_RATE,
+                 cool_rate=THERMAL_COOL_RATE, deadband=THERMAL_DEADBAND):
+        self.step = step
+        self.steps = horizon // step
+        # Rates are per hour
+        self.loss = loss / 3600
+        self.heat_rate = heat_rate / 3600
+        self.cool_rate = cool_rate / 3600
+        self.deadband = deadband
+        self.decay = math.exp(-self.loss * step)
+    
+    def outdoor(self, start, steps=1):
+        """Outdoor temperature at the start of each step: a daily swing around OUTDOOR_MEAN"""
+        local = datetime.fromtimestamp(start)
+        hours = local.hour + local.minute / 60 + local.second / 3600 + np.arange(steps) * self.step / 3600
+        return OUTDOOR_MEAN - OUTDOOR_SWING * np.cos(2 * np.pi * (hours - OUTDOOR_COLDEST_HOUR) / 24)
+    
+    def equilibrium(self, outdoor, heating):
+        """Temperature a zone settles at with `heating` held"""
+        return outdoor + np.where(heating > 0, self.heat_rate, self.cool_rate) * heating / self.loss
+    
+    def advance(self, current, heating, outdoor, seconds):
+        """Temperatures `seconds` later with every zone's heating held"""
+        eq = self.equilibrium(outdoor, heating)
+        return eq + (current - eq) * math.exp(-self.loss * seconds)
+    
+    def setpoints(self, targets, events):
+        """Target of every zone per step: current targets, changed by the (rows, steps, values) events"""
+        rows, steps, values = events
+        # Later events get higher numbers, so a running maximum finds the one in force at each step
+        order = np.argsort(steps, kind="stable")
+        latest = np.full((len(targets), self.steps), -1)
+        latest[rows[order], steps[order]] = np.arange(len(order))
+        latest = np.maximum.accumulate(latest, axis=1)
+        # -1 (no event yet) picks the padding, which np.where then replaces
+        return np.where(latest < 0, targets[:, None], np.append(values[order], 0.0)[latest])
+    
+    def simulate(self, current, heating, setpoints, limits, outdoor):
+        """Temperatures (zones × steps + 1) and heating (zones × steps) over the horizon"""
+        low, high = limits
+        temps = np.empty((len(current), self.steps + 1))
+        heatings = np.empty((len(current), self.steps), dtype=np.int8)
+        temps[:, 0] = current
+        T, u = current, heating
+        for n in range(self.steps):
+            target = setpoints[:, n]
+            u = np.where(T < target - self.deadband, 1, np.where(T > target + self.deadband, -1, u))
+            u = np.where(((u > 0) & (T >= target)) | ((u < 0) & (T <= target)), 0, u)
+            u = np.clip(u, low, high)
+            eq = self.equilibrium(outdoor[n], u)
+            T = eq + (T - eq) * self.decay
+            temps[:, n + 1] = T
+            heatings[:, n] = u
+        return temps, heatings
+    
+    def reach_steps(self, temps, targets):
+        """First step at which each zone is at its target, or -1 if not within the horizon"""
+        direction = np.sign(targets - temps[:, 0])
+        reached = direction[:, None] * (temps - targets[:, None]) >= 0
+        return np.where(reached.any(axis=1), reached.argmax(axis=1), -1)
+    
+    def preheat_steps(self, temps, limits, outdoor, events):
+        """Latest step to start each (rows, steps, values) event so the zone is at its value by its step.
+        
+        Runs backwards from each event with full heating (or cooling) to the
+        temperature the zone must have at every earlier step, then takes the
+        last step where the predicted temperature is already there. Events
+        that need no lead start at their own step; ones that cannot be made
+        in time start at once.
+        """
+        rows, steps, values = events
+        low, high = limits
+        before = temps[rows, steps]
+        direction = np.sign(values - before) * (np.abs(values - before) > self.deadband)
+        # Only in a mode that may drive the zone that way
+        direction = np.where((direction > 0) & (high[rows] > 0) | (direction < 0) & (low[rows] < 0), direction, 0)
+        required = np.empty((len(rows), self.steps + 1))
+        needed = values.astype(float)
+        for n in range(self.steps, -1, -1):
+            if n < self.steps:
+                eq = self.equilibrium(outdoor[n], direction)
+                needed = eq + (needed - eq) / self.decay
+            needed = np.where(n >= steps, values, needed)
+            required[:, n] = needed
+        columns = np.arange(self.steps + 1)
+        ready = (direction[:, None] * (temps[rows] - required) >= 0) & (columns <= steps[:, None])
+        last = self.steps - ready[:, ::-1].argmax(axis=1)
+        return np.where(direction == 0, steps, np.where(ready.any(axis=1), last, 0))
+    
+    def forecast(self, thermostats, schedules, now):
+        """Solve every zone over the horizon from `now`.
+        
+        `schedules` are the thermostats' target schedules. Returns the step
+        length, the heating to apply now per zone, the step each zone
+        reaches its target (-1 if not within the horizon) and the preheat
+        start per schedule id.
+        """
+        index = {device.id: i for i, device in enumerate(thermostats)}
+        current = np.array([device.current for device in thermostats], dtype=float)
+        targets = np.array([device.target for device in thermostats], dtype=float)
+        heating = np.array([self.HEATING.get(device.status, 0) for device in thermostats])
+        low, high = np.array([self.MODES.get(device.mode, (0, 0)) if device.status != "OFF" else (0, 0) for device in thermostats]).reshape(-1, 2).T
+        due = [schedule for schedule in schedules if schedule.device_id in index and now <= schedule.due < now + self.steps * self.step]
+        events = (
+            np.array([index[schedule.device_id] for schedule in due], dtype=int),
+            np.array([int((schedule.due - now) // self.step) for schedule in due], dtype=int),
+            np.array([schedule.action.value for schedule in due], dtype=float),
+        )
+        outdoor = self.outdoor(now, self.steps)
+        temps, heatings = self.simulate(current, heating, self.setpoints(targets, events), (low, high), outdoor)
+        preheat = self.preheat_steps(temps, (low, high), outdoor, events)
+        return {
+            "heating": heatings[:, 0] if len(thermostats) else heating,
+            "reaches": self.reach_steps(temps, targets),
+            "preheat": {schedule.id: now + int(start) * self.step for schedule, start, at in zip(due, preheat, events[1]) if start < at},
+        }
+
+
+class DeviceError(Exception):
+    """A device command failed after all retries"""
+
+
+class DeviceDriver(abc.ABC):
+    """Protocol adapter between DeviceIO and one device endpoint (a broker or a host).
+    
+    send() delivers one command and returns the value the device reports;
+    it raises DeviceError when the device refuses and OSError/TimeoutError
+    on transport trouble, which DeviceIO retries. read() fetches the state
+    and info of many devices in as few requests as the protocol allows.
+    """
+    
+    protocol = ""
+    
+    def __init__(self, address, bulk_size=DEVICE_BULK_SIZE):
+        self.address = tuple(address)
+        self.bulk_size = bulk_size
+        self.stats = {"requests": 0, "connections": 0}
+    
+    @abc.abstractmethod
+    async def send(self, device_id, field, value):
+        """Deliver one command and return the value the device reports"""
+    
+    async def read(self, device_ids):
+        chunks = [device_ids[i:i + self.bulk_size] for i in range(0, len(device_ids), self.bulk_size)]
+        reports = {}
+        for chunk in await asyncio.gather(*(self._read_retrying(chunk) for chunk in chunks)):
+            reports.update(chunk)
+        return reports
+    
+    async def _read_retrying(self, device_ids):
+        for attempt in range(DEVICE_IO_RETRIES + 1):
+            if attempt:
+                await asyncio.sleep(DEVICE_IO_BACKOFF * 2 ** (attempt - 1))
+            try:
+                return await asyncio.wait_for(self._read_chunk(device_ids), DEVICE_IO_TIMEOUT)
+            except (OSError, asyncio.TimeoutError) as ex:
+                error = ex
+        raise error
+    
+    @abc.abstractmethod
+    async def _read_chunk(self, device_ids):
+        """State and info by device id for at most `bulk_size` devices, in one request"""
+    
+    def describe(self):
+        return f"{self.protocol} via {self.address[0]}:{self.address[1]}"
+    
+    def connections(self):
+        return []
+    
+    async def close(self):
+        connections = self.connections()
+        for connection in connections:
+            connection.close()
+        await asyncio.gather(*(connection.task for connection in connections), return_exceptions=True)
+
+
+class PipelinedConnection(abc.ABC):
+    """A stream that carries many requests at once.
+    
+    Requests are written as soon as they are made; `_read_reply` reads the
+    next reply and returns (key, reply), and the reply resolves the waiter
+    registered under that key. A broken stream fails every waiter, and the
+    owning driver opens a fresh connection on its next request.
+    """
+    
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.waiting = {}
+        self.closed = False
+        self.task = asyncio.get_running_loop().create_task(self._read_loop())
+    
+    async def request(self, key, data):
+        if self.closed:
+            raise ConnectionError("connection closed by device")
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[key] = future
+        try:
+            self.writer.write(data)
+            await self.writer.drain()
+            return await future
+        finally:
+            self.waiting.pop(key, None)
+    
+    async def _read_loop(self):
+        try:
+            while True:
+                key, reply = await self._read_reply()
+                future = self.waiting.pop(key, None)
+                # Waiters that timed out are gone; their late replies are dropped
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        except (OSError, EOFError, ValueError, asyncio.IncompleteReadError) as ex:
+            self.close(ConnectionError(str(ex) or "connection closed by device"))
+    
+    @abc.abstractmethod
+    async def _read_reply(self):
+        """Read the next reply from the stream and return (key, reply)"""
+    
+    def close(self, error=None):
+        self.closed = True
+        self.task.cancel()
+        self.writer.close()
+        for future in self.waiting.values():
+            if not future.done():
+                future.set_exception(error or ConnectionError("connection closed"))
+        self.waiting.clear()
+
+
+class MqttConnection(PipelinedConnection):
+    """JSON-line publishes acknowledged by message id, in any order; a reason code marks a failed publish"""
+    
+    async def _read_reply(self):
+        line = await self.reader.readline()
+        if not line:
+            raise EOFError
+        message = json.loads(line)
+        return message["mid"], message
+
+
+class MqttDriver(DeviceDriver):
+    """MQTT-style pub/sub: every device behind a broker shares one connection.
+    
+    Commands are published to smartnest/<device>/set and bulk reads to
+    smartnest/$bulk/get; each publish carries a message id and the broker's
+    acknowledgement carries the reply, so any number can be in flight.
+    """
+    
+    protocol = "MQTT"
+    
+    def __init__(self, address, bulk_size=DEVICE_BULK_SIZE):
+        super().__init__(address, bulk_size)
+        self.connection = None
+        self.connecting = None
+        self.mids = itertools.count(1)
+    
+    async def _connect(self):
+        if self.connection is not None and not self.connection.closed:
+            return self.connection
+        # Concurrent publishes wait for the same connection attempt
+        if self.connecting is None:
+            self.connecting = asyncio.ensure_future(self._open())
+        return await asyncio.shield(self.connecting)
+    
+    async def _open(self):
+        try:
+            reader, writer = await asyncio.open_connection(*self.address)
+        finally:
+            self.connecting = None
+        self.connection = MqttConnection(reader, writer)
+        self.stats["connections"] += 1
+        return self.connection
+    
+    async def publish(self, topic, payload):
+        connection = await self._connect()
+        mid = next(self.mids)
+        self.stats["requests"] += 1
+        message = {"type": "publish", "mid": mid, "topic": topic, "payload": payload}
+        ack = await connection.request(mid, json.dumps(message).encode() + b"\n")
+        if ack.get("reason"):
+            raise ConnectionError(f"publish failed: {ack['reason']}")
+        return ack["payload"]
+    
+    def connections(self):
+        return [self.connection] if self.connection is not None else []
+    
+    async def send(self, device_id, field, value):
+        reply = await self.publish(f"smartnest/{device_id}/set", {"field": field, "value": value})
+        if not reply.get("ok"):
+            raise DeviceError(reply.get("error", "rejected"))
+        return reply.get("value", value)
+    
+    async def _read_chunk(self, device_ids):
+        reply = await self.publish("smartnest/$bulk/get", {"ids": device_ids})
+        return reply["devices"]
+
+
+async def read_http_message(reader):
+    """Start line, lower-cased headers and decoded JSON body of one HTTP/1.1 message"""
+    start = await reader.readline()
+    if not start:
+        raise EOFError
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+        name, _, value = line.decode().partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return start.decode().split(), headers, json.loads(body) if body else None
+
+
+class HttpConnection(PipelinedConnection):
+    """HTTP/1.1 keep-alive stream; pipelined responses come back in request order"""
+    
+    def __init__(self, reader, writer):
+        self.order = itertools.count()
+        self.replies = itertools.count()
+        super().__init__(reader, writer)
+    
+    async def _read_reply(self):
+        start, _, body = await read_http_message(self.reader)
+        return next(self.replies), (int(start[1]), body)
+
+
+class HttpDriver(DeviceDriver):
+    """HTTP/REST devices behind one host, over a small pool of pipelined keep-alive connections.
+    
+    Commands are PUT /devices/<id>; bulk reads are POST /devices/_bulk with
+    up to bulk_size ids. A request goes to the least busy connection, and a
+    new one is only opened while every pooled connection has work queued.
+    """
+    
+    protocol = "HTTP"
+    # Statuses worth retrying; anything else but 200 is the device refusing
+    TRANSIENT = (502, 503, 504)
+    
+    def __init__(self, address, bulk_size=DEVICE_BULK_SIZE, pool_size=DEVICE_IO_POOL_SIZE):
+        super().__init__(address, bulk_size)
+        self.pool_size = pool_size
+        self.pool = []
+        self.opening = []
+    
+    async def _connection(self):
+        self.pool = [connection for connection in self.pool if not connection.closed]
+        full = len(self.pool) + len(self.opening) >= self.pool_size
+        idle = min(self.pool, key=lambda connection: len(connection.waiting), default=None)
+        if idle is not None and (not idle.waiting or full):
+            return idle
+        if full:
+            # Every free slot is still connecting; queue behind the first
+            return await asyncio.shield(self.opening[0])
+        task = asyncio.ensure_future(self._open())
+        self.opening.append(task)
+        return await asyncio.shield(task)
+    
+    async def _open(self):
+        try:
+            reader, writer = await asyncio.open_connection(*self.address)
+        finally:
+            self.opening.remove(asyncio.current_task())
+        connection = HttpConnection(reader, writer)
+        self.pool.append(connection)
+        self.stats["connections"] += 1
+        return connection
+    
+    async def request(self, method, path, body):
+        connection = await self._connection()
+        self.stats["requests"] += 1
+        data = json.dumps(body).encode()
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.address[0]}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n"
+        return await connection.request(next(connection.order), head.encode() + data)
+    
+    def connections(self):
+        return self.pool
+    
+    async def send(self, device_id, field, value):
+        status, reply = await self.request("PUT", f"/devices/{device_id}", {"field": field, "value": value})
+        if status in self.TRANSIENT:
+            raise ConnectionError(f"HTTP {status}")
+        if status != 200:
+            raise DeviceError((reply or {}).get("error", f"HTTP {status}"))
+        return reply.get("value", value)
+    
+    async def _read_chunk(self, device_ids):
+        status, reply = await self.request("POST", "/devices/_bulk", {"ids": device_ids})
+        if status != 200:
+            raise ConnectionError(f"bulk read failed: HTTP {status}")
+        return reply["devices"]
+
+
+class DeviceIO:
+    """Sends device commands from a background asyncio loop so UI callbacks never block.
+    
+    submit() is thread-safe and returns a concurrent Future at once. At most
+    DEVICE_IO_PER_DEVICE commands run per device; a queued command is
+    skipped (resolving to None) when a newer one for the same field has
+    arrived, and transport errors are retried with exponential backoff.
+    Every device is reached through the driver `route(device_id)` names;
+    without `drivers`, local SimulatedDevices stand in for an MQTT broker
+    and an HTTP host.
+    """
+    
+    def __init__(self, route=None, drivers=None):
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True, name="device-io").start()
+        self.device_slots = {}
+        self.sequence = itertools.count()
+        self.latest = {}
+        # Commands per (device, field) not yet finished; written by callers and the loop, so under the lock
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.stats = {"sent": 0, "retries": 0, "failed": 0, "superseded": 0, "polls": 0}
+        if drivers is None:
+            self.simulator = SimulatedDevices()
+            addresses = asyncio.run_coroutine_threadsafe(self.simulator.start(), self.loop).result()
+            drivers = {"mqtt": MqttDriver(addresses["mqtt"]), "http": HttpDriver(addresses["http"])}
+        self.drivers = drivers
+        self.route = route or (lambda device_id: next(iter(drivers)))
+        atexit.register(self.close)
+    
+    def close(self):
+        """Close every driver connection; pending commands fail"""
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result(DEVICE_IO_TIMEOUT)
+    
+    async def _close(self):
+        await asyncio.gather(*(driver.close() for driver in self.drivers.values()))
+    
+    def driver(self, device_id):
+        return self.drivers[self.route(device_id)]
+    
+    def submit(self, device_id, field, value):
+        seq = next(self.sequence)
+        key = (device_id, field)
+        with self.lock:
+            self.latest[key] = seq
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+        return asyncio.run_coroutine_threadsafe(self._send(device_id, field, value, seq), self.loop)
+    
+    def mark(self):
+        """A point in the command sequence, for settled()"""
+        return next(self.sequence)
+    
+    def settled(self, device_id, field, mark):
+        """True if no command for the field is in flight or was submitted after `mark`"""
+        key = (device_id, field)
+        with self.lock:
+            return not self.in_flight.get(key) and self.latest.get(key, -1) < mark
+    
+    def poll(self, device_ids):
+        """Concurrent Future of {device_id: {"state": {...}, "info": {...}}}, batched per driver"""
+        return asyncio.run_coroutine_threadsafe(self._poll(list(device_ids)), self.loop)
+    
+    async def _poll(self, device_ids):
+        groups = {}
+        for device_id in device_ids:
+            groups.setdefault(self.route(device_id), []).append(device_id)
+        self.stats["polls"] += 1
+        reports = {}
+        for result in await asyncio.gather(*(self.drivers[name].read(ids) for name, ids in groups.items())):
+            reports.update(result)
+        return reports
+    
+    async def _send(self, device_id, field, value, seq):
+        key = (device_id, field)
+        try:
+            return await self._deliver(device_id, field, value, seq)
+        finally:
+            with self.lock:
+                self.in_flight[key] -= 1
+    
+    async def _deliver(self, device_id, field, value, seq):
+        slots = self.device_slots.get(device_id)
+        if slots is None:
+            slots = self.device_slots[device_id] = asyncio.Semaphore(DEVICE_IO_PER_DEVICE)
+        async with slots:
+            if self.latest.get((device_id, field)) != seq:
+                self.stats["superseded"] += 1
+                return None
+            
+            driver = self.driver(device_id)
+            for attempt in range(DEVICE_IO_RETRIES + 1):
+                if attempt:
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(DEVICE_IO_BACKOFF * 2 ** (attempt - 1))
+                try:
+                    reported = await asyncio.wait_for(driver.send(device_id, field, value), DEVICE_IO_TIMEOUT)
+                except DeviceError as ex:
+                    # The device answered and refused; retrying will not help
+                    error = str(ex)
+                    break
+                except (OSError, asyncio.TimeoutError) as ex:
+                    error = str(ex) or type(ex).__name__
+                    continue
+                self.stats["sent"] += 1
+                return reported
+            
+            self.stats["failed"] += 1
+            raise DeviceError(f"{device_id}: {error}")
+
+
+class SimulatedDevices:
+    """Local stand-in for networked devices: an MQTT-style broker and an HTTP host over one shared state.
+    
+    Every request is answered after a random round trip. A share of them
+    fail so retries get exercised: the broker acknowledges with a reason
+    code and the HTTP host answers 503, either way without breaking the
+    connection the other pipelined requests share. Requests on one connection are
+    handled concurrently; HTTP replies still leave in order.
+    """
+    
+    MODELS = {"thermostat": "ThermoSmart X", "light": "SmartColor A19", "lock": "SecureLock Pro", "door": "SecureLock Pro", "fan": "AirFlow 3"}
+    
+    def __init__(self, latency=SIMULATED_LATENCY, drop_rate=SIMULATED_DROP_RATE):
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.state = {}
+        self.started = time.time()
+        self.servers = []
+    
+    async def start(self, host="127.0.0.1"):
+        addresses = {}
+        for name, handler in (("mqtt", self.handle_mqtt), ("http", self.handle_http)):
+            server = await asyncio.start_server(handler, host, 0)
+            self.servers.append(server)
+            addresses[name] = server.sockets[0].getsockname()[:2]
+        return addresses
+    
+    def info(self, device_id):
+        digest = zlib.crc32(device_id.encode())
+        model = next((model for word, model in self.MODELS.items() if word in device_id.lower()), "SmartNest Node")
+        return {
+            "model": model,
+            "firmware": f"v{2 + digest % 3}.{digest >> 4 & 7}.{digest >> 8 & 15}",
+            "mac": ":".join(f"{byte:02X}" for byte in b"\xa4\xcf" + struct.pack(">I", digest)),
+            "booted": self.started - digest % (30 * 86400),
+        }
+    
+    def command(self, device_id, field, value):
+        self.state.setdefault(device_id, {})[field] = value
+        return {"ok": True, "value": value}
+    
+    def report(self, device_ids):
+        return {device_id: {"state": dict(self.state.get(device_id, {})), "info": self.info(device_id)} for device_id in device_ids}
+    
+    async def _round_trip(self):
+        await asyncio.sleep(random.uniform(*self.latency))
+        return random.random() >= self.drop_rate
+    
+    async def handle_mqtt(self, reader, writer):
+        async def answer(message):
+            ack = {"type": "puback", "mid": message["mid"]}
+            topic, payload = message["topic"], message["payload"]
+            if not await self._round_trip():
+                ack["reason"] = "unspecified error"
+            elif topic == "smartnest/$bulk/get":
+                ack["payload"] = {"devices": self.report(payload["ids"])}
+            else:
+                ack["payload"] = self.command(topic.split("/")[1], payload["field"], payload["value"])
+            if not writer.is_closing():
+                writer.write(json.dumps(ack).encode() + b"\n")
+        
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                task = asyncio.ensure_future(answer(json.loads(line)))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+    
+    async def handle_http(self, reader, writer):
+        async def answer(method, path, body):
+            if not await self._round_trip():
+                return 503, {"error": "device busy"}
+            if method == "POST" and path == "/devices/_bulk":
+                return 200, {"devices": self.report(body["ids"])}
+            if method == "PUT" and path.startswith("/devices/"):
+                return 200, self.command(path[len("/devices/"):], body["field"], body["value"])
+            return 404, {"error": f"no route for {method} {path}"}
+        
+        async def respond():
+            while (task := await replies.get()) is not None:
+                status, reply = await task
+                data = json.dumps(reply).encode()
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data)
+            writer.close()
+        
+        replies = asyncio.Queue()
+        responder = asyncio.ensure_future(respond())
+        try:
+            while not writer.is_closing():
+                start, _, body = await read_http_message(reader)
+                await replies.put(asyncio.ensure_future(answer(start[0], start[1], body)))
+        except (ConnectionError, EOFError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            await replies.put(None)
+            await responder
+
+
+def device_power(device):
+    """Estimated power draw of a device in watts from its current state"""
+    if device.kind == "light":
+        return POWER_RATINGS["light"] * device.brightness / 100 if device.status == "ON" else 0.0
+    if device.kind == "lock":
+        return float(POWER_RATINGS["lock"])
+    if device.kind == "thermostat":
+        active = device.status in ("Heating", "Cooling")
+        return float(POWER_RATINGS["thermostat_active" if active else "thermostat_idle"])
+    if device.kind == "fan":
+        return float(POWER_RATINGS["fan_step"] * device.speed)
+    return 0.0
+
+
+def is_active(device):
+    # Fans have no on/off toggle; speed 0 means off
+    if device.kind == "fan":
+        return device.speed > 0
+    return device.status in ("ON", "Heating", "Cooling")
+
+
+class Metrics:
+    """Counters and gauges that any thread can update without contention.
+    
+    `add` goes to a shard only the calling thread writes, so concurrent
+    updates never wait on each other; `value` sums the shards. Shards of
+    threads that have exited are folded into one when a new thread joins.
+    Gauges that are overwritten rather than adjusted use `set`.
+    """
+    
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []
+        self.retired = {}
+        self.gauges = {}
+    
+    def _shard(self):
+        shard = getattr(self.local, "shard", None)
+        if shard is None:
+            shard = self.local.shard = {}
+            # Only taken once per thread
+            with self.lock:
+                live = []
+                for thread, old in self.shards:
+                    if thread.is_alive():
+                        live.append((thread, old))
+                    else:
+                        for name, amount in old.items():
+                            self.retired[name] = self.retired.get(name, 0) + amount
+                live.append((threading.current_thread(), shard))
+                self.shards = live
+        return shard
+    
+    def add(self, name, amount=1):
+        """Increment a counter, or adjust a gauge by a delta"""
+        shard = self._shard()
+        shard[name] = shard.get(name, 0) + amount
+    
+    def set(self, name, value):
+        self.gauges[name] = value
+    
+    def snapshot(self):
+        """Every counter and gauge by name"""
+        with self.lock:
+            shards = [dict(shard) for _, shard in self.shards]
+            totals = dict(self.retired)
+        for shard in shards:
+            for name, amount in shard.items():
+                totals[name] = totals.get(name, 0) + amount
+        totals.update(self.gauges)
+        return totals
+    
+    def value(self, name):
+        if name in self.gauges:
+            return self.gauges[name]
+        with self.lock:
+            shards = [shard for _, shard in self.shards]
+            total = self.retired.get(name, 0)
+        return total + sum(shard.get(name, 0) for shard in shards)
+
+
+class Histogram:
+    """Counts of values in doubling buckets, for percentiles without keeping samples"""
+    
+    def __init__(self, first, buckets=24):
+        self.bounds = [first * 2 ** i for i in range(buckets)]
+        self.counts = [0] * (buckets + 1)
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+    
+    def record(self, value):
+        index = bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += value
+            self.max = max(self.max, value)
+    
+    def snapshot(self):
+        """Count, mean, max and p50/p95/p99 (upper bound of the bucket the rank falls in)"""
+        with self.lock:
+            counts, total, peak = list(self.counts), self.total, self.max
+        count = sum(counts)
+        result = {"count": count, "mean": total / count if count else 0.0, "max": peak}
+        for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            seen = 0
+            for bound, bucket in zip(self.bounds + [peak], counts):
+                seen += bucket
+                if seen >= fraction * count:
+                    result[name] = min(bound, peak)
+                    break
+        return result
+
+
+def count_controls(control):
+    count, stack = 0, [control]
+    while stack:
+        control = stack.pop()
+        if control is None:
+            continue
+        count += 1
+        stack.extend(control._get_children())
+    return count
+
+
+def handler_name(handler):
+    """create_device_card.toggle_device for a closure, SliderCoalescer.on_change for a method"""
+    name = getattr(handler, "__qualname__", type(handler).__name__)
+    return name.replace(".<locals>", "").removeprefix("SmartHomeApp.")
+
+
+def view_cache_report(stats):
+    """Per-view build count, cache hit rate and average build time in ms.
+    
+    `stats` maps a view name to its "builds", "hits" and total "build_ms",
+    as kept by a session or read back from the views.* counters of Metrics.
+    """
+    report = {}
+    for name, view in sorted(stats.items()):
+        builds, hits = view.get("builds", 0), view.get("hits", 0)
+        report[name] = {
+            "builds": builds,
+            "hits": hits,
+            "hit_rate": hits / (builds + hits) if builds + hits else 0.0,
+            "avg_build_ms": view.get("build_ms", 0.0) / builds if builds else 0.0,
+        }
+    return report
+
+
+def view_counters(snapshot):
+    """The views.<name>.<stat> counters of a Metrics snapshot, by view name"""
+    views = {}
+    for name, value in snapshot.items():
+        parts = name.split(".")
+        if len(parts) == 3 and parts[0] == "views":
+            views.setdefault(parts[1], {})[parts[2]] = value
+    return views
+
+
+class Instrumentation:
+    """Latency and size histograms for UI event handlers, view builds and page updates.
+    
+    Every hook starts with a check of `enabled`, so while it is off (the
+    default) instrumented code pays for one extra call. Histograms are
+    named handler.<name> and view.<name> (ms), view.<name>.controls,
+    update.ms (per UpdateScheduler flush) and update.bytes (per page update
+    sent; only on the FLET_VERIFIED release line, since it needs Flet's
+    private connection). report() feeds the metrics endpoint and the debug
+    overlay.
+    """
+    
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.server = None
+    
+    def record(self, name, value, first=0.05):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram(first))
+        histogram.record(value)
+    
+    def timed(self, name, function, after=None):
+        """`function` recording its latency as `name` while enabled; `after()` runs once it has"""
+        def instrumented(*args, **kwargs):
+            if not self.enabled:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, (time.perf_counter() - started) * 1000)
+                if after is not None:
+                    after()
+        return instrumented
+    
+    def watch(self, page, updates):
+        """Time every synchronous event handler of the page and every flush of its UpdateScheduler, and size what is sent"""
+        run_thread = page.run_thread
+        
+        def run_handler(handler, *args, **kwargs):
+            # Flet runs sync handlers through here
+            if self.enabled:
+                handler = self.timed(f"handler.{handler_name(handler)}", handler)
+            run_thread(handler, *args, **kwargs)
+        
+        page.run_thread = run_handler
+        # Page updates are encoded and sent inside the flush
+        updates.flush = self.timed("update.ms", updates.flush)
+        
+        # Flet keeps the connection private, so sizes are only read where its shape is known;
+        # sessions of one client share the connection
+        connection = getattr(page, "_Page__conn", None)
+        if not ft.version.version.startswith(FLET_VERIFIED) or not hasattr(connection, "send_commands"):
+            return
+        if getattr(connection, "instrumentation", None) is not None:
+            return
+        connection.instrumentation = self
+        send_commands = connection.send_commands
+        
+        def send_sized(session_id, commands):
+            if self.enabled:
+                self.record("update.bytes", len(json.dumps(commands, cls=CommandEncoder, separators=(",", ":"))), first=64)
+            return send_commands(session_id, commands)
+        
+        connection.send_commands = send_sized
+    
+    def report(self):
+        return {name: histogram.snapshot() for name, histogram in sorted(self.histograms.items())}
+    
+    def serve(self, port, metrics, host="127.0.0.1"):
+        """Start the local metrics endpoint.
+        
+        GET /metrics returns the histograms, the home's counters and gauges and
+        the view cache report of all sessions as JSON; POST
+        /instrumentation/on and /off switch recording.
+        """
+        instrumentation = self
+        
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    return self.send_error(404)
+                snapshot = metrics.snapshot()
+                self.reply({
+                    "enabled": instrumentation.enabled,
+                    "histograms": instrumentation.report(),
+                    "metrics": snapshot,
+                    "views": view_cache_report(view_counters(snapshot)),
+                })
+            
+            def do_POST(self):
+                switch = {"/instrumentation/on": True, "/instrumentation/off": False}
+                if self.path not in switch:
+                    return self.send_error(404)
+                instrumentation.enabled = switch[self.path]
+                self.reply({"enabled": instrumentation.enabled})
+            
+            def reply(self, body):
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        try:
+            self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError:
+            logger.exception("Metrics endpoint not started on port %s", port)
+            return None
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True, name="metrics").start()
+        return self.server.server_address
+
+
+class StartupTimeline:
+    """When each startup milestone was reached, in seconds since `started`"""
+    
+    def __init__(self, started=PROCESS_STARTED):
+        self.started = started
+        self.marks = {}
+    
+    def mark(self, milestone):
+        # Only the first session to reach a milestone sets it
+        self.marks.setdefault(milestone, time.perf_counter() - self.started)
+    
+    def report(self):
+        """Milestones in the order reached, each with the time it took after the previous one"""
+        parts = []
+        previous = 0.0
+        for milestone, at in sorted(self.marks.items(), key=lambda item: item[1]):
+            parts.append(f"{milestone} +{(at - previous) * 1000:.0f} ms")
+            previous = at
+        return f"Startup in {previous * 1000:.0f} ms: " + ", ".join(parts)
+
+
+class RoomStats:
+    """Per-room aggregates kept current as devices change.
+    
+    Each device contributes (on, watts, temperature) to its room. RoomStats
+    listens on the registry's change bus for the fields a contribution
+    depends on and swaps the device's old contribution for its new one, so
+    aggregates cost O(1) per change and reading them never scans devices.
+    Home-wide totals go to the "devices.active" and "power.watts" gauges of
+    `metrics`.
+    """
+    FIELDS = ("status", "brightness", "speed", "current")
+    
+    def __init__(self, devices, metrics=None):
+        self.devices = devices
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.rooms = {}
+        self.contributions = {}
+        for device in devices:
+            self.contributions[device.id] = contribution = self.contribution(device)
+            self._apply(device.room, None, contribution)
+        for field in self.FIELDS:
+            devices.bus.subscribe(self.on_change, field=field)
+    
+    @staticmethod
+    def contribution(device):
+        temperature = device.current if device.kind == "thermostat" else None
+        return (1 if is_active(device) else 0, device_power(device), temperature)
+    
+    def on_change(self, change):
+        with self.lock:
+            device = self.devices[change.device_id]
+            after = self.contribution(device)
+            before = self.contributions.get(device.id)
+            self.contributions[device.id] = after
+            self._apply(device.room, before, after)
+    
+    def _apply(self, room, before, after):
+        stats = self.rooms.get(room)
+        if stats is None:
+            stats = self.rooms[room] = {"devices": 0, "on": 0, "watts": 0.0, "temperature_sum": 0.0, "thermostats": 0}
+        if before is None:
+            stats["devices"] += 1
+            before = (0, 0.0, None)
+        stats["on"] += after[0] - before[0]
+        stats["watts"] += after[1] - before[1]
+        if self.metrics is not None and after[:2] != before[:2]:
+            self.metrics.add("devices.active", after[0] - before[0])
+            self.metrics.add("power.watts", after[1] - before[1])
+        if before[2] is not None:
+            stats["temperature_sum"] -= before[2]
+            stats["thermostats"] -= 1
+        if after[2] is not None:
+            stats["temperature_sum"] += after[2]
+            stats["thermostats"] += 1
+    
+    def get(self, room):
+        stats = self.rooms[room]
+        temperature = stats["temperature_sum"] / stats["thermostats"] if stats["thermostats"] else None
+        return {"room": room, "devices": stats["devices"], "on": stats["on"], "watts": stats["watts"], "temperature": temperature}
+    
+    def __iter__(self):
+        return (self.get(room) for room in list(self.rooms))
+
+
+class RollupChunk:
+    """One time window of a rollup level: a memory-mapped row of float64 buckets per series"""
+    CELL = struct.Struct("<d")
+    
+    def __init__(self, path, width):
+        self.path = path
+        self.width = width
+        self.rows = 0
+        self.mm = None
+        if os.path.exists(path):
+            self._map(os.path.getsize(path) // (width * 8))
+    
+    def _map(self, rows):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        try:
+            size = rows * self.width * 8
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            if self.mm is not None:
+                self.mm.close()
+            self.mm = mmap.mmap(fd, size) if size else None
+        finally:
+            os.close(fd)
+        self.rows = rows
+    
+    def add(self, row, bucket, value):
+        if row >= self.rows:
+            self._map(row + 64)
+        offset = (row * self.width + bucket) * 8
+        self.CELL.pack_into(self.mm, offset, self.CELL.unpack_from(self.mm, offset)[0] + value)
+    
+    def read(self, row, start, stop):
+        if row >= self.rows:
+            return [0.0] * (stop - start)
+        base = row * self.width
+        with memoryview(self.mm) as raw, raw[(base + start) * 8:(base + stop) * 8] as part, part.cast("d") as view:
+            return view.tolist()
+    
+    def close(self):
+        if self.mm is not None:
+            self.mm.flush()
+            self.mm.close()
+            self.mm = None
+
+
+class EnergyStore:
+    """Append-only store of per-device power samples with minute, hour and day rollups.
+    
+    Raw samples are appended to one segment file per day. Each rollup level
+    is split into fixed time windows ("chunks"); a chunk is a memory-mapped
+    file holding one row of Wh buckets per series, so a range query touches
+    exactly the buckets it covers. Only the chunk being written stays open per
+    level; past chunks are mapped for reads through a small LRU of
+    `read_chunks`. Every sampling tick is also folded into the whole-home series
+    under HOME.
+    """
+    HOME = "_home"
+    # level -> (bucket seconds, buckets per chunk)
+    LEVELS = {"minute": (60, 1440), "hour": (3600, 720), "day": (86400, 366)}
+    RAW = struct.Struct("<IIf")
+    
+    def __init__(self, root, interval=ENERGY_SAMPLE_INTERVAL, read_chunks=ENERGY_READ_CHUNKS):
+        self.root = root
+        self.interval = interval
+        self.read_chunks = read_chunks
+        self.lock = threading.Lock()
+        self.latest = {}
+        # level -> chunk being written; (level, number) -> past chunk, oldest use first
+        self.current = {}
+        self.chunks = OrderedDict()
+        self.segment = None
+        os.makedirs(os.path.join(root, "raw"), exist_ok=True)
+        for level in self.LEVELS:
+            os.makedirs(os.path.join(root, level), exist_ok=True)
+        
+        origin_path = os.path.join(root, "origin")
+        if not os.path.exists(origin_path):
+            midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            with open(origin_path, "w") as f:
+                f.write(str(int(midnight.timestamp())))
+        with open(origin_path) as f:
+            self.origin = int(f.read())
+        
+        # Row number of each series in the rollup chunks
+        self.series_path = os.path.join(root, "series.txt")
+        self.rows = {}
+        if os.path.exists(self.series_path):
+            with open(self.series_path) as f:
+                for line in f:
+                    self.rows[line.strip()] = len(self.rows)
+        if self.HOME not in self.rows:
+            self._row(self.HOME)
+    
+    def _row(self, series):
+        row = self.rows.get(series)
+        if row is None:
+            row = self.rows[series] = len(self.rows)
+            with open(self.series_path, "a") as f:
+                f.write(series + "\n")
+        return row
+    
+    def _chunk(self, level, number, write=False):
+        """Chunk `number` of a level; a write makes it the level's open chunk, replacing the previous one"""
+        current = self.current.get(level)
+        if current is not None and current[0] == number:
+            return current[1]
+        chunk = self.chunks.pop((level, number), None)
+        if chunk is None:
+            chunk = RollupChunk(os.path.join(self.root, level, f"{number}.wh"), self.LEVELS[level][1])
+        if write:
+            if current is not None:
+                current[1].close()
+            self.current[level] = (number, chunk)
+            return chunk
+        self.chunks[(level, number)] = chunk
+        while len(self.chunks) > self.read_chunks:
+            self.chunks.popitem(last=False)[1].close()
+        return chunk
+    
+    def _has_chunk(self, level, number):
+        current = self.current.get(level)
+        return (current is not None and current[0] == number) or (level, number) in self.chunks \
+            or os.path.exists(os.path.join(self.root, level, f"{number}.wh"))
+    
+    def _add(self, row, offset, wh):
+        for level, (seconds, width) in self.LEVELS.items():
+            bucket = offset // seconds
+            self._chunk(level, bucket // width, write=True).add(row, bucket % width, wh)
+    
+    def record(self, ts, readings, totals=None):
+        """Append one power sample per device taken at `ts`; readings maps device id to watts.
+        
+        `totals` are group sums (e.g. per room) that get rollups like a device
+        but no raw samples and are not added to the whole-home series.
+        """
+        offset = int(ts - self.origin)
+        if offset < 0:
+            return
+        hours = self.interval / 3600
+        with self.lock:
+            day = offset // 86400
+            if self.segment is None or self.segment[0] != day:
+                if self.segment is not None:
+                    self.segment[1].close()
+                self.segment = (day, open(os.path.join(self.root, "raw", f"{day}.bin"), "ab"))
+            segment = self.segment[1]
+            
+            total = 0.0
+            for device_id, watts in readings.items():
+                row = self._row(device_id)
+                segment.write(self.RAW.pack(offset, row, watts))
+                self._add(row, offset, watts * hours)
+                total += watts
+            self._add(self.rows[self.HOME], offset, total * hours)
+            for series, watts in (totals or {}).items():
+                self._add(self._row(series), offset, watts * hours)
+            self.latest.update(readings)
+    
+    def buckets(self, series, level, start, end):
+        """Wh per `level` bucket for a series, from the bucket containing `start` up to `end`"""
+        seconds, width = self.LEVELS[level]
+        first = int(start - self.origin) // seconds
+        last = int(end - self.origin) // seconds
+        # Buckets before the store origin are empty
+        padding = [0.0] * (min(last, 0) - first) if first < 0 else []
+        return padding + self._read(series, level, max(first, 0), max(last, 0))
+    
+    def _read(self, series, level, first, last):
+        width = self.LEVELS[level][1]
+        row = self.rows.get(series)
+        if row is None:
+            return [0.0] * max(last - first, 0)
+        values = []
+        with self.lock:
+            bucket = first
+            while bucket < last:
+                number = bucket // width
+                stop = min(last, (number + 1) * width)
+                if self._has_chunk(level, number):
+                    values += self._chunk(level, number).read(row, bucket % width, stop - number * width)
+                else:
+                    values += [0.0] * (stop - bucket)
+                bucket = stop
+        return values
+    
+    def matrix(self, series, level, start, end):
+        """Wh per `level` bucket as an array of shape (len(series), buckets), covering [start, end)"""
+        seconds, width = self.LEVELS[level]
+        first = int(start - self.origin) // seconds
+        last = -(-int(end - self.origin) // seconds)
+        out = np.zeros((len(series), max(last - first, 0)))
+        known = [(i, self.rows[name]) for i, name in enumerate(series) if name in self.rows]
+        if not known or last <= 0:
+            return out
+        targets = np.array([i for i, _ in known])
+        rows = np.array([row for _, row in known])
+        with self.lock:
+            bucket = max(first, 0)
+            while bucket < last:
+                number = bucket // width
+                stop = min(last, (number + 1) * width)
+                if self._has_chunk(level, number):
+                    chunk = self._chunk(level, number)
+                    present = rows < chunk.rows
+                    if chunk.mm is not None and present.any():
+                        # Fancy indexing copies, so no view of the mmap outlives the lock
+                        cells = np.frombuffer(chunk.mm, dtype="<f8", count=chunk.rows * width).reshape(chunk.rows, width)
+                        out[targets[present], bucket - first:stop - first] = cells[rows[present], bucket % width:stop - number * width]
+                        del cells
+                bucket = stop
+        return out
+    
+    def energy(self, series, start, end):
+        """Wh used by a series between two timestamps, read from the coarsest rollups that fit"""
+        total = 0.0
+        for level, first, last in self._spans(max(int(start - self.origin), 0), max(int(end - self.origin), 0)):
+            total += sum(self._read(series, level, first, last))
+        return total
+    
+    def _spans(self, start, end):
+        # Split [start, end) into whole days, then whole hours, then minutes at the edges
+        spans = []
+        
+        def split(start, end, levels):
+            if start >= end:
+                return
+            level, (seconds, _) = levels[0]
+            if len(levels) == 1:
+                spans.append((level, start // seconds, -(-end // seconds)))
+                return
+            first, last = -(-start // seconds), end // seconds
+            if first >= last:
+                split(start, end, levels[1:])
+                return
+            split(start, first * seconds, levels[1:])
+            spans.append((level, first, last))
+            split(last * seconds, end, levels[1:])
+        
+        split(start, end, sorted(self.LEVELS.items(), key=lambda item: -item[1][0]))
+        return spans
+    
+    def raw(self, device_id, start, end):
+        """Raw (timestamp, watts) samples of one device; scans the day segments in range"""
+        row = self.rows.get(device_id)
+        if row is None:
+            return []
+        first, last = max(int(start - self.origin), 0), max(int(end - self.origin), 0)
+        samples = []
+        self.flush()
+        for day in range(first // 86400, last // 86400 + 1):
+            path = os.path.join(self.root, "raw", f"{day}.bin")
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                continue
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for offset, sample_row, watts in self.RAW.iter_unpack(mm):
+                    if sample_row == row and first <= offset < last:
+                        samples.append((self.origin + offset, watts))
+        return samples
+    
+    def flush(self):
+        with self.lock:
+            if self.segment is not None:
+                self.segment[1].flush()
+            for _, chunk in self.current.values():
+                if chunk.mm is not None:
+                    chunk.mm.flush()
+    
+    def close(self):
+        with self.lock:
+            if self.segment is not None:
+                self.segment[1].close()
+                self.segment = None
+            for chunk in [chunk for _, chunk in self.current.values()] + list(self.chunks.values()):
+                chunk.close()
+            self.current.clear()
+            self.chunks.clear()
+
+
+def week_hours(hours, days="everyday"):
+    """Mask over the 168 hours of a week (Monday 00:00 first) for local hours [start, end) on some days"""
+    start, end = hours
+    day_mask = np.zeros(24, bool)
+    # A period like (22, 6) wraps past midnight
+    if start <= end:
+        day_mask[start:end] = True
+    else:
+        day_mask[start:] = day_mask[:end] = True
+    mask = np.zeros((7, 24), bool)
+    mask[list(Schedule.DAYS[days])] = day_mask
+    return mask.ravel()
+
+
+class Tariff:
+    """Price of electricity for each of the 168 hours of a local week"""
+    
+    def __init__(self, base=ENERGY_PRICE, periods=ENERGY_TARIFF):
+        self.rates = np.full(168, base)
+        for period in periods:
+            self.rates[week_hours(period["hours"], period.get("days", "everyday"))] = period["price"]
+    
+    def hour_of_week(self, start, hours):
+        """Local hour-of-week index of each hour from `start`, following DST changes"""
+        stamps = start + 3600 * np.arange(hours)
+        offsets = np.fromiter((time.localtime(stamp).tm_gmtoff for stamp in stamps[::24]), float, -(-hours // 24))
+        local = stamps + np.repeat(offsets, 24)[:hours]
+        # The epoch was a Thursday; shift so that 0 is Monday 00:00
+        return ((local // 3600).astype(np.int64) + 72) % 168
+    
+    def price_at(self, ts):
+        return self.rates[self.hour_of_week(ts, 1)[0]]
+
+
+class CostEngine:
+    """Costs and what-if savings computed from hourly rollups with NumPy.
+    
+    History is read as one (series x hours) matrix, so pricing a year for
+    every device is a single matrix-vector product with the tariff. A
+    what-if is a per-device fraction of energy saved in a set of hours of
+    the week; its savings are the matching share of the real cost.
+    """
+    
+    def __init__(self, store, tariff=None):
+        self.store = store
+        self.tariff = tariff or Tariff()
+    
+    def history(self, series, start, end):
+        """Hourly Wh matrix and the hour-of-week of each of its columns"""
+        start = self.store.origin + (int(start - self.store.origin) // 3600) * 3600
+        wh = self.store.matrix(series, "hour", start, end)
+        return wh, self.tariff.hour_of_week(start, wh.shape[1])
+    
+    def cost(self, series, start, end):
+        """$ per series between two timestamps"""
+        wh, hours = self.history(series, start, end)
+        return wh @ self.tariff.rates[hours] / 1000
+    
+    def savings(self, series, start, end, what_ifs):
+        """$ saved by each what-if over the range; a what-if is (per-series fractions, 168-hour mask)"""
+        wh, hours = self.history(series, start, end)
+        prices = self.tariff.rates[hours]
+        results = []
+        for fractions, mask in what_ifs:
+            masked_cost = wh @ (prices * mask[hours]) / 1000
+            results.append(float(masked_cost @ fractions))
+        return results
+
+
+def min_max_downsample(values, columns):
+    """Indices of the min and max of each of `columns` equal slices, in time order, so peaks survive"""
+    per = max(-(-len(values) // columns), 1)
+    padded = np.pad(values, (0, per * columns - len(values)), mode="edge")
+    slices = padded.reshape(columns, per)
+    low, high = slices.argmin(axis=1), slices.argmax(axis=1)
+    indices = (np.stack([np.minimum(low, high), np.maximum(low, high)], axis=1) + per * np.arange(columns)[:, None]).ravel()
+    # Flat slices have min == max; send that point once
+    indices = indices[np.r_[True, indices[1:] != indices[:-1]]]
+    return indices[indices < len(values)]
+
+
+class StateStore:
+    """Home state persisted as a snapshot plus a write-ahead log of mutations.
+    
+    The snapshot is a marshal-encoded dump read through mmap. The log holds
+    one length-prefixed, checksummed record per mutation made after it, so
+    startup loads the snapshot and replays only the log tail; a torn record
+    at the end is dropped. A background thread fsyncs the log every
+    STATE_FSYNC_INTERVAL, so a crash loses at most that window, and folds
+    the log into a new snapshot once it grows past STATE_COMPACT_BYTES.
+    """
+    HEADER = struct.Struct("<II")
+    
+    def __init__(self, root, fsync_interval=STATE_FSYNC_INTERVAL, compact_bytes=STATE_COMPACT_BYTES):
+        os.makedirs(root, exist_ok=True)
+        self.snapshot_path = os.path.join(root, "snapshot.bin")
+        self.wal_path = os.path.join(root, "wal.log")
+        self.fsync_interval = fsync_interval
+        self.compact_bytes = compact_bytes
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.wal = None
+        self.dirty = False
+        self.dump = None
+    
+    def load(self):
+        """Return the saved state (or None) and the log records to replay on top of it"""
+        state = None
+        if os.path.exists(self.snapshot_path) and os.path.getsize(self.snapshot_path):
+            with open(self.snapshot_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                state = marshal.loads(mm)
+            self.seq = state["seq"]
+        
+        records = []
+        valid = 0
+        if os.path.exists(self.wal_path) and os.path.getsize(self.wal_path):
+            with open(self.wal_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                while valid + self.HEADER.size <= len(mm):
+                    length, crc = self.HEADER.unpack_from(mm, valid)
+                    start = valid + self.HEADER.size
+                    payload = mm[start:start + length]
+                    if len(payload) < length or zlib.crc32(payload) != crc:
+                        break
+                    record = marshal.loads(payload)
+                    # Records already folded into the snapshot are skipped
+                    if record[0] > self.seq:
+                        records.append(record)
+                        self.seq = record[0]
+                    valid = start + length
+        
+        self.wal = open(self.wal_path, "ab")
+        self.wal.truncate(valid)
+        return state, records
+    
+    def start(self, dump):
+        """Begin background fsync and compaction; dump() returns the full current state"""
+        self.dump = dump
+        threading.Thread(target=self._sync_loop, daemon=True).start()
+    
+    def append(self, op, *args):
+        with self.lock:
+            self.seq += 1
+            payload = marshal.dumps((self.seq, op) + args)
+            self.wal.write(self.HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self.dirty = True
+    
+    def sync(self):
+        with self.lock:
+            if self.dirty:
+                self.wal.flush()
+                os.fsync(self.wal.fileno())
+                self.dirty = False
+    
+    def save(self, state):
+        """Write a full snapshot atomically and start an empty log"""
+        with self.lock:
+            self._save(state)
+    
+    def compact(self):
+        # Dump under the lock so no mutation falls between snapshot and log
+        with self.lock:
+            self._save(self.dump())
+    
+    def _save(self, state):
+        state = dict(state, seq=self.seq)
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(marshal.dumps(state))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self.wal.close()
+        self.wal = open(self.wal_path, "wb")
+        self.dirty = False
+    
+    def _sync_loop(self):
+        while True:
+            time.sleep(self.fsync_interval)
+            self.sync()
+            if self.wal.tell() > self.compact_bytes:
+                self.compact()
+
+
+class ActionLog:
+    """Recent actions in a ring buffer, full history in an append-only journal.
+    
+    The journal holds one JSON line per action. A sidecar index stores a
+    fixed-size (time, device, offset) record per line, in time order; only
+    the last `size` records are read at startup, and a device's history for
+    a time range is found by bisecting the index file and read with direct
+    seeks.
+    
+    Each line is fsynced to the journal before its index record is written,
+    so after a crash the index never points past the journal. On load a
+    torn journal line or index record is cut off and journal lines the
+    index missed are indexed again.
+    """
+    INDEX = struct.Struct("<dIQ")
+    
+    def __init__(self, root, size=ACTION_LOG_SIZE):
+        os.makedirs(root, exist_ok=True)
+        self.lock = threading.Lock()
+        self.recent = deque(maxlen=size)
+        self.journal = open(os.path.join(root, "actions.jsonl"), "a+b")
+        self.index_path = os.path.join(root, "actions.idx")
+        self.index = open(self.index_path, "a+b")
+        
+        # Devices are stored in the index by row number
+        self.devices_path = os.path.join(root, "devices.txt")
+        self.device_ids = []
+        if os.path.exists(self.devices_path):
+            with open(self.devices_path) as f:
+                self.device_ids = [line.strip() for line in f]
+        self.rows = {device_id: row for row, device_id in enumerate(self.device_ids)}
+        
+        self._repair()
+        self.count = self.index.seek(0, os.SEEK_END) // self.INDEX.size
+        self.index.seek(max(self.count - size, 0) * self.INDEX.size)
+        for _, _, offset in self.INDEX.iter_unpack(self.index.read()):
+            self.recent.append(self._read(offset))
+    
+    def _repair(self):
+        """Cut torn tails off the journal and index, and index journal lines written after the last record"""
+        journal_size = self.journal.seek(0, os.SEEK_END)
+        if journal_size:
+            self.journal.seek(max(journal_size - 65536, 0))
+            tail = self.journal.read()
+            if not tail.endswith(b"\n"):
+                # A line is only indexed once complete, so a torn last line is dropped
+                cut = tail.rfind(b"\n")
+                journal_size = journal_size - len(tail) + cut + 1 if cut >= 0 else 0
+                self.journal.truncate(journal_size)
+        
+        index_size = self.index.seek(0, os.SEEK_END)
+        count = index_size // self.INDEX.size
+        indexed = 0
+        while count:
+            self.index.seek((count - 1) * self.INDEX.size)
+            _, _, offset = self.INDEX.unpack(self.index.read(self.INDEX.size))
+            if offset < journal_size:
+                self.journal.seek(offset)
+                indexed = offset + len(self.journal.readline())
+                break
+            count -= 1
+        if count * self.INDEX.size != index_size:
+            self.index.truncate(count * self.INDEX.size)
+        
+        self.journal.seek(indexed)
+        for line in self.journal.read().splitlines(keepends=True):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                self.journal.truncate(indexed)
+                break
+            self.index.write(self.INDEX.pack(entry["ts"], self._row(entry["device"]), indexed))
+            indexed += len(line)
+        self.index.flush()
+    
+    def _row(self, device_id):
+        row = self.rows.get(device_id)
+        if row is None:
+            row = self.rows[device_id] = len(self.device_ids)
+            self.device_ids.append(device_id)
+            with open(self.devices_path, "a") as f:
+                f.write(device_id + "\n")
+        return row
+    
+    def record(self, device_id, field, old, new, source="user"):
+        entry = {"ts": time.time(), "device": device_id, "field": field, "old": old, "new": new, "source": source}
+        line = (json.dumps(entry) + "\n").encode()
+        with self.lock:
+            self.journal.seek(0, os.SEEK_END)
+            offset = self.journal.tell()
+            self.journal.write(line)
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            self.index.write(self.INDEX.pack(entry["ts"], self._row(device_id), offset))
+            self.index.flush()
+            self.count += 1
+            self.recent.append(entry)
+        return entry
+    
+    def last(self, count=15):
+        """Most recent actions, newest first"""
+        with self.lock:
+            return [self.recent[-i] for i in range(1, min(count, len(self.recent)) + 1)]
+    
+    def history(self, device_id, start=0.0, end=float("inf")):
+        """Actions of one device with start <= time < end, oldest first"""
+        with self.lock:
+            row = self.rows.get(device_id)
+            if row is None or not self.count:
+                return []
+            size = self.INDEX.size
+            with open(self.index_path, "rb") as f, mmap.mmap(f.fileno(), self.count * size, access=mmap.ACCESS_READ) as mm:
+                def first_at(ts):
+                    low, high = 0, self.count
+                    while low < high:
+                        middle = (low + high) // 2
+                        if self.INDEX.unpack_from(mm, middle * size)[0] < ts:
+                            low = middle + 1
+                        else:
+                            high = middle
+                    return low
+                
+                first, last = first_at(start), first_at(end)
+                offsets = [offset for _, record_row, offset in self.INDEX.iter_unpack(mm[first * size:last * size]) if record_row == row]
+            return [self._read(offset) for offset in offsets]
+    
+    def _read(self, offset):
+        self.journal.seek(offset)
+        return json.loads(self.journal.readline())
+
+
+class Subscription:
+    """One session's feed of home changes.
+    
+    Changes are keyed, ("device", id, field) -> value or ("topic", name),
+    and a change replaces a pending one with the same key. A slow session
+    therefore gets the latest state in fewer, larger deliveries instead of
+    an ever-growing backlog. Each subscription delivers from its own
+    thread, so a slow client never holds up the others.
+    """
+    
+    def __init__(self, deliver):
+        self.deliver = deliver
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.closed = False
+        # Seconds from publish to the end of delivery for the latest changes
+        self.latency = deque(maxlen=1000)
+        self.stats = {"changes": 0, "conflated": 0, "deliveries": 0}
+        threading.Thread(target=self._run, daemon=True).start()
+    
+    def push(self, key, value, published):
+        with self.lock:
+            self.stats["changes"] += 1
+            if key in self.pending:
+                self.stats["conflated"] += 1
+                # Keep the older publish time; that is how long the key has waited
+                published = self.pending[key][1]
+            self.pending[key] = (value, published)
+            self.idle.clear()
+        self.ready.set()
+    
+    def wait_idle(self, timeout=None):
+        """Block until everything pushed so far has been delivered"""
+        return self.idle.wait(timeout)
+    
+    def close(self):
+        self.closed = True
+        self.ready.set()
+    
+    def _run(self):
+        while True:
+            self.ready.wait()
+            if self.closed:
+                return
+            with self.lock:
+                self.ready.clear()
+                batch, self.pending = self.pending, {}
+            try:
+                self.deliver({key: value for key, (value, _) in batch.items()})
+            except Exception:
+                logger.exception("Delivering home changes failed")
+            delivered = time.perf_counter()
+            self.latency.extend(delivered - published for _, published in batch.values())
+            self.stats["deliveries"] += 1
+            with self.lock:
+                if not self.pending:
+                    self.idle.set()
+
+
+class Home:
+    """The home shared by every session of the process.
+    
+    Owns the device state and everything that acts on it: persistence,
+    device I/O, scenes, rules, schedules, the action log and the energy
+    history. Sessions subscribe to it and receive per-field deltas.
+    """
+    
+    def __init__(self, devices=None, scenes=None, rules=None, schedules=None, start=True):
+        self.user_name = "Jordan Smith"
+        self.user_email = "jordan.smith@example.com"
+        
+        # Saved state wins over the defaults below unless devices are passed in
+        self.state = StateStore(os.path.join(DATA_DIR, "state"))
+        saved, log_tail = self.state.load()
+        restored = devices is None and saved is not None
+        if restored:
+            devices = [Device.from_record(record) for record in saved["devices"]]
+            scenes = saved["scenes"]
+            rules = saved.get("rules", rules)
+            schedules = saved.get("schedules", schedules)
+            self.user_name, self.user_email = saved["user"]
+        
+        # Device states
+        if devices is None:
+            devices = [
+                Light("living_room_light", "Living Room Light", "Living Room", "ON", brightness=75, color_temp=4000),
+                Light("bedroom_light", "Bedroom Light", "Bedroom", "OFF", brightness=50, color_temp=3000),
+                Lock("front_door", "Front Door", "Entrance", "ON", locked=False),
+                Thermostat("thermostat", "Thermostat", "Living Room", "Heating", current=21, target=22, mode="heat", fan="auto"),
+                Fan("ceiling_fan", "Ceiling Fan", "Bedroom", "OFF", speed=2),
+            ]
+        self.devices = DeviceRegistry(devices)
+        
+        # Scenes
+        if scenes is None:
+            scenes = [
+                {"name": "Movie Night", "actions": 2, "devices": ["light1: off", "thermostat: set (21)"]},
+                {"name": "Good Morning", "actions": 3, "devices": ["light1: on", "light2: on", "thermostat: set (23)"]},
+                {"name": "Away Mode", "actions": 4, "devices": ["light1: off", "light2: off", "door1: lock", "thermostat: set (18)"]}
+            ]
+        self.scenes = scenes
+        
+        # Automation rules
+        if rules is None:
+            rules = [
+                {"name": "Late Arrival", "when": "door1: unlock", "after": "22:00", "before": "06:00", "then": ["light1: on"]},
+                {"name": "Lock Up", "when": "door1: lock", "after": "23:00", "before": "05:00", "then": ["light1: off", "light2: off"]},
+                {"name": "Bedroom Lights Out", "when": "light2: off", "then": ["ceiling_fan: off"]},
+            ]
+        self.rule_defs = rules
+        
+        # Recurring device schedules
+        if schedules is None:
+            schedules = [
+                {"id": "thermostat-morning", "device": "thermostat", "action": "set (22)", "at": "07:00", "title": "Morning (22°C)"},
+                {"id": "thermostat-night", "device": "thermostat", "action": "set (20)", "at": "23:00", "title": "Night (20°C)"},
+                {"id": "living-room-on", "device": "living_room_light", "action": "on", "at": "07:00", "days": "weekdays", "title": "ON - Weekdays"},
+                {"id": "living-room-off", "device": "living_room_light", "action": "off", "at": "23:00", "title": "OFF - Everyday"},
+                {"id": "living-room-sunset", "device": "living_room_light", "action": "on", "at": "sunset-15", "days": "weekends", "title": "ON - Weekends"},
+            ]
+        self.schedule_defs = schedules
+        schedule_run = saved.get("schedule_run") if restored else None
+        
+        if restored:
+            # Changes made after the last snapshot
+            for _, op, *args in log_tail:
+                if op == "set":
+                    device_id, field, value = args
+                    if device_id in self.devices:
+                        self.devices.set(device_id, field, value)
+                elif op == "profile":
+                    self.user_name, self.user_email = args
+                elif op == "rule":
+                    name, enabled = args
+                    for rule in self.rule_defs:
+                        if rule["name"] == name:
+                            rule["enabled"] = enabled
+                elif op == "schedule":
+                    schedule_id, enabled = args
+                    for schedule in self.schedule_defs:
+                        if schedule["id"] == schedule_id:
+                            schedule["enabled"] = enabled
+                elif op == "schedule_run":
+                    schedule_run = args[0]
+        
+        # Counters and gauges behind the stat cards
+        self.metrics = Metrics()
+        self.metrics.set("scenes.defined", len(self.scenes))
+        # Timing of handlers, views and page updates in every session; see Instrumentation
+        self.instrumentation = Instrumentation(enabled=INSTRUMENT)
+        
+        # Room aggregates, kept current from the registry's change bus
+        self.rooms = RoomStats(self.devices, self.metrics)
+        
+        # Commands to devices run in the background; state is applied optimistically
+        self.device_io = DeviceIO(route=lambda device_id: DEVICE_PROTOCOLS[self.devices[device_id].kind])
+        # Device answers complete on DeviceIO's event loop; they are applied from this queue
+        # so the change bus listeners' file writes never stall the loop
+        self.device_results = queue.Queue()
+        threading.Thread(target=self.apply_device_results, daemon=True, name="device-results").start()
+        # Latest model/firmware/MAC/boot time each device reported when polled
+        self.device_info = {}
+        # Room temperatures move under the thermal model; see model_thermostats
+        self.thermal = ThermalModel()
+        # device id -> (target, time it is reached or None); schedule id -> preheat start, and the due time preheated for
+        self.thermal_forecast = {}
+        self.preheat_starts = {}
+        self.preheated = {}
+        self.scene_engine = SceneEngine(
+            self.devices,
+            self.update_device,
+            aliases={"light1": "living_room_light", "light2": "bedroom_light", "door1": "front_door"}
+        )
+        self.scene_engine.load(self.scenes)
+        self.rule_engine = RuleEngine(self.scene_engine.parse, self.update_device, on_fire=lambda rules: self.publish("rules"), bus=self.devices.bus)
+        self.rule_engine.load(self.rule_defs)
+        self.scheduler = Scheduler(self.scene_engine.parse, self.run_schedules, last_run=schedule_run)
+        self.scheduler.load(self.schedule_defs)
+        
+        if not restored:
+            # First run or an explicitly given home: it becomes the saved state
+            self.state.save(self.dump_state())
+        self.state.start(self.dump_state)
+        
+        self.action_log = ActionLog(os.path.join(DATA_DIR, "actions"))
+        self.metrics.add("actions.total", self.action_log.count)
+        
+        # Every device field write is saved, logged and sent to sessions from the change bus
+        self.devices.bus.subscribe(self.save_change)
+        self.devices.bus.subscribe(self.log_change)
+        self.devices.bus.subscribe(lambda change: self.publish_change(("device", change.device_id, change.field), change.value))
+        
+        # Power history, sampled in the background
+        self.energy = EnergyStore(os.path.join(DATA_DIR, "energy"))
+        self.costs = CostEngine(self.energy)
+        # (device id, days) -> (range end, chart points)
+        self.usage_cache = {}
+        
+        # Sessions following the home; replaced rather than mutated so publishers need no lock
+        self.subscriptions = ()
+        self.subscriptions_lock = threading.Lock()
+        
+        self.started = False
+        if start:
+            self.start()
+    
+    def start(self):
+        """Start energy sampling, device polling and schedules; repeated calls do nothing"""
+        if self.started:
+            return
+        self.started = True
+        threading.Thread(target=self.sample_energy, daemon=True).start()
+        threading.Thread(target=self.poll_devices, daemon=True).start()
+        threading.Thread(target=self.model_thermostats, daemon=True).start()
+        self.scheduler.start()
+    
+    def dump_state(self):
+        """Everything StateStore keeps, in snapshot form"""
+        return {
+            "devices": [device.to_record() for device in self.devices],
+            "scenes": self.scenes,
+            "rules": self.rule_defs,
+            "schedules": self.schedule_defs,
+            "schedule_run": self.scheduler.last_run,
+            "user": (self.user_name, self.user_email),
+        }
+    
+    def subscribe(self, deliver):
+        """Start feeding changes to `deliver(changes)`; see Subscription"""
+        subscription = Subscription(deliver)
+        with self.subscriptions_lock:
+            self.subscriptions += (subscription,)
+        return subscription
+    
+    def unsubscribe(self, subscription):
+        with self.subscriptions_lock:
+            self.subscriptions = tuple(s for s in self.subscriptions if s is not subscription)
+        subscription.close()
+    
+    def publish_change(self, key, value):
+        published = time.perf_counter()
+        for subscription in self.subscriptions:
+            subscription.push(key, value, published)
+    
+    def publish(self, *topics):
+        """Tell sessions that state behind the topics changed"""
+        for topic in topics:
+            self.publish_change(("topic", topic), None)
+    
+    def update_device(self, device_id, field, value, source="user", on_failure=None):
+        """Single entry point for device state changes.
+        
+        The value is applied at once and the command is sent to the device in
+        the background; the returned Future resolves when the device answers.
+        If it does not, the change is reverted and `on_failure(device)` called.
+        """
+        old = self.apply_state(device_id, field, value, source)
+        future = self.device_io.submit(device_id, field, value)
+        future.add_done_callback(lambda f: self.device_results.put((device_id, field, value, old, f, on_failure)))
+        return future
+    
+    def run_schedules(self, due, schedules):
+        """Scheduler callback: start every action due at one instant, then record the run"""
+        for schedule in schedules:
+            action = schedule.action
+            self.update_device(action.device_id, action.field, action.value, f"schedule: {schedule.definition.get('title', schedule.id)}")
+        self.state.append("schedule_run", due)
+        if schedules:
+            self.publish("schedules")
+    
+    def apply_state(self, device_id, field, value, source):
+        """Write device state; the change bus listeners save, log and publish it"""
+        old = self.devices.set(device_id, field, value, source)
+        if old == value:
+            # Published anyway so sessions drop stale slider previews
+            self.publish_change(("device", device_id, field), value)
+        return old
+    
+    def save_change(self, change):
+        self.state.append("set", change.device_id, change.field, change.value)
+    
+    def log_change(self, change):
+        """Record a change in the action log; "sensor" readings such as room temperatures and heating status are not actions"""
+        if change.source != "sensor":
+            self.action_log.record(change.device_id, change.field, change.old, change.value, change.source)
+            self.metrics.add("actions.total")
+    
+    def apply_device_results(self):
+        while True:
+            result = self.device_results.get()
+            try:
+                self.on_device_result(*result)
+            except Exception:
+                logger.exception("Applying the device answer for %s.%s failed", result[0], result[1])
+    
+    def on_device_result(self, device_id, field, value, old, future, on_failure):
+        current = getattr(self.devices[device_id], field)
+        if not future.cancelled() and future.exception() is None:
+            reported = future.result()
+            # Devices may adjust a value (e.g. clamp it); trust their answer
+            if reported is not None and reported != value and current == value:
+                self.apply_state(device_id, field, reported, "device")
+            return
+        
+        # Revert unless a newer change has replaced ours in the meantime
+        if current == value and old != value:
+            self.apply_state(device_id, field, old, "revert")
+        if on_failure is not None:
+            on_failure(self.devices[device_id])
+    
+    def current_power(self):
+        return self.metrics.value("power.watts")
+    
+    def activate_scene(self, name):
+        self.metrics.add("scenes.activated")
+        return self.scene_engine.activate(name)
+    
+    @staticmethod
+    def room_series(room):
+        return f"room:{room}"
+    
+    def most_used_room(self, days=30):
+        """Room that used the most energy over the last `days`, or draws the most now without history"""
+        now = time.time()
+        rooms = list(self.rooms)
+        if not rooms:
+            return None
+        used = self.energy.matrix([self.room_series(room["room"]) for room in rooms], "day", now - days * 86400, now).sum(axis=1)
+        if used.any():
+            return rooms[int(used.argmax())]["room"]
+        return max(rooms, key=lambda room: room["watts"])["room"]
+    
+    def sample_energy(self):
+        while True:
+            readings = {device.id: device_power(device) for device in list(self.devices)}
+            rooms = {self.room_series(room["room"]): room["watts"] for room in self.rooms}
+            now = time.time()
+            self.energy.record(now, readings, totals=rooms)
+            # Last 30 days against the 30 before them
+            month = 30 * 86400
+            saved = self.energy.energy(EnergyStore.HOME, now - 2 * month, now - month) - self.energy.energy(EnergyStore.HOME, now - month, now)
+            self.metrics.set("energy.saved_kwh", max(saved, 0.0) / 1000)
+            self.publish("energy")
+            time.sleep(ENERGY_SAMPLE_INTERVAL)
+    
+    def poll_devices(self):
+        """Read every device's state and info in bulk and adopt what the devices report"""
+        while True:
+            mark = self.device_io.mark()
+            try:
+                reports = self.device_io.poll([device.id for device in self.devices]).result()
+            except Exception:
+                logger.exception("Device poll failed")
+            else:
+                for device_id, report in reports.items():
+                    self.device_info[device_id] = report["info"]
+                    device = self.devices.by_id.get(device_id)
+                    for field, value in report["state"].items():
+                        # Commands sent since the poll started win over what it read
+                        if device is not None and getattr(device, field) != value and self.device_io.settled(device_id, field, mark):
+                            self.apply_state(device_id, field, value, "device")
+                self.publish("device_info")
+            time.sleep(DEVICE_POLL_INTERVAL)
+    
+    def model_thermostats(self):
+        """Advance every zone's temperature, forecast the horizon and start due preheats, once per model step"""
+        last = None
+        while True:
+            now = time.time()
+            thermostats = self.devices.find(kind="thermostat")
+            if last is not None and thermostats:
+                current = np.array([device.current for device in thermostats], dtype=float)
+                heating = np.array([ThermalModel.HEATING.get(device.status, 0) for device in thermostats])
+                current = self.thermal.advance(current, heating, self.thermal.outdoor(last)[0], now - last)
+                for device, temperature in zip(thermostats, current.round(1).tolist()):
+                    self.devices.set(device.id, "current", temperature, "sensor")
+            last = now
+            schedules = [schedule for schedule in list(self.scheduler.schedules.values())
+                         if schedule.enabled and schedule.due is not None and schedule.action.field == "target"]
+            forecast = self.thermal.forecast(thermostats, schedules, now)
+            for device, heating, step in zip(thermostats, forecast["heating"].tolist(), forecast["reaches"].tolist()):
+                if device.status != "OFF" and device.status != ThermalModel.STATUS[heating]:
+                    # Derived like the temperature, so not an action either
+                    self.devices.set(device.id, "status", ThermalModel.STATUS[heating], "sensor")
+                self.thermal_forecast[device.id] = (device.target, None if step < 0 else now + step * self.thermal.step)
+            
+            # A preheat keeps its start until its schedule has run
+            by_id = {schedule.id: schedule for schedule in schedules}
+            self.preheat_starts = {schedule_id: start for schedule_id, start in self.preheat_starts.items()
+                                   if schedule_id in by_id and self.preheated.get(schedule_id) == by_id[schedule_id].due}
+            for schedule_id, start in forecast["preheat"].items():
+                schedule = by_id[schedule_id]
+                if self.preheated.get(schedule_id) == schedule.due:
+                    continue
+                self.preheat_starts[schedule_id] = start
+                if start <= now:
+                    self.preheated[schedule_id] = schedule.due
+                    action = schedule.action
+                    self.update_device(action.device_id, action.field, action.value, f"preheat: {schedule.definition.get('title', schedule.id)}")
+            self.publish("thermal")
+            time.sleep(self.thermal.step)
+    
+    def thermal_outlook(self, device_id):
+        """One line on when a thermostat reaches its target, from the last forecast"""
+        target, reaches = self.thermal_forecast.get(device_id, (None, None))
+        if target is None:
+            return "Forecasting…"
+        if reaches is None:
+            return f"Won't reach {target}°C in the next {self.thermal.steps * self.thermal.step // 3600} h"
+        if reaches - time.time() < self.thermal.step:
+            return f"Holding {target}°C"
+        return f"Reaches {target}°C at {datetime.fromtimestamp(reaches).strftime('%H:%M')}"
+    
+    def describe_device(self, device_id):
+        """Information rows for a device's detail view, from its last poll"""
+        info = self.device_info.get(device_id)
+        if info is None:
+            return [("Device Model", "—"), ("Firmware", "—"), ("MAC Address", "—"), ("Uptime", "—")]
+        uptime = int(time.time() - info["booted"]) // 60
+        return [
+            ("Device Model", info["model"]),
+            ("Firmware", info["firmware"]),
+            ("MAC Address", info["mac"]),
+            ("Uptime", f"{uptime // 1440}d {uptime // 60 % 24}h {uptime % 60}m"),
+            ("Connection", self.device_io.driver(device_id).describe()),
+        ]
+
+
+# Card colors and icon per device kind: (background, icon, icon color)
+CARD_STYLES = {
+    "light": (ft.Colors.YELLOW_100, ft.Icons.LIGHTBULB, ft.Colors.YELLOW_700),
+    "lock": (ft.Colors.BLUE_100, ft.Icons.DOOR_SLIDING, ft.Colors.BLUE_700),
+}
+
+# Icon and icon color per device kind on the statistics page
+STAT_ICONS = {
+    "light": (ft.Icons.LIGHTBULB, ft.Colors.ORANGE_400),
+    "lock": (ft.Icons.DOOR_SLIDING, ft.Colors.GREY_400),
+    "thermostat": (ft.Icons.THERMOSTAT, ft.Colors.RED_400),
+    "fan": (ft.Icons.AIR, ft.Colors.CYAN_400),
+}
+
+
+@lru_cache(maxsize=None)
+def shared_button_style(color=None, bgcolor=None, radius=None, side=None):
+    """ButtonStyle shared by every button asking for the same look; never mutate it.
+    
+    Colors belong here rather than on the button, and shape and side are
+    wrapped per control state up front, so a button's before_update leaves
+    the shared object as it is.
+    """
+    return ft.ButtonStyle(
+        color=color,
+        bgcolor=bgcolor,
+        shape={ft.ControlState.DEFAULT: ft.RoundedRectangleBorder(radius=radius)} if radius is not None else None,
+        side={ft.ControlState.DEFAULT: ft.BorderSide(*side)} if side is not None else None,
+    )
+
+
+@lru_cache(maxsize=None)
+def shared_border(width, color):
+    return ft.border.all(width, color)
+
+
+@lru_cache(maxsize=None)
+def shared_padding(left=0, top=0, right=0, bottom=0):
+    return ft.padding.only(left=left, top=top, right=right, bottom=bottom)
+
+
+@lru_cache(maxsize=None)
+def shared_margin(left=0, top=0, right=0, bottom=0):
+    return ft.margin.only(left=left, top=top, right=right, bottom=bottom)
+
+
+class ControlTemplate:
+    """A control tree built once and copied for every card that uses it.
+    
+    `build()` returns the tree and a dict naming the controls each copy
+    fills in; clone() returns a fresh (tree, parts) pair. Copying the
+    controls' attribute dicts is several times cheaper than running the
+    constructors and property setters again. Style objects are shared by
+    all copies, so templates use only the shared styles above, and event
+    handlers are set on the copies. With `enabled` off every clone is
+    built from scratch, which is how benchmark.py measures the difference.
+    
+    Copying relies on Flet internals, so templates are only enabled on the
+    FLET_VERIFIED release line, and the first clone of each template is
+    checked: if two copies share any mutable object (see `shared`), that
+    template falls back to building every card.
+    """
+    
+    enabled = ft.version.version.startswith(FLET_VERIFIED)
+    
+    def __init__(self, build):
+        self.build = build
+        self.tree = None
+        self.slots = None
+        self.safe = True
+        self.lock = threading.Lock()
+    
+    def clone(self):
+        if not self.enabled or not self.safe:
+            return self.build()
+        if self.tree is None:
+            with self.lock:
+                if self.tree is None:
+                    tree, parts = self.build()
+                    self.slots = {id(control): name for name, control in parts.items()}
+                    shared = self.shared(self._copy(tree, {}), self._copy(tree, {}))
+                    if shared:
+                        logger.warning("Card template %s shares %s between copies; building cards instead", self.build.__name__, ", ".join(sorted(shared)))
+                        self.safe = False
+                        return self.build()
+                    self.tree = tree
+        parts = {}
+        return self._copy(self.tree, parts), parts
+    
+    def _copy(self, control, parts):
+        state = control.__dict__.copy()
+        handlers = {}
+        for name, value in state.items():
+            if isinstance(value, ft.Control):
+                state[name] = self._copy(value, parts)
+            elif type(value) is list:
+                state[name] = [self._copy(item, parts) if isinstance(item, ft.Control) else item for item in value]
+            elif type(value) is dict:
+                state[name] = value.copy()
+            elif isinstance(value, EventHandler):
+                # Typed events (e.g. Container.on_tap_down) keep their callback on an EventHandler
+                state[name] = handlers[id(value)] = object.__new__(EventHandler)
+                state[name].__dict__ = value.__dict__.copy()
+        if handlers:
+            # The control's event table holds closures over the template's EventHandlers
+            events = state["_Control__event_handlers"]
+            for event, function in events.items():
+                owners = [handlers.get(id(cell.cell_contents)) for cell in getattr(function, "__closure__", None) or ()]
+                owner = next((handler for handler in owners if handler is not None), None)
+                if owner is not None:
+                    events[event] = owner.get_handler()
+        # A copy belongs to no page until it is added to one
+        state.update({"_Control__page": None, "_Control__uid": None, "_id": None, "parent": None, "_Control__previous_children": []})
+        copy = object.__new__(type(control))
+        copy.__dict__ = state
+        name = self.slots.get(id(control))
+        if name is not None:
+            parts[name] = copy
+        return copy
+    
+    @classmethod
+    def shared(cls, first, second, path=""):
+        """Attributes two copies of one tree both point at, other than values never mutated in place.
+        
+        Strings, numbers, enums, functions and dataclass instances (the
+        shared style objects) may be shared; anything else means a change
+        to one card would show on the other.
+        """
+        found = set()
+        for name, value in first.__dict__.items():
+            other = second.__dict__.get(name)
+            where = f"{path}{type(first).__name__}.{name}"
+            if isinstance(value, ft.Control):
+                found |= cls.shared(value, other, where + ".") if value is not other else {where}
+            elif isinstance(value, (list, dict)):
+                if value is other:
+                    found.add(where)
+                elif type(value) is list:
+                    for item, other_item in zip(value, other):
+                        if isinstance(item, ft.Control):
+                            found |= cls.shared(item, other_item, where + ".") if item is not other_item else {where}
+            elif value is other and not (
+                value is None or isinstance(value, (str, int, float, tuple, frozenset, enum.Enum))
+                or callable(value) and not isinstance(value, EventHandler) or dataclasses.is_dataclass(value)
+            ):
+                found.add(where)
+        return found
+
+
+def card_header(icon, title, lines):
+    """Icon badge with a title and status lines, as on every dashboard card"""
+    return ft.Row([
+        ft.Container(
+            content=icon,
+            width=60,
+            height=60,
+            bgcolor=ft.Colors.WHITE,
+            border_radius=30,
+            alignment=ft.alignment.center
+        ),
+        ft.Column([title, *lines], spacing=2, expand=True)
+    ], spacing=15)
+
+
+def build_device_card():
+    parts = {
+        "icon": ft.Icon(size=30),
+        "name": ft.Text(size=16, weight=ft.FontWeight.BOLD, color="#1a1f2e"),
+        "status": ft.Text(size=12, color="#1a1f2e"),
+        "hint": ft.Text(size=10, color="#666"),
+        "details": ft.TextButton("Details", style=shared_button_style(color="#5b4fc7")),
+        "action": ft.ElevatedButton(style=shared_button_style(color=ft.Colors.WHITE, bgcolor="#1a1f2e", radius=20)),
+    }
+    parts["card"] = ft.Container(
+        content=ft.Column([
+            card_header(parts["icon"], parts["name"], [parts["status"], parts["hint"]]),
+            ft.Container(height=15),
+            ft.Row([parts["details"], ft.Container(expand=True), parts["action"]])
+        ], spacing=10),
+        width=300,
+        padding=20,
+        border_radius=15
+    )
+    return parts["card"], parts
+
+
+def build_slider_card(kind):
+    """Thermostat or fan card: header, slider row, value label and a Details link"""
+    color, light, hint, bgcolor, icon = {
+        "thermostat": ("#8b5a5a", "#a88", "Use slider to change", "#ffe5e5", ft.Icon(ft.Icons.THERMOSTAT, color=ft.Colors.RED_400, size=30)),
+        "fan": ("#4a7c7c", "#6aa", "0 = OFF, 3 = MAX", "#d4f4f4", ft.Icon(ft.Icons.AIR, color=ft.Colors.CYAN_600, size=30)),
+    }[kind]
+    parts = {
+        "name": ft.Text(size=16, weight=ft.FontWeight.BOLD, color=color),
+        "status": ft.Text(size=12, color=color),
+        "value": ft.Text(size=12, color=color),
+        "details": ft.TextButton("Details", style=shared_button_style(color=color)),
+    }
+    if kind == "thermostat":
+        parts["slider"] = ft.Slider(min=15, max=30, active_color=ft.Colors.BLUE_400, thumb_color=ft.Colors.BLUE_600, expand=True)
+        control = ft.Row([
+            ft.Icon(ft.Icons.AC_UNIT, color=ft.Colors.BLUE_300, size=20),
+            parts["slider"],
+            ft.Icon(ft.Icons.LOCAL_FIRE_DEPARTMENT, color=ft.Colors.RED_300, size=20),
+        ], spacing=10)
+    else:
+        parts["slider"] = control = ft.Slider(min=0, max=3, divisions=3, active_color=ft.Colors.CYAN_400, thumb_color=ft.Colors.CYAN_600)
+    card = ft.Container(
+        content=ft.Column([
+            card_header(icon, parts["name"], [parts["status"], ft.Text(hint, size=10, color=light)]),
+            ft.Container(height=10),
+            control,
+            parts["value"],
+            parts["details"],
+        ], spacing=10),
+        width=450,
+        padding=20,
+        bgcolor=bgcolor,
+        border_radius=15
+    )
+    return card, parts
+
+
+def build_stat_card():
+    parts = {
+        "label": ft.Text(size=12, color=ft.Colors.GREY_400),
+        "value": ft.Text(size=24, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
+    }
+    card = ft.Container(
+        content=ft.Column([parts["label"], parts["value"]], spacing=5, horizontal_alignment=ft.CrossAxisAlignment.START),
+        padding=20,
+        border_radius=12,
+        expand=True
+    )
+    return card, parts
+
+
+def build_large_stat_card():
+    parts = {
+        "icon": ft.Icon(color=ft.Colors.BLUE_700, size=30),
+        "value": ft.Text(size=28, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
+        "label": ft.Text(size=12, color=ft.Colors.GREY_400),
+    }
+    parts["badge"] = ft.Container(content=parts["icon"], width=60, height=60, border_radius=30, alignment=ft.alignment.center)
+    card = ft.Container(
+        content=ft.Row([parts["badge"], ft.Column([parts["value"], parts["label"]], spacing=2)], spacing=15),
+        padding=20,
+        bgcolor="#1a2332",
+        border_radius=12,
+        expand=True
+    )
+    return card, parts
+
+
+def build_mode_button():
+    parts = {"icon": ft.Icon(size=24), "text": ft.Text(size=12)}
+    button = ft.Container(
+        content=ft.Column([parts["icon"], parts["text"]], horizontal_alignment=ft.CrossAxisAlignment.CENTER, spacing=5),
+        width=90,
+        height=80,
+        border_radius=8,
+        alignment=ft.alignment.center
+    )
+    return button, parts
+
+
+def build_schedule_item():
+    parts = {
+        "title": ft.Text(size=14, color=ft.Colors.WHITE),
+        "when": ft.Text(size=12, color=ft.Colors.GREY_400),
+        "switch": ft.Switch(active_color=ft.Colors.BLUE_600),
+    }
+    row = ft.Row([ft.Column([parts["title"], parts["when"]], spacing=2), ft.Container(expand=True), parts["switch"]])
+    return row, parts
+
+
+def build_info_row():
+    parts = {
+        "label": ft.Text(size=12, color=ft.Colors.GREY_400),
+        "value": ft.Text(size=12, color=ft.Colors.WHITE, weight=ft.FontWeight.BOLD),
+    }
+    return ft.Row([parts["label"], ft.Container(expand=True), parts["value"]]), parts
+
+
+# Prebuilt trees the card factories of SmartHomeApp copy
+CARD_TEMPLATES = {
+    "device": ControlTemplate(build_device_card),
+    "thermostat": ControlTemplate(lambda: build_slider_card("thermostat")),
+    "fan": ControlTemplate(lambda: build_slider_card("fan")),
+    "stat": ControlTemplate(build_stat_card),
+    "large stat": ControlTemplate(build_large_stat_card),
+    "mode": ControlTemplate(build_mode_button),
+    "schedule": ControlTemplate(build_schedule_item),
+    "info": ControlTemplate(build_info_row),
+}
+
 
 class SmartHomeApp:
-    def __init__(self, page: ft.Page):
+    def __init__(self, page: ft.Page, home=None, devices=None, scenes=None, rules=None, schedules=None, load_home=None, timeline=None):
         self.page = page
         self.page.title = "SmartHome"
         self.page.theme_mode = ft.ThemeMode.DARK
         self.page.padding = 0
         self.page.bgcolor = "#0f1419"
         
+        # Startup milestones; a session without a shared timeline counts from here
+        self.timeline = timeline or StartupTimeline(time.perf_counter())
+        
         # App state
         self.current_view = "dashboard"
-        self.user_name = "Jordan Smith"
-        self.user_email = "jordan.smith@example.com"
+        self.power_text = None
         
-        # Device states
-        self.devices = {
-            "living_room_light": {"status": "ON", "brightness": 75, "color_temp": 4000},
-            "bedroom_light": {"status": "OFF", "brightness": 50, "color_temp": 3000},
-            "front_door": {"status": "ON", "locked": False},
-            "thermostat": {"status": "Heating", "current": 21, "target": 22, "mode": "heat", "fan": "auto"},
-            "ceiling_fan": {"status": "OFF", "speed": 2}
-        }
+        # All page updates go through the scheduler and are sent once per frame
+        self.updates = UpdateScheduler(self.page)
         
-        # Scenes
-        self.scenes = [
-            {"name": "Movie Night", "actions": 2, "devices": ["light1: off", "thermostat: set (21)"]},
-            {"name": "Good Morning", "actions": 3, "devices": ["light1: on", "light2: on", "thermostat: set (23)"]},
-            {"name": "Away Mode", "actions": 4, "devices": ["light1: off", "light2: off", "door1: lock", "thermostat: set (18)"]}
-        ]
+        # Other views are cached until a state topic they depend on changes
+        self.versions = {}
+        self.view_cache = OrderedDict()
+        self.view_stats = {}
+        # (key, build, depends, live) of the cached view on screen, None on the dashboard;
+        # the lock keeps a re-show from another thread from undoing navigation
+        self.shown = None
+        self.view_lock = threading.RLock()
+        
+        # Dashboard is built once and patched in place afterwards. Only the cards
+        # of shown pages are built; the most recently shown are kept for reuse
+        self.dashboard = None
+        # Controls patched in place: device id or topic -> [(control, attr, render, owner)],
+        # where owner is the key of the cached view that built them (None for the dashboard)
+        self.bindings = {}
+        self.topic_bindings = {}
+        self.binding_owner = None
+        self.card_cache = OrderedDict()
+        # Page and filters of each paged device list, kept across view rebuilds
+        self.pagers = {}
         
-        self.main_content = ft.Container()
+        # Set once the home is loaded; the overlay is created when first opened
+        self.instrumentation = None
+        self.debug_overlay = None
+        self.debug_thread = None
+        
+        # The shell (sidebar and a spinner) is on screen before any state is loaded
+        self.main_content = ft.Container(
+            content=ft.ProgressRing(width=32, height=32, color=ft.Colors.BLUE_400),
+            alignment=ft.alignment.center
+        )
         self.build_ui()
+        self.timeline.mark("first paint")
+        
+        # Every session of the process shares one home
+        if home is None:
+            home = load_home() if load_home else Home(devices, scenes, rules, schedules)
+        self.home = home
+        self.timeline.mark("state load")
+        self.devices = self.home.devices
+        self.scenes = self.home.scenes
+        self.scene_engine = self.home.scene_engine
+        self.rule_engine = self.home.rule_engine
+        self.scheduler = self.home.scheduler
+        self.action_log = self.home.action_log
+        self.energy = self.home.energy
+        self.costs = self.home.costs
+        self.state = self.home.state
+        
+        # Page update counters join the home's metrics; handlers, view builds and
+        # page updates are timed while instrumentation is on
+        self.updates.metrics = self.home.metrics
+        self.instrumentation = self.home.instrumentation
+        self.instrumentation.watch(self.page, self.updates)
+        for name in dir(type(self)):
+            if name.startswith("show_") and name not in ("show_view", "show_device_failure"):
+                setattr(self, name, self.instrumentation.timed(f"view.{name[5:]}", getattr(self, name), self.view_counter(name[5:])))
+        self.page.on_keyboard_event = self.on_keyboard
+        
+        self.main_content.alignment = None
+        self.show_dashboard(progressive=True)
+        self.subscription = self.home.subscribe(self.on_home_change)
+        self.page.on_close = lambda e: self.home.unsubscribe(self.subscription)
+        self.timeline.mark("interactive")
     
     def build_ui(self):
         # Sidebar
@@ -42,7 +3321,9 @@ class SmartHomeApp:
                         ft.Icon(ft.Icons.HOME, color=ft.Colors.BLUE_400, size=24),
                         ft.Text("SmartHome", size=20, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE)
                     ]),
-                    padding=20
+                    padding=20,
+                    # Wall panels have no keyboard for Ctrl+Shift+D
+                    on_long_press=lambda e: self.toggle_debug_overlay()
                 ),
                 ft.Container(height=20),
                 self.create_nav_item(ft.Icons.DASHBOARD, "Dashboard", "dashboard"),
@@ -56,7 +3337,7 @@ class SmartHomeApp:
             ], spacing=0),
             width=220,
             bgcolor="#1a1f2e",
-            padding=ft.padding.only(top=10, bottom=10)
+            padding=shared_padding(top=10, bottom=10)
         )
         
         # Main layout
@@ -71,7 +3352,6 @@ class SmartHomeApp:
         ], spacing=0, expand=True)
         
         self.page.add(layout)
-        self.show_dashboard()
     
     def create_nav_item(self, icon, text, view_name, selected=False):
         is_selected = self.current_view == view_name
@@ -84,242 +3364,465 @@ class SmartHomeApp:
                 self.show_profile()
             elif view_name == "scenes":
                 self.show_scenes()
+            elif view_name == "automations":
+                self.show_automations()
             elif view_name == "rooms":
-                self.show_statistics()
-            self.page.update()
+                self.show_rooms()
         
         return ft.Container(
             content=ft.Row([
                 ft.Icon(icon, color=ft.Colors.WHITE if is_selected else ft.Colors.GREY_400, size=20),
                 ft.Text(text, color=ft.Colors.WHITE if is_selected else ft.Colors.GREY_400, size=14)
             ], spacing=15),
-            padding=ft.padding.only(left=20, right=20, top=12, bottom=12),
+            padding=shared_padding(left=20, right=20, top=12, bottom=12),
             bgcolor=ft.Colors.BLUE_700 if is_selected else None,
             border_radius=8,
-            margin=ft.margin.only(left=10, right=10),
+            margin=shared_margin(left=10, right=10),
             on_click=on_click,
             ink=True
         )
 
-    def show_dashboard(self):
-        """Main dashboard view with all devices"""
-        self.main_content.content = ft.Column([
-            # On/Off Devices Section
-            ft.Text("On/Off Devices", size=24, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
-            ft.Container(height=20),
-            ft.Row([
-                self.create_device_card(
-                    "Living Room Light",
-                    "living_room_light",
-                    ft.Colors.YELLOW_100,
-                    ft.Icons.LIGHTBULB,
-                    ft.Colors.YELLOW_700,
-                    "light"
-                ),
-                self.create_device_card(
-                    "Bedroom Light",
-                    "bedroom_light",
-                    ft.Colors.YELLOW_100,
-                    ft.Icons.LIGHTBULB,
-                    ft.Colors.YELLOW_700,
-                    "light"
-                ),
-                self.create_device_card(
-                    "Front Door",
-                    "front_door",
-                    ft.Colors.BLUE_100,
-                    ft.Icons.DOOR_SLIDING,
-                    ft.Colors.BLUE_700,
-                    "door"
-                ),
-            ], spacing=20),
-            
-            ft.Container(height=30),
+    def show_dashboard(self, progressive=False):
+        """Main dashboard view with all devices.
+        
+        A progressive first build sends each section as soon as it is built,
+        top to bottom, so the devices appear before the energy monitor is done.
+        """
+        with self.view_lock:
+            self.shown = None
+            if self.dashboard is None and progressive:
+                self.dashboard = ft.Column(scroll=ft.ScrollMode.AUTO)
+                self.main_content.content = self.dashboard
+                for section in self.dashboard_sections():
+                    self.dashboard.controls.extend(section())
+                    self.updates.request(self.main_content)
+                    self.updates.flush()
+                return
+            if self.dashboard is None:
+                self.dashboard = self.build_dashboard()
+            else:
+                # Catch up on changes made from other views
+                for device_id in self.bindings:
+                    self.patch_device(device_id, send=False)
             
-            # Slider Controlled Devices
-            ft.Text("Slider Controlled Devices", size=24, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
-            ft.Container(height=20),
-            ft.Row([
-                self.create_thermostat_card(),
-                self.create_fan_card(),
-            ], spacing=20),
+            self.main_content.content = self.dashboard
+            self.updates.request(self.main_content)
+    
+    def show_view(self, key, build, depends, live=False):
+        """Show a cached view, rebuilding it only if state it depends on has changed since.
+        
+        While a view is open its bound controls are patched in place; only a
+        `live` view, one holding no user input, is rebuilt when a dependency
+        changes.
+        """
+        with self.view_lock:
+            versions = [self.versions.get(topic, 0) for topic in depends]
+            stats = self.view_stats.setdefault(key[0], {"builds": 0, "hits": 0, "build_ms": 0.0})
+            metrics = self.home.metrics
+            cached = self.view_cache.get(key)
+            if cached is not None and cached[0] == versions:
+                stats["hits"] += 1
+                metrics.add(f"views.{key[0]}.hits")
+                self.view_cache.move_to_end(key)
+                view = cached[1]
+            else:
+                started = time.perf_counter()
+                self.drop_bindings(key)
+                self.binding_owner = key
+                try:
+                    view = build()
+                finally:
+                    self.binding_owner = None
+                elapsed = (time.perf_counter() - started) * 1000
+                stats["build_ms"] += elapsed
+                stats["builds"] += 1
+                metrics.add(f"views.{key[0]}.builds")
+                metrics.add(f"views.{key[0]}.build_ms", elapsed)
+                self.view_cache[key] = (versions, view)
+                self.view_cache.move_to_end(key)
+                while len(self.view_cache) > VIEW_CACHE_SIZE:
+                    evicted, _ = self.view_cache.popitem(last=False)
+                    self.drop_bindings(evicted)
+                    metrics.add("views.evicted")
             
-            ft.Container(height=30),
+            self.shown = (key, build, depends, live)
+            self.main_content.content = view
+            self.updates.request(self.main_content)
+    
+    def bump(self, *topics):
+        """Invalidate cached views depending on any of the topics"""
+        for topic in topics:
+            self.versions[topic] = self.versions.get(topic, 0) + 1
+    
+    def view_cache_report(self):
+        """Per-view build count, cache hit rate and average build time of this session"""
+        return view_cache_report(self.view_stats)
+    
+    def view_counter(self, view):
+        """Records how many controls the shown view has, after an instrumented show_*"""
+        def count():
+            self.instrumentation.record(f"view.{view}.controls", count_controls(self.main_content.content), first=1)
+        return count
+    
+    def on_keyboard(self, e):
+        if e.ctrl and e.shift and e.key == "D":
+            self.toggle_debug_overlay()
+    
+    def toggle_debug_overlay(self):
+        """Show or hide the live instrumentation panel over the current view"""
+        if self.instrumentation is None:
+            return
+        if self.debug_overlay is None:
+            def switch(e):
+                self.instrumentation.enabled = e.control.value
             
+            self.debug_switch = ft.Switch(label="Record", value=self.instrumentation.enabled, on_change=switch)
+            self.debug_text = ft.Text(size=11, font_family="monospace", color=ft.Colors.GREEN_200)
+            self.debug_overlay = ft.Container(
+                content=ft.Column([
+                    ft.Row([ft.Text("Instrumentation", size=14, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE), ft.Container(expand=True), self.debug_switch]),
+                    self.debug_text,
+                ], spacing=8, tight=True),
+                right=20,
+                bottom=20,
+                width=560,
+                padding=15,
+                bgcolor=ft.Colors.with_opacity(0.9, "#0f1419"),
+                border=shared_border(1, "#2a3342"),
+                border_radius=10,
+                visible=False
+            )
+            self.page.overlay.append(self.debug_overlay)
+        self.debug_overlay.visible = not self.debug_overlay.visible
+        self.updates.request()
+        if self.debug_overlay.visible and not (self.debug_thread and self.debug_thread.is_alive()):
+            self.debug_thread = threading.Thread(target=self.refresh_debug_overlay, daemon=True)
+            self.debug_thread.start()
+    
+    def refresh_debug_overlay(self):
+        # Until hidden or the session closes
+        while self.debug_overlay.visible and self.subscription in self.home.subscriptions:
+            report = self.instrumentation.report()
+            # Where the most time went first
+            busiest = sorted(report.items(), key=lambda item: item[1]["count"] * item[1]["mean"], reverse=True)[:14]
+            lines = [f"{'':34}{'n':>6}{'p50':>9}{'p95':>9}{'max':>9}"]
+            lines += [f"{name[:34]:34}{h['count']:>6}{h['p50']:>9.1f}{h['p95']:>9.1f}{h['max']:>9.1f}" for name, h in busiest]
+            if not busiest:
+                lines.append("Nothing recorded yet" if self.instrumentation.enabled else "Recording is off")
+            self.debug_text.value = "\n".join(lines)
+            self.debug_switch.value = self.instrumentation.enabled
+            self.updates.request(self.debug_text, self.debug_switch)
+            time.sleep(1)
+    
+    def bind(self, device_id, control, attr, render):
+        """Bind a control attribute to a device entry so it can be patched in place"""
+        setattr(control, attr, render(self.devices[device_id]))
+        self.bindings.setdefault(device_id, []).append((control, attr, render, self.binding_owner))
+        return control
+    
+    def bind_topic(self, topic, control, attr, render):
+        """Bind a control attribute to `render()`, patched in place whenever the topic is published"""
+        setattr(control, attr, render())
+        self.topic_bindings.setdefault(topic, []).append((control, attr, render, self.binding_owner))
+        return control
+    
+    def drop_bindings(self, owner):
+        """Forget the bindings of a cached view that is rebuilt or evicted"""
+        for bindings in (self.bindings, self.topic_bindings):
+            for key, entries in list(bindings.items()):
+                kept = [entry for entry in entries if entry[3] != owner]
+                if len(kept) != len(entries):
+                    if kept:
+                        bindings[key] = kept
+                    else:
+                        bindings.pop(key, None)
+    
+    def showing(self, owner):
+        """Whether controls bound by `owner` (a view key, None for the dashboard) are on screen"""
+        if owner is None:
+            return self.main_content.content is self.dashboard
+        shown = self.shown
+        return shown is not None and shown[0] == owner and self.main_content.content is self.view_cache.get(owner, (None, None))[1]
+    
+    def patch_device(self, device_id, send=True):
+        """Re-render only the bound controls of a device whose values changed"""
+        return self._patch(self.bindings.get(device_id, []), (self.devices[device_id],), send)
+    
+    def patch_topic(self, topic, send=True):
+        return self._patch(self.topic_bindings.get(topic, []), (), send)
+    
+    def _patch(self, bindings, args, send):
+        changed = []
+        visible = []
+        for control, attr, render, owner in bindings:
+            value = render(*args)
+            if getattr(control, attr) != value:
+                setattr(control, attr, value)
+                changed.append(control)
+                # Controls of a hidden view are current when it is shown again
+                if self.showing(owner):
+                    visible.append(control)
+        if visible and send:
+            self.updates.request(*visible)
+        return changed
+    
+    def update_device(self, device_id, field, value, source="user"):
+        """Change a device from this session; its own controls are patched right away"""
+        future = self.home.update_device(device_id, field, value, source, on_failure=self.show_device_failure)
+        # Bumped here too, not only when the change comes back, so a view shown right after sees it
+        self.bump("devices", ("device", device_id))
+        self.patch_device(device_id)
+        return future
+    
+    def show_device_failure(self, device):
+        self.page.show_snack_bar(ft.SnackBar(content=ft.Text(f"{device.name} did not respond, change reverted")))
+    
+    def on_home_change(self, changes):
+        """Apply a batch of home deltas: patch bound controls, invalidate cached views and re-show an open live one"""
+        bumped = set()
+        for key in changes:
+            if key[0] == "device":
+                bumped.update(("devices", ("device", key[1])))
+                self.patch_device(key[1])
+            else:
+                bumped.add(key[1])
+                self.patch_topic(key[1])
+                if key[1] == "energy":
+                    self.refresh_energy_monitor()
+        if "devices" in bumped:
+            # Home-wide figures that follow device state, e.g. active devices and power
+            self.patch_topic("devices")
+        self.bump(*bumped)
+        with self.view_lock:
+            if self.shown is not None and self.shown[3] and bumped.intersection(self.shown[2]):
+                self.show_view(*self.shown)
+    
+    def coalesce_slider(self, device_id, field, label, fmt):
+        """Slider handlers that preview on `label` and commit `field` once the drag settles"""
+        def preview(value):
+            label.value = fmt.format(value)
+            if label.page:
+                self.updates.request(label)
+        
+        return SliderCoalescer(
+            preview,
+            lambda value: self.update_device(device_id, field, value),
+            self.home.metrics
+        )
+    
+    def build_dashboard(self):
+        return ft.Column([control for section in self.dashboard_sections() for control in section()], scroll=ft.ScrollMode.AUTO)
+    
+    def dashboard_sections(self):
+        """Builders of the dashboard sections, top to bottom"""
+        def title(text, first=False):
+            return ([] if first else [ft.Container(height=30)]) + [
+                ft.Text(text, size=24, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
+                ft.Container(height=20),
+            ]
+        
+        return [
+            # On/Off Devices Section
+            lambda: title("On/Off Devices", first=True) + [
+                self.create_device_pager("switches", ["light", "lock"], self.dashboard_card, ft.Row(spacing=20, wrap=True)),
+            ],
+            # Slider Controlled Devices
+            lambda: title("Slider Controlled Devices") + [
+                self.create_device_pager("sliders", ["thermostat", "fan"], self.dashboard_card, ft.Row(spacing=20, wrap=True)),
+            ],
             # Scenes & Automation
-            ft.Text("Scenes & Automation", size=24, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
-            ft.Container(height=20),
-            ft.Row([
-                self.create_scene_card("Movie Night", 2),
-                self.create_scene_card("Good Morning", 3),
-                self.create_scene_card("Away Mode", 4),
-            ], spacing=20),
-            
-            ft.Container(height=30),
-            
+            lambda: title("Scenes & Automation") + [
+                ft.Row([
+                    self.create_scene_card(scene["name"], scene["actions"])
+                    for scene in self.scenes
+                ], spacing=20, wrap=True),
+            ],
             # Energy Monitor
-            ft.Text("Energy Monitor", size=24, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
-            ft.Container(height=20),
-            self.create_energy_monitor(),
-        ], scroll=ft.ScrollMode.AUTO)
+            lambda: title("Energy Monitor") + [self.create_energy_monitor()],
+        ]
+    
+    def create_device_pager(self, key, kinds, build, layout, page_size=DEVICE_PAGE_SIZE):
+        """One page of devices in `layout`, with room/type filters and paging.
+        
+        Filters are answered by the registry indexes and only the devices on
+        the shown page are passed to `build`, so the cost of a page does not
+        depend on how many devices the home has.
+        """
+        state = self.pagers.setdefault(key, {"page": 0, "room": None, "kind": None})
+        summary = ft.Text(size=12, color=ft.Colors.GREY_400)
+        previous_page = ft.IconButton(icon=ft.Icons.CHEVRON_LEFT, icon_color=ft.Colors.WHITE)
+        next_page = ft.IconButton(icon=ft.Icons.CHEVRON_RIGHT, icon_color=ft.Colors.WHITE)
         
-        self.page.update()
+        def refresh(send=True):
+            matching = []
+            for kind in [state["kind"]] if state["kind"] else kinds:
+                matching += self.devices.find(kind=kind, room=state["room"])
+            pages = max(-(-len(matching) // page_size), 1)
+            state["page"] = min(state["page"], pages - 1)
+            first = state["page"] * page_size
+            layout.controls = [build(device) for device in matching[first:first + page_size]]
+            summary.value = f"{min(first + 1, len(matching))}–{min(first + page_size, len(matching))} of {len(matching)}"
+            previous_page.disabled = state["page"] == 0
+            next_page.disabled = state["page"] >= pages - 1
+            if send:
+                self.updates.request(section)
+        
+        def turn_page(step):
+            def on_click(e):
+                state["page"] += step
+                refresh()
+            return on_click
+        
+        def set_filter(field):
+            def on_change(e):
+                state[field] = e.control.value or None
+                state["page"] = 0
+                refresh()
+            return on_change
+        
+        def dropdown(field, label, values):
+            return ft.Dropdown(
+                value=state[field] or "",
+                options=[ft.dropdown.Option("", label)] + [ft.dropdown.Option(value) for value in values],
+                on_change=set_filter(field),
+                width=180,
+                dense=True,
+                bgcolor="#0f1419",
+                border_color="#2a3342"
+            )
+        
+        def find_room(e):
+            # Too many rooms for a dropdown: look the typed name up in the room index
+            rooms = {room.lower(): room for room in self.devices.indexes["room"]}
+            state["room"] = rooms.get(e.control.value.strip().lower(), e.control.value.strip()) or None
+            state["page"] = 0
+            refresh()
+        
+        previous_page.on_click = turn_page(-1)
+        next_page.on_click = turn_page(1)
+        rooms = self.devices.indexes["room"]
+        if len(rooms) <= ROOM_DROPDOWN_LIMIT:
+            filters = [dropdown("room", "All rooms", sorted(rooms))]
+        else:
+            filters = [ft.TextField(
+                value=state["room"] or "",
+                hint_text="Filter by room",
+                on_submit=find_room,
+                width=180,
+                dense=True,
+                bgcolor="#0f1419",
+                border_color="#2a3342"
+            )]
+        if len(kinds) > 1:
+            filters.append(dropdown("kind", "All types", kinds))
+        section = ft.Column([
+            ft.Row([*filters, ft.Container(expand=True), summary, previous_page, next_page], spacing=10),
+            layout,
+        ], spacing=15)
+        refresh(send=False)
+        return section
+    
+    def dashboard_card(self, device):
+        """Dashboard card of a device, reused if it was built recently"""
+        card = self.card_cache.pop(device.id, None)
+        if card is None:
+            if device.kind == "thermostat":
+                card = self.create_thermostat_card(device.id)
+            elif device.kind == "fan":
+                card = self.create_fan_card(device.id)
+            else:
+                card = self.create_device_card(device.name, device.id, *CARD_STYLES[device.kind], device.kind)
+        else:
+            # Changes made while the card was off-page
+            self.patch_device(device.id, send=False)
+        self.card_cache[device.id] = card
+        if len(self.card_cache) > DEVICE_CARD_CACHE:
+            evicted, _ = self.card_cache.popitem(last=False)
+            kept = [entry for entry in self.bindings.get(evicted, []) if entry[3] is not None]
+            if kept:
+                self.bindings[evicted] = kept
+            else:
+                self.bindings.pop(evicted, None)
+        return card
     
     def create_device_card(self, name, device_id, bg_color, icon, icon_color, device_type):
-        device = self.devices[device_id]
-        is_on = device["status"] == "ON"
-        
         def toggle_device(e):
-            self.devices[device_id]["status"] = "OFF" if is_on else "ON"
-            self.show_dashboard()
+            device = self.devices[device_id]
+            if device_type == "lock":
+                # Lock rules ("door1: lock"/"unlock") trigger on `locked`
+                self.update_device(device_id, "locked", not device.locked)
+            else:
+                self.update_device(device_id, "status", "OFF" if device.status == "ON" else "ON")
         
         def show_details(e):
             if device_type == "light":
                 self.show_light_details(device_id, name)
         
-        action_text = "Turn OFF" if is_on else "Turn ON"
-        if device_type == "door":
-            action_text = "Unlock" if device["locked"] else "Lock"
+        def action_text(device):
+            if device_type == "lock":
+                return "Unlock" if device.locked else "Lock"
+            return "Turn OFF" if device.status == "ON" else "Turn ON"
         
-        return ft.Container(
-            content=ft.Column([
-                ft.Row([
-                    ft.Container(
-                        content=ft.Icon(icon, color=icon_color, size=30),
-                        width=60,
-                        height=60,
-                        bgcolor=ft.Colors.WHITE,
-                        border_radius=30,
-                        alignment=ft.alignment.center
-                    ),
-                    ft.Column([
-                        ft.Text(name, size=16, weight=ft.FontWeight.BOLD, color="#1a1f2e"),
-                        ft.Text(f"Status: {device['status']}", size=12, color="#1a1f2e"),
-                        ft.Text(f"Tap to turn {'off' if is_on else 'on'}", size=10, color="#666"),
-                    ], spacing=2, expand=True)
-                ], spacing=15),
-                ft.Container(height=15),
-                ft.Row([
-                    ft.TextButton("Details", on_click=show_details, style=ft.ButtonStyle(color="#5b4fc7")),
-                    ft.Container(expand=True),
-                    ft.ElevatedButton(
-                        action_text,
-                        on_click=toggle_device,
-                        bgcolor="#1a1f2e",
-                        color=ft.Colors.WHITE,
-                        style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=20))
-                    )
-                ])
-            ], spacing=10),
-            width=300,
-            padding=20,
-            bgcolor=bg_color,
-            border_radius=15
-        )
+        card, parts = CARD_TEMPLATES["device"].clone()
+        card.bgcolor = bg_color
+        parts["icon"].name = icon
+        parts["icon"].color = icon_color
+        parts["name"].value = name
+        if device_type == "lock":
+            self.bind(device_id, parts["status"], "value", lambda d: f"Status: {'Locked' if d.locked else 'Unlocked'}")
+            self.bind(device_id, parts["hint"], "value", lambda d: f"Tap to {'unlock' if d.locked else 'lock'}")
+        else:
+            self.bind(device_id, parts["status"], "value", lambda d: f"Status: {d.status}")
+            self.bind(device_id, parts["hint"], "value", lambda d: f"Tap to turn {'off' if d.status == 'ON' else 'on'}")
+        parts["details"].on_click = show_details
+        parts["action"].on_click = toggle_device
+        self.bind(device_id, parts["action"], "text", action_text)
+        return card
 
-    def create_thermostat_card(self):
-        device = self.devices["thermostat"]
-        
-        def on_slider_change(e):
-            self.devices["thermostat"]["target"] = int(e.control.value)
-            temp_text.value = f"{int(e.control.value)}°C"
-            self.page.update()
+    def create_thermostat_card(self, device_id):
+        card, parts = CARD_TEMPLATES["thermostat"].clone()
+        temp_text = self.bind(device_id, parts["value"], "value", lambda d: f"{d.target}°C")
+        slider = self.coalesce_slider(device_id, "target", temp_text, "{}°C")
         
         def show_details(e):
-            self.show_thermostat_details()
+            self.show_thermostat_details(device_id)
         
-        temp_text = ft.Text(f"{device['target']}°C", size=12, color="#8b5a5a")
-        
-        return ft.Container(
-            content=ft.Column([
-                ft.Row([
-                    ft.Container(
-                        content=ft.Icon(ft.Icons.THERMOSTAT, color=ft.Colors.RED_400, size=30),
-                        width=60,
-                        height=60,
-                        bgcolor=ft.Colors.WHITE,
-                        border_radius=30,
-                        alignment=ft.alignment.center
-                    ),
-                    ft.Column([
-                        ft.Text("Thermostat", size=16, weight=ft.FontWeight.BOLD, color="#8b5a5a"),
-                        ft.Text(f"Set point: {device['target']}°C", size=12, color="#8b5a5a"),
-                        ft.Text("Use slider to change", size=10, color="#a88"),
-                    ], spacing=2, expand=True)
-                ], spacing=15),
-                ft.Container(height=10),
-                ft.Row([
-                    ft.Icon(ft.Icons.AC_UNIT, color=ft.Colors.BLUE_300, size=20),
-                    ft.Slider(
-                        min=15,
-                        max=30,
-                        value=device['target'],
-                        on_change=on_slider_change,
-                        active_color=ft.Colors.BLUE_400,
-                        thumb_color=ft.Colors.BLUE_600,
-                        expand=True
-                    ),
-                    ft.Icon(ft.Icons.LOCAL_FIRE_DEPARTMENT, color=ft.Colors.RED_300, size=20),
-                ], spacing=10),
-                temp_text,
-                ft.TextButton("Details", on_click=show_details, style=ft.ButtonStyle(color="#8b5a5a"))
-            ], spacing=10),
-            width=450,
-            padding=20,
-            bgcolor="#ffe5e5",
-            border_radius=15
-        )
+        parts["name"].value = self.devices[device_id].name
+        self.bind(device_id, parts["status"], "value", lambda d: f"Set point: {d.target}°C")
+        parts["slider"].on_change = slider.on_change
+        parts["slider"].on_change_end = slider.on_change_end
+        self.bind(device_id, parts["slider"], "value", lambda d: d.target)
+        parts["details"].on_click = show_details
+        return card
     
-    def create_fan_card(self):
-        device = self.devices["ceiling_fan"]
-        
-        def on_slider_change(e):
-            self.devices["ceiling_fan"]["speed"] = int(e.control.value)
-            speed_text.value = f"Fan speed: {int(e.control.value)}"
-            self.page.update()
+    def create_fan_card(self, device_id):
+        card, parts = CARD_TEMPLATES["fan"].clone()
+        speed_text = self.bind(device_id, parts["value"], "value", lambda d: f"Fan speed: {d.speed}")
+        slider = self.coalesce_slider(device_id, "speed", speed_text, "Fan speed: {}")
         
-        speed_text = ft.Text(f"Fan speed: {device['speed']}", size=12, color="#4a7c7c")
-        
-        return ft.Container(
-            content=ft.Column([
-                ft.Row([
-                    ft.Container(
-                        content=ft.Icon(ft.Icons.AIR, color=ft.Colors.CYAN_600, size=30),
-                        width=60,
-                        height=60,
-                        bgcolor=ft.Colors.WHITE,
-                        border_radius=30,
-                        alignment=ft.alignment.center
-                    ),
-                    ft.Column([
-                        ft.Text("Ceiling Fan", size=16, weight=ft.FontWeight.BOLD, color="#4a7c7c"),
-                        ft.Text(f"Fan speed: {device['speed']}", size=12, color="#4a7c7c"),
-                        ft.Text("0 = OFF, 3 = MAX", size=10, color="#6aa"),
-                    ], spacing=2, expand=True)
-                ], spacing=15),
-                ft.Container(height=10),
-                ft.Slider(
-                    min=0,
-                    max=3,
-                    divisions=3,
-                    value=device['speed'],
-                    on_change=on_slider_change,
-                    active_color=ft.Colors.CYAN_400,
-                    thumb_color=ft.Colors.CYAN_600
-                ),
-                speed_text,
-                ft.TextButton("Details", style=ft.ButtonStyle(color="#4a7c7c"))
-            ], spacing=10),
-            width=450,
-            padding=20,
-            bgcolor="#d4f4f4",
-            border_radius=15
-        )
+        parts["name"].value = self.devices[device_id].name
+        self.bind(device_id, parts["status"], "value", lambda d: f"Fan speed: {d.speed}")
+        parts["slider"].on_change = slider.on_change
+        parts["slider"].on_change_end = slider.on_change_end
+        self.bind(device_id, parts["slider"], "value", lambda d: d.speed)
+        return card
+    
+    def activate_scene(self, name):
+        """Start a scene; its outcome is shown in a snack bar once every action has finished"""
+        scene = self.home.activate_scene(name)
+        scene.add_done_callback(lambda f: self.page.run_thread(self.show_scene_result, f.result()))
+        return scene
+    
+    def show_scene_result(self, result):
+        failed = [r for r in result["results"] if not r["ok"]]
+        message = f"{result['scene']} activated in {result['latency'] * 1000:.0f} ms"
+        if failed:
+            message = f"{result['scene']}: {len(failed)} of {len(result['results'])} actions failed ({failed[0]['action']}: {failed[0]['error']})"
+        self.page.show_snack_bar(ft.SnackBar(content=ft.Text(message)))
     
     def create_scene_card(self, name, device_count):
         def activate_scene(e):
-            # Scene activation logic
-            pass
+            self.activate_scene(name)
         
         return ft.Container(
             content=ft.Column([
@@ -329,9 +3832,7 @@ class SmartHomeApp:
                 ft.ElevatedButton(
                     "▶ Activate Scene",
                     on_click=activate_scene,
-                    bgcolor="#7c3aed",
-                    color=ft.Colors.WHITE,
-                    style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=20))
+                    style=shared_button_style(color=ft.Colors.WHITE, bgcolor="#7c3aed", radius=20)
                 )
             ], spacing=5, horizontal_alignment=ft.CrossAxisAlignment.CENTER),
             width=280,
@@ -341,31 +3842,53 @@ class SmartHomeApp:
             alignment=ft.alignment.center
         )
     
+    def current_power(self):
+        return self.home.current_power()
+    
     def create_energy_monitor(self):
+        self.power_text = ft.Text(size=36, weight=ft.FontWeight.BOLD, color=ft.Colors.YELLOW_700)
+        self.power_cost_text = ft.Text(size=12, color="#666")
+        self.refresh_energy_monitor()
         return ft.Container(
             content=ft.Row([
                 ft.Icon(ft.Icons.BOLT, color=ft.Colors.YELLOW_700, size=40),
                 ft.Column([
                     ft.Text("Current Power Usage", size=14, color="#666"),
-                    ft.Text("65 W", size=36, weight=ft.FontWeight.BOLD, color=ft.Colors.YELLOW_700),
-                    ft.Text("Estimated cost: $0.19/day", size=12, color="#666"),
+                    self.power_text,
+                    self.power_cost_text,
                 ], spacing=5)
             ], spacing=20),
             padding=30,
             bgcolor="#fffbeb",
             border_radius=15
         )
+    
+    def refresh_energy_monitor(self):
+        if self.power_text is None:
+            return
+        watts = self.current_power()
+        self.power_text.value = f"{watts:.0f} W"
+        self.power_cost_text.value = f"Estimated cost: ${watts * 24 / 1000 * self.costs.tariff.rates.mean():.2f}/day"
+        if self.power_text.page:
+            self.updates.request(self.power_text, self.power_cost_text)
 
     def show_profile(self):
         """Profile page with account settings"""
+        self.show_view(("profile",), self.build_profile, ["profile"])
+    
+    def build_profile(self):
+        metrics = self.home.metrics
+        
         def save_changes(e):
-            self.user_name = name_field.value
-            self.user_email = email_field.value
+            self.home.user_name = name_field.value
+            self.home.user_email = email_field.value
+            self.state.append("profile", name_field.value, email_field.value)
+            self.home.publish("profile")
             self.page.show_snack_bar(ft.SnackBar(content=ft.Text("Changes saved successfully!")))
         
         name_field = ft.TextField(
             label="Full Name",
-            value=self.user_name,
+            value=self.home.user_name,
             bgcolor="#1a2332",
             border_color="#2a3342",
             color=ft.Colors.WHITE
@@ -373,18 +3896,18 @@ class SmartHomeApp:
         
         email_field = ft.TextField(
             label="Email Address",
-            value=self.user_email,
+            value=self.home.user_email,
             bgcolor="#1a2332",
             border_color="#2a3342",
             color=ft.Colors.WHITE
         )
         
-        self.main_content.content = ft.Column([
+        return ft.Column([
             # Header with profile
             ft.Row([
                 ft.Container(
                     content=ft.Text(
-                        self.user_name[0].upper(),
+                        self.home.user_name[0].upper(),
                         size=40,
                         weight=ft.FontWeight.BOLD,
                         color=ft.Colors.WHITE
@@ -396,15 +3919,13 @@ class SmartHomeApp:
                     alignment=ft.alignment.center
                 ),
                 ft.Column([
-                    ft.Text(self.user_name, size=32, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
+                    ft.Text(self.home.user_name, size=32, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
                     ft.Text("Member since Jan 2023", size=14, color=ft.Colors.GREY_400),
                 ], spacing=5),
                 ft.Container(expand=True),
                 ft.ElevatedButton(
                     "Edit Profile",
-                    bgcolor=ft.Colors.BLUE_600,
-                    color=ft.Colors.WHITE,
-                    style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8))
+                    style=shared_button_style(color=ft.Colors.WHITE, bgcolor=ft.Colors.BLUE_600, radius=8)
                 )
             ], alignment=ft.MainAxisAlignment.START),
             
@@ -412,10 +3933,10 @@ class SmartHomeApp:
             
             # Stats cards
             ft.Row([
-                self.create_stat_card("Active Devices", "15", "#1e3a5f"),
-                self.create_stat_card("Scenes Created", "8", "#1e3a5f"),
-                self.create_stat_card("Energy Saved", "12 kWh", "#1e3a5f"),
-                self.create_stat_card("Most Used", "Living Room", "#1e3a5f"),
+                self.create_stat_card("Active Devices", lambda: str(metrics.value("devices.active")), "#1e3a5f", topic="devices"),
+                self.create_stat_card("Scenes Created", lambda: str(metrics.value("scenes.defined")), "#1e3a5f", topic="scenes"),
+                self.create_stat_card("Energy Saved", lambda: f"{metrics.value('energy.saved_kwh'):.0f} kWh", "#1e3a5f", topic="energy"),
+                self.create_stat_card("Most Used", lambda: self.home.most_used_room() or "-", "#1e3a5f", topic="energy"),
             ], spacing=20),
             
             ft.Container(height=30),
@@ -424,9 +3945,9 @@ class SmartHomeApp:
             ft.Container(
                 content=ft.Column([
                     ft.Row([
-                        ft.TextButton("Account Details", style=ft.ButtonStyle(color=ft.Colors.BLUE_400)),
-                        ft.TextButton("Notifications", style=ft.ButtonStyle(color=ft.Colors.GREY_400)),
-                        ft.TextButton("Dashboard Customization", style=ft.ButtonStyle(color=ft.Colors.GREY_400)),
+                        ft.TextButton("Account Details", style=shared_button_style(color=ft.Colors.BLUE_400)),
+                        ft.TextButton("Notifications", style=shared_button_style(color=ft.Colors.GREY_400)),
+                        ft.TextButton("Dashboard Customization", style=shared_button_style(color=ft.Colors.GREY_400)),
                     ]),
                     ft.Divider(color="#2a3342", height=1),
                     
@@ -463,14 +3984,11 @@ class SmartHomeApp:
                             ft.Container(expand=True),
                             ft.OutlinedButton(
                                 "Change Password",
-                                style=ft.ButtonStyle(
-                                    color=ft.Colors.WHITE,
-                                    side=ft.BorderSide(1, ft.Colors.GREY_600)
-                                )
+                                style=shared_button_style(color=ft.Colors.WHITE, side=(1, ft.Colors.GREY_600))
                             )
                         ]),
                         padding=20,
-                        border=ft.border.all(1, "#2a3342"),
+                        border=shared_border(1, "#2a3342"),
                         border_radius=8
                     ),
                     
@@ -486,14 +4004,11 @@ class SmartHomeApp:
                             ft.Container(expand=True),
                             ft.OutlinedButton(
                                 "Enable 2FA",
-                                style=ft.ButtonStyle(
-                                    color=ft.Colors.WHITE,
-                                    side=ft.BorderSide(1, ft.Colors.GREY_600)
-                                )
+                                style=shared_button_style(color=ft.Colors.WHITE, side=(1, ft.Colors.GREY_600))
                             )
                         ]),
                         padding=20,
-                        border=ft.border.all(1, "#2a3342"),
+                        border=shared_border(1, "#2a3342"),
                         border_radius=8
                     ),
                     
@@ -511,9 +4026,7 @@ class SmartHomeApp:
                             ft.Container(expand=True),
                             ft.ElevatedButton(
                                 "Delete My Account",
-                                bgcolor=ft.Colors.RED_900,
-                                color=ft.Colors.RED_400,
-                                style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8))
+                                style=shared_button_style(color=ft.Colors.RED_400, bgcolor=ft.Colors.RED_900, radius=8)
                             )
                         ]),
                         padding=20,
@@ -527,9 +4040,7 @@ class SmartHomeApp:
                         ft.ElevatedButton(
                             "Save Changes",
                             on_click=save_changes,
-                            bgcolor=ft.Colors.BLUE_600,
-                            color=ft.Colors.WHITE,
-                            style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8))
+                            style=shared_button_style(color=ft.Colors.WHITE, bgcolor=ft.Colors.BLUE_600, radius=8)
                         )
                     ])
                 ], spacing=0),
@@ -538,62 +4049,56 @@ class SmartHomeApp:
                 border_radius=15
             )
         ], scroll=ft.ScrollMode.AUTO)
-        
-        self.page.update()
     
-    def create_stat_card(self, label, value, bg_color):
-        return ft.Container(
-            content=ft.Column([
-                ft.Text(label, size=12, color=ft.Colors.GREY_400),
-                ft.Text(value, size=24, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
-            ], spacing=5, horizontal_alignment=ft.CrossAxisAlignment.START),
-            padding=20,
-            bgcolor=bg_color,
-            border_radius=12,
-            expand=True
-        )
+    def create_stat_card(self, label, value, bg_color, topic=None):
+        """With a `topic`, `value` is a callable re-rendered in place whenever the topic is published"""
+        card, parts = CARD_TEMPLATES["stat"].clone()
+        card.bgcolor = bg_color
+        parts["label"].value = label
+        if topic is None:
+            parts["value"].value = value
+        else:
+            self.bind_topic(topic, parts["value"], "value", value)
+        return card
 
-    def show_thermostat_details(self):
+    def show_thermostat_details(self, device_id="thermostat"):
         """Detailed thermostat control page"""
-        device = self.devices["thermostat"]
+        self.show_view(("thermostat", device_id), lambda: self.build_thermostat_details(device_id), ["schedules"])
+    
+    def build_thermostat_details(self, device_id):
+        device = self.devices[device_id]
         
         def back_to_dashboard(e):
             self.show_dashboard()
         
         def set_mode(mode):
             def handler(e):
-                self.devices["thermostat"]["mode"] = mode
-                self.show_thermostat_details()
+                self.update_device(device_id, "mode", mode)
             return handler
         
         def set_fan_mode(mode):
             def handler(e):
-                self.devices["thermostat"]["fan"] = mode
-                self.show_thermostat_details()
+                self.update_device(device_id, "fan", mode)
             return handler
         
-        def on_temp_change(e):
-            self.devices["thermostat"]["target"] = int(e.control.value)
-            target_temp_text.value = f"{int(e.control.value)}°C"
-            self.page.update()
-        
-        target_temp_text = ft.Text(f"{device['target']}°C", size=14, color=ft.Colors.GREY_400)
+        target_temp_text = self.bind(device_id, ft.Text(size=14, color=ft.Colors.GREY_400), "value", lambda d: f"{d.target}°C")
+        temp_slider = self.coalesce_slider(device_id, "target", target_temp_text, "{}°C")
         
         # Mode buttons
         mode_buttons = ft.Row([
-            self.create_mode_button("Heat", ft.Icons.LOCAL_FIRE_DEPARTMENT, "heat", device["mode"], set_mode("heat")),
-            self.create_mode_button("Cool", ft.Icons.AC_UNIT, "cool", device["mode"], set_mode("cool")),
-            self.create_mode_button("Auto", ft.Icons.AUTORENEW, "auto", device["mode"], set_mode("auto")),
+            self.create_mode_button("Heat", ft.Icons.LOCAL_FIRE_DEPARTMENT, "heat", device.mode, set_mode("heat"), (device_id, "mode")),
+            self.create_mode_button("Cool", ft.Icons.AC_UNIT, "cool", device.mode, set_mode("cool"), (device_id, "mode")),
+            self.create_mode_button("Auto", ft.Icons.AUTORENEW, "auto", device.mode, set_mode("auto"), (device_id, "mode")),
         ], spacing=15)
         
         # Fan buttons
         fan_buttons = ft.Row([
-            self.create_mode_button("Auto", ft.Icons.AIR, "auto", device["fan"], set_fan_mode("auto")),
-            self.create_mode_button("Off", ft.Icons.POWER_SETTINGS_NEW, "off", device["fan"], set_fan_mode("off")),
-            self.create_mode_button("On", ft.Icons.AIR, "on", device["fan"], set_fan_mode("on")),
+            self.create_mode_button("Auto", ft.Icons.AIR, "auto", device.fan, set_fan_mode("auto"), (device_id, "fan")),
+            self.create_mode_button("Off", ft.Icons.POWER_SETTINGS_NEW, "off", device.fan, set_fan_mode("off"), (device_id, "fan")),
+            self.create_mode_button("On", ft.Icons.AIR, "on", device.fan, set_fan_mode("on"), (device_id, "fan")),
         ], spacing=15)
         
-        self.main_content.content = ft.Column([
+        return ft.Column([
             # Header
             ft.Row([
                 ft.IconButton(
@@ -618,17 +4123,15 @@ class SmartHomeApp:
                 ),
                 ft.Column([
                     ft.Text("Smart Thermostat", size=28, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
-                    ft.Text(f"Status: {device['status']} • Set to {device['target']}°C", 
-                           size=14, color=ft.Colors.GREY_400),
+                    self.bind(device_id, ft.Text(size=14, color=ft.Colors.GREY_400), "value",
+                              lambda d: f"Status: {d.status} • Set to {d.target}°C"),
                 ], spacing=5),
                 ft.Container(expand=True),
                 ft.Row([
                     ft.IconButton(icon=ft.Icons.SETTINGS, icon_color=ft.Colors.WHITE),
                     ft.ElevatedButton(
                         "Turn OFF",
-                        bgcolor="#1a2332",
-                        color=ft.Colors.WHITE,
-                        style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=20))
+                        style=shared_button_style(color=ft.Colors.WHITE, bgcolor="#1a2332", radius=20)
                     )
                 ])
             ]),
@@ -647,11 +4150,12 @@ class SmartHomeApp:
                         ft.Container(
                             content=ft.Column([
                                 ft.Text("Current", size=12, color=ft.Colors.GREY_400),
-                                ft.Text(f"{device['current']}°", size=48, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
+                                self.bind(device_id, ft.Text(size=48, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE), "value", lambda d: f"{d.current}°"),
+                                self.bind_topic("thermal", ft.Text(size=11, color=ft.Colors.GREY_400), "value", lambda: self.home.thermal_outlook(device_id)),
                             ], horizontal_alignment=ft.CrossAxisAlignment.CENTER),
                             width=200,
                             height=200,
-                            border=ft.border.all(8, ft.Colors.BLUE_600),
+                            border=shared_border(8, ft.Colors.BLUE_600),
                             border_radius=100,
                             alignment=ft.alignment.center
                         ),
@@ -667,15 +4171,15 @@ class SmartHomeApp:
                             ]),
                             ft.Row([
                                 ft.Icon(ft.Icons.AC_UNIT, color=ft.Colors.BLUE_300, size=20),
-                                ft.Slider(
+                                self.bind(device_id, ft.Slider(
                                     min=15,
                                     max=30,
-                                    value=device['target'],
-                                    on_change=on_temp_change,
+                                    on_change=temp_slider.on_change,
+                                    on_change_end=temp_slider.on_change_end,
                                     active_color=ft.Colors.BLUE_400,
                                     thumb_color=ft.Colors.BLUE_600,
                                     expand=True
-                                ),
+                                ), "value", lambda d: d.target),
                                 ft.Icon(ft.Icons.LOCAL_FIRE_DEPARTMENT, color=ft.Colors.RED_300, size=20),
                             ])
                         ], spacing=10),
@@ -717,8 +4221,10 @@ class SmartHomeApp:
                                 ft.IconButton(icon=ft.Icons.ADD, icon_color=ft.Colors.BLUE_400, icon_size=20)
                             ]),
                             ft.Container(height=15),
-                            self.create_schedule_item("Morning (22°C)", "7:00 AM", True),
-                            self.create_schedule_item("Night (20°C)", "11:00 PM", True),
+                            ft.Column([
+                                self.create_schedule_item(schedule)
+                                for schedule in self.scheduler.for_device(device_id)
+                            ], spacing=10),
                         ], spacing=10),
                         padding=20,
                         bgcolor="#1a2332",
@@ -733,10 +4239,7 @@ class SmartHomeApp:
                         content=ft.Column([
                             ft.Text("Information", size=18, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
                             ft.Container(height=15),
-                            self.create_info_row("Device Model", "ThermoSmart X"),
-                            self.create_info_row("Firmware", "v3.1.2"),
-                            self.create_info_row("MAC Address", "A1:B2:C3:D4:E5:F6"),
-                            self.create_info_row("Uptime", "12d 4h 8m"),
+                            *self.create_device_info(device_id),
                         ], spacing=10),
                         padding=20,
                         bgcolor="#1a2332",
@@ -749,65 +4252,28 @@ class SmartHomeApp:
             ft.Container(height=30),
             
             # Usage History
-            ft.Container(
-                content=ft.Column([
-                    ft.Row([
-                        ft.Text("Usage History", size=18, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
-                        ft.Container(expand=True),
-                        ft.Dropdown(
-                            value="Last 7 Days",
-                            options=[
-                                ft.dropdown.Option("Last 7 Days"),
-                                ft.dropdown.Option("Last 30 Days"),
-                                ft.dropdown.Option("Last 3 Months"),
-                            ],
-                            width=150,
-                            bgcolor="#0f1419",
-                            border_color="#2a3342"
-                        )
-                    ]),
-                    ft.Container(height=20),
-                    ft.Container(
-                        content=ft.Text("Chart Data Here", size=14, color=ft.Colors.GREY_600),
-                        height=200,
-                        alignment=ft.alignment.center,
-                        bgcolor="#0f1419",
-                        border_radius=8
-                    )
-                ], spacing=10),
-                padding=30,
-                bgcolor="#1a2332",
-                border_radius=15
-            )
+            self.create_usage_history(device_id, ["Last 7 Days", "Last 30 Days", "Last 3 Months"])
         ], scroll=ft.ScrollMode.AUTO)
-        
-        self.page.update()
 
     def show_light_details(self, device_id, device_name):
         """Detailed light control page"""
+        self.show_view(("light", device_id), lambda: self.build_light_details(device_id, device_name), ["schedules"])
+    
+    def build_light_details(self, device_id, device_name):
         device = self.devices[device_id]
         
         def back_to_dashboard(e):
             self.show_dashboard()
         
         def toggle_light(e):
-            self.devices[device_id]["status"] = "OFF" if device["status"] == "ON" else "ON"
-            self.show_light_details(device_id, device_name)
-        
-        def on_brightness_change(e):
-            self.devices[device_id]["brightness"] = int(e.control.value)
-            brightness_text.value = f"{int(e.control.value)}%"
-            self.page.update()
-        
-        def on_color_temp_change(e):
-            self.devices[device_id]["color_temp"] = int(e.control.value)
-            temp_text.value = f"{int(e.control.value)}K"
-            self.page.update()
+            self.update_device(device_id, "status", "OFF" if device.status == "ON" else "ON")
         
-        brightness_text = ft.Text(f"{device['brightness']}%", size=14, color=ft.Colors.GREY_400)
-        temp_text = ft.Text(f"{device['color_temp']}K", size=14, color=ft.Colors.GREY_400)
+        brightness_text = self.bind(device_id, ft.Text(size=14, color=ft.Colors.GREY_400), "value", lambda d: f"{d.brightness}%")
+        temp_text = self.bind(device_id, ft.Text(size=14, color=ft.Colors.GREY_400), "value", lambda d: f"{d.color_temp}K")
+        brightness_slider = self.coalesce_slider(device_id, "brightness", brightness_text, "{}%")
+        color_temp_slider = self.coalesce_slider(device_id, "color_temp", temp_text, "{}K")
         
-        self.main_content.content = ft.Column([
+        return ft.Column([
             # Header
             ft.Row([
                 ft.IconButton(
@@ -832,19 +4298,16 @@ class SmartHomeApp:
                 ),
                 ft.Column([
                     ft.Text(device_name, size=28, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
-                    ft.Text(f"Status: {device['status']} • {device['brightness']}% Brightness", 
-                           size=14, color=ft.Colors.GREY_400),
+                    self.bind(device_id, ft.Text(size=14, color=ft.Colors.GREY_400), "value",
+                              lambda d: f"Status: {d.status} • {d.brightness}% Brightness"),
                 ], spacing=5),
                 ft.Container(expand=True),
                 ft.Row([
                     ft.IconButton(icon=ft.Icons.SETTINGS, icon_color=ft.Colors.WHITE),
-                    ft.ElevatedButton(
-                        "Turn OFF" if device["status"] == "ON" else "Turn ON",
+                    self.bind(device_id, ft.ElevatedButton(
                         on_click=toggle_light,
-                        bgcolor="#1a2332",
-                        color=ft.Colors.WHITE,
-                        style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=20))
-                    )
+                        style=shared_button_style(color=ft.Colors.WHITE, bgcolor="#1a2332", radius=20)
+                    ), "text", lambda d: "Turn OFF" if d.status == "ON" else "Turn ON")
                 ])
             ]),
             
@@ -868,15 +4331,15 @@ class SmartHomeApp:
                             ft.Container(height=10),
                             ft.Row([
                                 ft.Icon(ft.Icons.LIGHTBULB_OUTLINE, color=ft.Colors.GREY_400, size=20),
-                                ft.Slider(
+                                self.bind(device_id, ft.Slider(
                                     min=0,
                                     max=100,
-                                    value=device['brightness'],
-                                    on_change=on_brightness_change,
+                                    on_change=brightness_slider.on_change,
+                                    on_change_end=brightness_slider.on_change_end,
                                     active_color=ft.Colors.BLUE_400,
                                     thumb_color=ft.Colors.BLUE_600,
                                     expand=True
-                                ),
+                                ), "value", lambda d: d.brightness),
                                 ft.Icon(ft.Icons.LIGHTBULB, color=ft.Colors.YELLOW_600, size=20),
                             ])
                         ], spacing=5),
@@ -894,14 +4357,14 @@ class SmartHomeApp:
                             ft.Row([
                                 ft.Icon(ft.Icons.WB_SUNNY, color=ft.Colors.ORANGE_400, size=20),
                                 ft.Container(
-                                    content=ft.Slider(
+                                    content=self.bind(device_id, ft.Slider(
                                         min=2000,
                                         max=6500,
-                                        value=device['color_temp'],
-                                        on_change=on_color_temp_change,
+                                        on_change=color_temp_slider.on_change,
+                                        on_change_end=color_temp_slider.on_change_end,
                                         thumb_color=ft.Colors.BLUE_600,
                                         expand=True
-                                    ),
+                                    ), "value", lambda d: d.color_temp),
                                     gradient=ft.LinearGradient(
                                         begin=ft.alignment.center_left,
                                         end=ft.alignment.center_right,
@@ -934,8 +4397,10 @@ class SmartHomeApp:
                                 ft.IconButton(icon=ft.Icons.ADD, icon_color=ft.Colors.BLUE_400, icon_size=20)
                             ]),
                             ft.Container(height=15),
-                            self.create_schedule_item("ON - Weekdays", "7:00 AM", True),
-                            self.create_schedule_item("OFF - Everyday", "11:00 PM", True),
+                            ft.Column([
+                                self.create_schedule_item(schedule)
+                                for schedule in self.scheduler.for_device(device_id)
+                            ], spacing=10),
                         ], spacing=10),
                         padding=20,
                         bgcolor="#1a2332",
@@ -950,10 +4415,7 @@ class SmartHomeApp:
                         content=ft.Column([
                             ft.Text("Information", size=18, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
                             ft.Container(height=15),
-                            self.create_info_row("Device Model", "SmartColor A19"),
-                            self.create_info_row("Firmware", "v2.5.1"),
-                            self.create_info_row("MAC Address", "1A:2B:3C:4D:5E:6F"),
-                            self.create_info_row("Uptime", "3d 14h 22m"),
+                            *self.create_device_info(device_id),
                         ], spacing=10),
                         padding=20,
                         bgcolor="#1a2332",
@@ -966,78 +4428,159 @@ class SmartHomeApp:
             ft.Container(height=30),
             
             # Usage History
-            ft.Container(
-                content=ft.Column([
-                    ft.Row([
-                        ft.Text("Usage History", size=18, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
-                        ft.Container(expand=True),
-                        ft.Dropdown(
-                            value="Last 7 Days",
-                            options=[
-                                ft.dropdown.Option("Last 7 Days"),
-                                ft.dropdown.Option("Last 30 Days"),
-                            ],
-                            width=150,
-                            bgcolor="#0f1419",
-                            border_color="#2a3342"
-                        )
-                    ]),
-                    ft.Container(height=20),
-                    ft.Container(
-                        content=ft.Text("Chart Data Here", size=14, color=ft.Colors.GREY_600),
-                        height=200,
-                        alignment=ft.alignment.center,
-                        bgcolor="#0f1419",
-                        border_radius=8
-                    )
-                ], spacing=10),
-                padding=30,
-                bgcolor="#1a2332",
-                border_radius=15
-            )
+            self.create_usage_history(device_id, ["Last 7 Days", "Last 30 Days"])
         ], scroll=ft.ScrollMode.AUTO)
-        
-        self.page.update()
     
-    def create_mode_button(self, text, icon, mode_value, current_mode, on_click):
-        is_selected = current_mode == mode_value
+    def create_usage_history(self, device_id, ranges):
+        def change_range(e):
+            chart.content = self.create_usage_chart(device_id, USAGE_RANGES[e.control.value])
+            self.updates.request(chart)
+        
+        chart = ft.Container(
+            content=self.create_usage_chart(device_id, USAGE_RANGES[ranges[0]]),
+            height=200,
+            padding=shared_padding(top=10, right=15),
+            bgcolor="#0f1419",
+            border_radius=8
+        )
         return ft.Container(
             content=ft.Column([
-                ft.Icon(icon, color=ft.Colors.ORANGE_400 if is_selected else ft.Colors.GREY_400, size=24),
-                ft.Text(text, size=12, color=ft.Colors.WHITE if is_selected else ft.Colors.GREY_400)
-            ], horizontal_alignment=ft.CrossAxisAlignment.CENTER, spacing=5),
-            width=90,
-            height=80,
-            bgcolor=ft.Colors.BLUE_900 if is_selected else "#0f1419",
-            border_radius=8,
-            alignment=ft.alignment.center,
-            on_click=on_click,
-            border=ft.border.all(2, ft.Colors.BLUE_600 if is_selected else "#2a3342")
+                ft.Row([
+                    ft.Text("Usage History", size=18, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
+                    ft.Container(expand=True),
+                    ft.Dropdown(
+                        value=ranges[0],
+                        options=[ft.dropdown.Option(name) for name in ranges],
+                        width=150,
+                        bgcolor="#0f1419",
+                        border_color="#2a3342",
+                        on_change=change_range
+                    )
+                ]),
+                ft.Container(height=20),
+                chart
+            ], spacing=10),
+            padding=30,
+            bgcolor="#1a2332",
+            border_radius=15
         )
     
-    def create_schedule_item(self, title, time, enabled):
-        return ft.Row([
-            ft.Column([
-                ft.Text(title, size=14, color=ft.Colors.WHITE),
-                ft.Text(time, size=12, color=ft.Colors.GREY_400),
-            ], spacing=2),
-            ft.Container(expand=True),
-            ft.Switch(value=enabled, active_color=ft.Colors.BLUE_600)
-        ])
-    
-    def create_info_row(self, label, value):
-        return ft.Row([
-            ft.Text(label, size=12, color=ft.Colors.GREY_400),
-            ft.Container(expand=True),
-            ft.Text(value, size=12, color=ft.Colors.WHITE, weight=ft.FontWeight.BOLD),
-        ])
+    def usage_points(self, device_id, days):
+        """Average watts of a device over the last `days`, min/max downsampled to USAGE_CHART_COLUMNS.
+        
+        Returns (days since range start, watts) pairs. The range ends on a column
+        boundary, so a cached result stays valid until the next column starts.
+        """
+        per = -(-days * 1440 // USAGE_CHART_COLUMNS)
+        column_seconds = per * 60
+        end = (int(time.time()) // column_seconds + 1) * column_seconds
+        cached = self.home.usage_cache.get((device_id, days))
+        if cached is not None and cached[0] == end:
+            return cached[1]
+        
+        start = end - USAGE_CHART_COLUMNS * column_seconds
+        # Wh per minute -> average W over that minute
+        watts = self.energy.matrix([device_id], "minute", start, end)[0] * 60
+        indices = min_max_downsample(watts, USAGE_CHART_COLUMNS)
+        points = list(zip((indices * 60 / 86400).tolist(), watts[indices].tolist()))
+        self.home.usage_cache[(device_id, days)] = (end, points)
+        return points
+    
+    def create_usage_chart(self, device_id, days):
+        points = self.usage_points(device_id, days)
+        start = datetime.now() - timedelta(days=days)
+        return ft.LineChart(
+            data_series=[
+                ft.LineChartData(
+                    data_points=[ft.LineChartDataPoint(x, y) for x, y in points],
+                    stroke_width=2,
+                    color=ft.Colors.BLUE_400,
+                    below_line_bgcolor=ft.Colors.with_opacity(0.2, ft.Colors.BLUE_400),
+                )
+            ],
+            min_x=0,
+            max_x=days,
+            min_y=0,
+            left_axis=ft.ChartAxis(labels_size=40),
+            bottom_axis=ft.ChartAxis(
+                labels=[
+                    ft.ChartAxisLabel(
+                        value=day,
+                        label=ft.Text((start + timedelta(days=day)).strftime("%m/%d"), size=10, color=ft.Colors.GREY_400)
+                    )
+                    for day in range(0, days + 1, max(days // 6, 1))
+                ],
+                labels_size=20
+            ),
+            horizontal_grid_lines=ft.ChartGridLines(color="#2a3342", width=1),
+            expand=True
+        )
+    
+    def create_mode_button(self, text, icon, mode_value, current_mode, on_click, binding=None):
+        """A selectable mode button; with a (device id, field) `binding` its selection follows the device"""
+        button, parts = CARD_TEMPLATES["mode"].clone()
+        parts["icon"].name = icon
+        parts["text"].value = text
+        button.on_click = on_click
+        looks = [
+            (parts["icon"], "color", ft.Colors.ORANGE_400, ft.Colors.GREY_400),
+            (parts["text"], "color", ft.Colors.WHITE, ft.Colors.GREY_400),
+            (button, "bgcolor", ft.Colors.BLUE_900, "#0f1419"),
+            (button, "border", shared_border(2, ft.Colors.BLUE_600), shared_border(2, "#2a3342")),
+        ]
+        for control, attr, selected, unselected in looks:
+            if binding is None:
+                setattr(control, attr, selected if current_mode == mode_value else unselected)
+            else:
+                device_id, field = binding
+                self.bind(device_id, control, attr,
+                          lambda d, selected=selected, unselected=unselected: selected if getattr(d, field) == mode_value else unselected)
+        return button
+    
+    def create_schedule_item(self, schedule):
+        def toggle_schedule(e):
+            self.scheduler.set_enabled(schedule.id, e.control.value)
+            self.state.append("schedule", schedule.id, e.control.value)
+            self.home.publish("schedules")
+        
+        when = schedule.label()
+        if schedule.enabled and schedule.due is not None:
+            when += f" · next {datetime.fromtimestamp(schedule.due).strftime('%a %I:%M %p')}"
+            preheat = self.home.preheat_starts.get(schedule.id)
+            if preheat is not None:
+                when += f" · preheat from {datetime.fromtimestamp(preheat).strftime('%I:%M %p').lstrip('0')}"
+        row, parts = CARD_TEMPLATES["schedule"].clone()
+        parts["title"].value = schedule.definition.get("title", schedule.id)
+        parts["when"].value = when
+        parts["switch"].value = schedule.enabled
+        parts["switch"].on_change = toggle_schedule
+        return row
+    
+    def create_info_row(self, label, value, topic=None):
+        row, parts = CARD_TEMPLATES["info"].clone()
+        parts["label"].value = label
+        if topic is None:
+            parts["value"].value = value
+        else:
+            self.bind_topic(topic, parts["value"], "value", value)
+        return row
+    
+    def create_device_info(self, device_id):
+        """Information rows of a detail view, patched in place after every poll"""
+        return [
+            self.create_info_row(label, lambda label=label: dict(self.home.describe_device(device_id)).get(label, "—"), topic="device_info")
+            for label, _ in self.home.describe_device(device_id)
+        ]
 
     def show_scenes(self):
         """Scenes and automation page"""
+        self.show_view(("scenes",), self.build_scenes, ["scenes"], live=True)
+    
+    def build_scenes(self):
         def create_new_scene(e):
             self.page.show_snack_bar(ft.SnackBar(content=ft.Text("Create new scene feature coming soon!")))
         
-        self.main_content.content = ft.Column([
+        return ft.Column([
             ft.Text("Scenes & Automation", size=28, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
             ft.Container(height=20),
             
@@ -1045,30 +4588,10 @@ class SmartHomeApp:
             ft.Container(height=15),
             
             # Scene cards
-            self.create_scene_detail_card(
-                "Movie Night",
-                2,
-                ["light1: off", "thermostat: set (21)"],
-                ft.Colors.PURPLE_900
-            ),
-            
-            ft.Container(height=15),
-            
-            self.create_scene_detail_card(
-                "Good Morning",
-                3,
-                ["light1: on", "light2: on", "thermostat: set (23)"],
-                ft.Colors.PURPLE_900
-            ),
-            
-            ft.Container(height=15),
-            
-            self.create_scene_detail_card(
-                "Away Mode",
-                4,
-                ["light1: off", "light2: off", "door1: lock", "thermostat: set (18)"],
-                ft.Colors.PURPLE_900
-            ),
+            ft.Column([
+                self.create_scene_detail_card(scene["name"], scene["actions"], scene["devices"], ft.Colors.PURPLE_900)
+                for scene in self.scenes
+            ], spacing=15),
             
             ft.Container(height=30),
             
@@ -1076,18 +4599,75 @@ class SmartHomeApp:
             ft.ElevatedButton(
                 "+ Create New Scene",
                 on_click=create_new_scene,
-                bgcolor=ft.Colors.PURPLE_700,
-                color=ft.Colors.WHITE,
-                style=ft.ButtonStyle(shape=ft.RoundedRectangleBorder(radius=8)),
+                style=shared_button_style(color=ft.Colors.WHITE, bgcolor=ft.Colors.PURPLE_700, radius=8),
                 height=50
             )
         ], scroll=ft.ScrollMode.AUTO)
+    
+    def show_automations(self):
+        """Automation rules with their enable switches and firing history"""
+        self.show_view(("automations",), self.build_automations, ["rules"])
+    
+    def build_automations(self):
+        stats = self.rule_engine.stats
+        return ft.Column([
+            ft.Text("Automations", size=28, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
+            ft.Container(height=10),
+            self.bind_topic("rules", ft.Text(size=12, color=ft.Colors.GREY_400), "value",
+                            lambda: f"{len(self.rule_engine.rules)} rules · {stats['events']} changes checked · {stats['fired']} fired"),
+            ft.Container(height=20),
+            ft.Column([
+                self.create_rule_card(rule)
+                for rule in self.rule_engine.rules.values()
+            ], spacing=15),
+        ], scroll=ft.ScrollMode.AUTO)
+    
+    def create_rule_card(self, rule):
+        def toggle_rule(e):
+            rule.enabled = e.control.value
+            rule.definition["enabled"] = rule.enabled
+            self.state.append("rule", rule.name, rule.enabled)
+            self.home.publish("rules")
+        
+        window = ""
+        if rule.definition.get("after"):
+            window += f" after {rule.definition['after']}"
+        if rule.definition.get("before"):
+            window += f" before {rule.definition['before']}"
+        def last():
+            if rule.last_fired is None:
+                return "never fired"
+            return f"fired {rule.fired}× · last {datetime.fromtimestamp(rule.last_fired).strftime('%b %d %H:%M')}"
         
-        self.page.update()
+        return ft.Container(
+            content=ft.Row([
+                ft.Container(
+                    content=ft.Icon(ft.Icons.AUTO_MODE, color=ft.Colors.WHITE, size=24),
+                    width=50,
+                    height=50,
+                    bgcolor=ft.Colors.TEAL_700,
+                    border_radius=25,
+                    alignment=ft.alignment.center
+                ),
+                ft.Column([
+                    ft.Text(rule.name, size=18, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
+                    ft.Text(f"When {rule.definition['when']}{window}", size=12, color=ft.Colors.GREY_400),
+                    ft.Column([
+                        ft.Text(f"• {action}", size=11, color=ft.Colors.GREY_400)
+                        for action in rule.definition["then"]
+                    ], spacing=2),
+                    self.bind_topic("rules", ft.Text(size=11, color=ft.Colors.GREY_500), "value", last),
+                ], spacing=2, expand=True),
+                self.bind_topic("rules", ft.Switch(active_color=ft.Colors.TEAL_400, on_change=toggle_rule), "value", lambda: rule.enabled)
+            ], spacing=15),
+            padding=20,
+            bgcolor="#1a2332",
+            border_radius=15
+        )
     
     def create_scene_detail_card(self, name, action_count, actions, bg_color):
         def activate_scene(e):
-            self.page.show_snack_bar(ft.SnackBar(content=ft.Text(f"{name} activated!")))
+            self.activate_scene(name)
         
         return ft.Container(
             content=ft.Row([
@@ -1121,17 +4701,124 @@ class SmartHomeApp:
             width=None
         )
     
+    def show_rooms(self):
+        """Rooms with their live aggregates"""
+        self.show_view(("rooms",), self.build_rooms, ["devices"], live=True)
+    
+    def build_rooms(self):
+        def open_statistics(e):
+            self.show_statistics()
+        
+        # Busiest rooms first; a page of cards keeps very large homes cheap to draw
+        rooms = sorted(self.home.rooms, key=lambda room: (-room["watts"], room["room"]))
+        shown = rooms[:DEVICE_PAGE_SIZE]
+        return ft.Column([
+            ft.Row([
+                ft.Text("Rooms", size=28, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
+                ft.Container(expand=True),
+                ft.TextButton("Activity & Statistics", icon=ft.Icons.BAR_CHART, on_click=open_statistics,
+                              style=shared_button_style(color=ft.Colors.BLUE_400)),
+            ]),
+            ft.Text(
+                f"{len(rooms)} rooms · {sum(room['on'] for room in rooms)} devices on · {self.current_power():.0f} W",
+                size=12,
+                color=ft.Colors.GREY_400
+            ),
+            ft.Container(height=20),
+            ft.Row([self.create_room_card(room) for room in shown], spacing=20, wrap=True),
+            ft.Text(f"and {len(rooms) - len(shown)} more rooms", size=12, color=ft.Colors.GREY_500, visible=len(rooms) > len(shown)),
+        ], scroll=ft.ScrollMode.AUTO)
+    
+    def create_room_card(self, room):
+        temperature = "—" if room["temperature"] is None else f"{room['temperature']:.1f}°C"
+        return ft.Container(
+            content=ft.Column([
+                ft.Row([
+                    ft.Icon(ft.Icons.MEETING_ROOM, color=ft.Colors.BLUE_400, size=24),
+                    ft.Text(room["room"], size=18, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
+                ], spacing=10),
+                ft.Container(height=5),
+                self.create_info_row("Devices on", f"{room['on']} of {room['devices']}"),
+                self.create_info_row("Power", f"{room['watts']:.0f} W"),
+                self.create_info_row("Temperature", temperature),
+            ], spacing=8),
+            width=260,
+            padding=20,
+            bgcolor="#1a2332",
+            border_radius=15
+        )
+    
     def show_statistics(self):
         """Statistics and energy page"""
-        self.main_content.content = ft.Column([
+        self.show_view(("statistics",), self.build_statistics, ["devices"])
+    
+    def build_statistics(self):
+        now = time.time()
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+        metrics = self.home.metrics
+        # Monthly figures are scaled from the last 30 days, or from the history we have
+        span = min(30 * 86400, now - self.energy.origin)
+        per_month = 30 * 86400 / max(span, 3600)
+        tips = self.energy_tips(now - span, now)
+        
+        # Figures that move with every sample are patched in place while the page is open
+        def today_cost():
+            return f"${self.costs.cost([EnergyStore.HOME], today, time.time())[0]:.2f}"
+        
+        def monthly_cost():
+            return f"${self.costs.cost([EnergyStore.HOME], now - span, time.time())[0] * per_month:.2f}"
+        
+        def device_row(device):
+            icon, icon_color = STAT_ICONS[device.kind]
+            return self.create_device_stat_row(
+                icon,
+                device.name,
+                "Active" if is_active(device) else "Inactive",
+                f"{device_power(device):.0f}W",
+                icon_color
+            )
+        
+        recent_actions = self.action_log.last(15)
+        if recent_actions:
+            action_log = ft.Container(
+                content=ft.Column([self.create_action_log_row(entry) for entry in recent_actions], spacing=6),
+                padding=15,
+                bgcolor="#0f1419",
+                border_radius=8
+            )
+        else:
+            action_log = ft.Container(
+                content=ft.Text("No recent actions to display.", size=14, color=ft.Colors.GREY_600),
+                height=150,
+                alignment=ft.alignment.center,
+                bgcolor="#0f1419",
+                border_radius=8
+            )
+        
+        # This week vs last week, one day rollup per bar
+        week_start = today - 6 * 86400
+        this_week = [wh / 1000 for wh in self.energy.buckets(EnergyStore.HOME, "day", week_start, today + 86400)]
+        last_week = [wh / 1000 for wh in self.energy.buckets(EnergyStore.HOME, "day", week_start - 7 * 86400, today - 6 * 86400)]
+        scale = max(this_week + last_week + [1])
+        comparison_rows = [
+            self.create_energy_comparison_row(
+                datetime.fromtimestamp(week_start + day * 86400).strftime("%m/%d"),
+                this_week[day],
+                last_week[day],
+                scale
+            )
+            for day in range(7)
+        ]
+        
+        return ft.Column([
             ft.Text("Activity & Device Statistics", size=28, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
             ft.Container(height=20),
             
             # Top stats
             ft.Row([
-                self.create_large_stat_card(ft.Icons.THERMOSTAT, "21", "Total Actions", "#dbeafe"),
-                self.create_large_stat_card(ft.Icons.DEVICES, "3", "Active Devices", "#d1fae5"),
-                self.create_large_stat_card(ft.Icons.BOLT, "105W", "Total Power", "#fed7aa"),
+                self.create_large_stat_card(ft.Icons.THERMOSTAT, lambda: str(metrics.value("actions.total")), "Total Actions", "#dbeafe", topic="devices"),
+                self.create_large_stat_card(ft.Icons.DEVICES, lambda: str(metrics.value("devices.active")), "Active Devices", "#d1fae5", topic="devices"),
+                self.create_large_stat_card(ft.Icons.BOLT, lambda: f"{self.current_power():.0f}W", "Total Power", "#fed7aa", topic="devices"),
             ], spacing=20),
             
             ft.Container(height=30),
@@ -1173,15 +4860,7 @@ class SmartHomeApp:
                 content=ft.Column([
                     ft.Text("Device Statistics", size=20, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
                     ft.Container(height=20),
-                    self.create_device_stat_row(ft.Icons.LIGHTBULB, "Living Room Light", "Active", "60W", ft.Colors.ORANGE_400),
-                    ft.Divider(color="#2a3342"),
-                    self.create_device_stat_row(ft.Icons.LIGHTBULB, "Bedroom Light", "Active", "40W", ft.Colors.ORANGE_400),
-                    ft.Divider(color="#2a3342"),
-                    self.create_device_stat_row(ft.Icons.DOOR_SLIDING, "Front Door", "Active", "5W", ft.Colors.GREY_400),
-                    ft.Divider(color="#2a3342"),
-                    self.create_device_stat_row(ft.Icons.THERMOSTAT, "Thermostat", "Inactive", "0W", ft.Colors.RED_400),
-                    ft.Divider(color="#2a3342"),
-                    self.create_device_stat_row(ft.Icons.AIR, "Ceiling Fan", "Inactive", "0W", ft.Colors.CYAN_400),
+                    self.create_device_pager("statistics", list(STAT_ICONS), device_row, ft.Column(spacing=15)),
                 ]),
                 padding=30,
                 bgcolor="#1a2332",
@@ -1195,13 +4874,7 @@ class SmartHomeApp:
                 content=ft.Column([
                     ft.Text("Action Log (Last 15 Actions)", size=20, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
                     ft.Container(height=20),
-                    ft.Container(
-                        content=ft.Text("No recent actions to display.", size=14, color=ft.Colors.GREY_600),
-                        height=150,
-                        alignment=ft.alignment.center,
-                        bgcolor="#0f1419",
-                        border_radius=8
-                    )
+                    action_log
                 ]),
                 padding=30,
                 bgcolor="#1a2332",
@@ -1215,9 +4888,9 @@ class SmartHomeApp:
             ft.Container(height=20),
             
             ft.Row([
-                self.create_energy_card(ft.Icons.BOLT, "105 W", "Current Usage", "#fef3c7"),
-                self.create_energy_card(ft.Icons.ATTACH_MONEY_OUTLINED, "$0.30", "Today's Cost", "#d1fae5"),
-                self.create_energy_card(ft.Icons.CALENDAR_TODAY, "$9.07", "Est. Monthly", "#dbeafe"),
+                self.create_energy_card(ft.Icons.BOLT, lambda: f"{self.current_power():.0f} W", "Current Usage", "#fef3c7", topic="devices"),
+                self.create_energy_card(ft.Icons.ATTACH_MONEY_OUTLINED, today_cost, "Today's Cost", "#d1fae5", topic="energy"),
+                self.create_energy_card(ft.Icons.CALENDAR_TODAY, monthly_cost, "Est. Monthly", "#dbeafe", topic="energy"),
             ], spacing=20),
             
             ft.Container(height=20),
@@ -1230,16 +4903,17 @@ class SmartHomeApp:
                         ft.Text("Energy Saving Tips", size=16, weight=ft.FontWeight.BOLD, color=ft.Colors.GREEN_900),
                     ], spacing=10),
                     ft.Container(height=10),
-                    ft.Text("• Use 'Away Mode' scene when leaving home", size=12, color=ft.Colors.GREEN_900),
-                    ft.Text("• Set thermostat to 20°C at night for optimal efficiency", size=12, color=ft.Colors.GREEN_900),
-                    ft.Text("• Turn off lights in unused rooms", size=12, color=ft.Colors.GREEN_900),
+                    ft.Column([
+                        ft.Text(f"• {tip} (${saved * per_month:.2f}/month)", size=12, color=ft.Colors.GREEN_900)
+                        for tip, saved in tips
+                    ], spacing=5),
                     ft.Container(height=5),
-                    ft.Text("• Potential savings: $1.36/month", size=12, weight=ft.FontWeight.BOLD, color=ft.Colors.GREEN_700),
+                    ft.Text(f"• Potential savings: ${sum(saved for _, saved in tips) * per_month:.2f}/month", size=12, weight=ft.FontWeight.BOLD, color=ft.Colors.GREEN_700),
                 ], spacing=5),
                 padding=20,
                 bgcolor="#f0fdf4",
                 border_radius=12,
-                border=ft.border.all(1, ft.Colors.GREEN_200)
+                border=shared_border(1, ft.Colors.GREEN_200)
             ),
             
             ft.Container(height=20),
@@ -1249,13 +4923,7 @@ class SmartHomeApp:
                 content=ft.Column([
                     ft.Text("This Week vs Last Week", size=20, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
                     ft.Container(height=20),
-                    self.create_energy_comparison_row("11/21", 20, 26),
-                    self.create_energy_comparison_row("11/22", 19, 19),
-                    self.create_energy_comparison_row("11/23", 21, 21),
-                    self.create_energy_comparison_row("11/24", 17, 17),
-                    self.create_energy_comparison_row("11/25", 22, 22),
-                    self.create_energy_comparison_row("11/26", 19, 19),
-                    self.create_energy_comparison_row("11/27", 16, 16),
+                    *comparison_rows,
                     ft.Container(height=10),
                     ft.Row([
                         ft.Container(width=10, height=10, bgcolor=ft.Colors.BLUE_600, border_radius=2),
@@ -1270,30 +4938,50 @@ class SmartHomeApp:
                 border_radius=15
             ),
         ], scroll=ft.ScrollMode.AUTO)
+    
+    def energy_tips(self, start, end):
+        """Savings tips with the $ each would have saved over [start, end) of real history"""
+        devices = list(self.devices)
+        index = {device.id: i for i, device in enumerate(devices)}
         
-        self.page.update()
+        def fractions(saved):
+            result = np.zeros(len(devices))
+            for device_id, fraction in saved.items():
+                result[index[device_id]] = min(max(fraction, 0.0), 1.0)
+            return result
+        
+        def heating_saved(device, target):
+            return (device.target - target) * HEATING_SAVING_PER_DEGREE
+        
+        # Away Mode: what its actions would save while nobody is home
+        away = {}
+        for action in self.scene_engine.scenes.get("Away Mode", []):
+            device = self.devices[action.device_id]
+            if action.field == "status" and action.value == "OFF":
+                away[device.id] = 1.0
+            elif device.kind == "thermostat" and action.field == "target":
+                away[device.id] = heating_saved(device, action.value)
+        night_heating = {device.id: heating_saved(device, 20) for device in self.devices.find(kind="thermostat")}
+        night_lights = {device.id: 1.0 for device in self.devices.find(kind="light")}
+        
+        tips = [
+            ("Use 'Away Mode' scene when leaving home", fractions(away), week_hours(**AWAY_HOURS)),
+            ("Set thermostat to 20°C at night for optimal efficiency", fractions(night_heating), week_hours(**NIGHT_HOURS)),
+            ("Turn off lights in unused rooms", fractions(night_lights), week_hours((1, 6))),
+        ]
+        saved = self.costs.savings([device.id for device in devices], start, end, [(f, mask) for _, f, mask in tips])
+        return [(text, amount) for (text, _, _), amount in zip(tips, saved)]
     
-    def create_large_stat_card(self, icon, value, label, bg_color):
-        return ft.Container(
-            content=ft.Row([
-                ft.Container(
-                    content=ft.Icon(icon, color=ft.Colors.BLUE_700, size=30),
-                    width=60,
-                    height=60,
-                    bgcolor=bg_color,
-                    border_radius=30,
-                    alignment=ft.alignment.center
-                ),
-                ft.Column([
-                    ft.Text(value, size=28, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
-                    ft.Text(label, size=12, color=ft.Colors.GREY_400),
-                ], spacing=2)
-            ], spacing=15),
-            padding=20,
-            bgcolor="#1a2332",
-            border_radius=12,
-            expand=True
-        )
+    def create_large_stat_card(self, icon, value, label, bg_color, topic=None):
+        card, parts = CARD_TEMPLATES["large stat"].clone()
+        parts["icon"].name = icon
+        parts["badge"].bgcolor = bg_color
+        if topic is None:
+            parts["value"].value = value
+        else:
+            self.bind_topic(topic, parts["value"], "value", value)
+        parts["label"].value = label
+        return card
     
     def create_device_stat_row(self, icon, name, status, power, icon_color):
         status_color = ft.Colors.GREEN_400 if status == "Active" else ft.Colors.GREY_400
@@ -1302,14 +4990,29 @@ class SmartHomeApp:
             ft.Text(name, size=14, color=ft.Colors.WHITE, expand=True),
             ft.Container(
                 content=ft.Text(status, size=12, color=status_color),
-                padding=ft.padding.symmetric(horizontal=10, vertical=5),
+                padding=shared_padding(left=10, top=5, right=10, bottom=5),
                 bgcolor=ft.Colors.GREEN_900 if status == "Active" else ft.Colors.GREY_800,
                 border_radius=12
             ),
             ft.Text(power, size=14, color=ft.Colors.ORANGE_400, weight=ft.FontWeight.BOLD),
         ], spacing=15)
     
-    def create_energy_card(self, icon, value, label, bg_color):
+    def create_action_log_row(self, entry):
+        device = self.devices.by_id.get(entry["device"])
+        name = device.name if device else entry["device"]
+        return ft.Row([
+            ft.Text(datetime.fromtimestamp(entry["ts"]).strftime("%H:%M:%S"), size=12, color=ft.Colors.GREY_400, width=70),
+            ft.Text(name, size=12, color=ft.Colors.WHITE, weight=ft.FontWeight.BOLD, width=160),
+            ft.Text(f"{entry['field']}: {entry['old']} → {entry['new']}", size=12, color=ft.Colors.GREY_400, expand=True),
+            ft.Text(entry["source"], size=11, color=ft.Colors.GREY_600),
+        ], spacing=10)
+    
+    def create_energy_card(self, icon, value, label, bg_color, topic=None):
+        value_text = ft.Text(size=24, weight=ft.FontWeight.BOLD, color="#1a1f2e")
+        if topic is None:
+            value_text.value = value
+        else:
+            self.bind_topic(topic, value_text, "value", value)
         return ft.Container(
             content=ft.Row([
                 ft.Container(
@@ -1321,7 +5024,7 @@ class SmartHomeApp:
                     alignment=ft.alignment.center
                 ),
                 ft.Column([
-                    ft.Text(value, size=24, weight=ft.FontWeight.BOLD, color="#1a1f2e"),
+                    value_text,
                     ft.Text(label, size=12, color="#666"),
                 ], spacing=2)
             ], spacing=15),
@@ -1331,10 +5034,10 @@ class SmartHomeApp:
             expand=True
         )
     
-    def create_energy_comparison_row(self, date, this_week, last_week):
+    def create_energy_comparison_row(self, date, this_week, last_week, scale=30):
         max_width = 600
-        this_week_width = (this_week / 30) * max_width
-        last_week_width = (last_week / 30) * max_width
+        this_week_width = (this_week / scale) * max_width
+        last_week_width = (last_week / scale) * max_width
         
         return ft.Row([
             ft.Text(date, size=11, color=ft.Colors.GREY_400, width=50),
@@ -1352,12 +5055,36 @@ class SmartHomeApp:
                     border_radius=4
                 ),
             ], width=max_width),
-            ft.Text(f"{this_week} kWh", size=11, color=ft.Colors.WHITE, width=60),
+            ft.Text(f"{this_week:.1f} kWh", size=11, color=ft.Colors.WHITE, width=60),
         ], spacing=10)
 
 
+# Created by the first session, then shared by all of them
+shared_home = None
+shared_home_lock = threading.Lock()
+# Filled in by the first session
+startup = StartupTimeline()
+startup.mark("import")
+
+
+def load_shared_home():
+    global shared_home
+    with shared_home_lock:
+        if shared_home is None:
+            # Background work waits until the first session is interactive
+            shared_home = Home(start=False)
+    return shared_home
+
+
 def main(page: ft.Page):
-    SmartHomeApp(page)
+    first = "interactive" not in startup.marks
+    startup.mark("session")
+    app = SmartHomeApp(page, load_home=load_shared_home, timeline=startup)
+    app.home.start()
+    if first:
+        logger.info(startup.report())
+        app.home.instrumentation.serve(METRICS_PORT, app.home.metrics)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
     ft.app(target=main)
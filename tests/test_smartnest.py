@@ -0,0 +1,290 @@
+"""Unit tests for the parts of smartNest that need no Flet session or devices.
+
+    python -m pytest tests
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from smartNest import ActionLog, Metrics, RuleEngine, SceneEngine, SliderCoalescer, StateStore, min_max_downsample
+
+
+DEVICES = {
+    "light1": SimpleNamespace(kind="light"),
+    "door1": SimpleNamespace(kind="lock"),
+    "thermostat": SimpleNamespace(kind="thermostat"),
+    "fan1": SimpleNamespace(kind="fan"),
+}
+
+
+def scene_engine(apply=None, timeout=5.0):
+    return SceneEngine(DEVICES, apply, aliases={"hall": "light1"}, timeout=timeout)
+
+
+# SceneEngine.parse
+
+@pytest.mark.parametrize("text, expected", [
+    ("light1: on", ("light1", "status", "ON")),
+    ("light1: OFF", ("light1", "status", "OFF")),
+    ("door1: lock", ("door1", "locked", True)),
+    ("door1: unlock", ("door1", "locked", False)),
+    ("thermostat: set (21)", ("thermostat", "target", 21)),
+    ("  fan1 :set(-2) ", ("fan1", "speed", -2)),
+    ("light1: set (40)", ("light1", "brightness", 40)),
+    ("hall: on", ("light1", "status", "ON")),
+])
+def test_parse(text, expected):
+    action = scene_engine().parse(text)
+    assert (action.device_id, action.field, action.value) == expected
+    assert action.text == text
+
+
+@pytest.mark.parametrize("text, message", [
+    ("light1 on", "Cannot parse"),
+    ("garage: open", "Unknown device"),
+    ("light1: dance", "Unknown command"),
+    ("door1: set (3)", "no settable value"),
+])
+def test_parse_rejects(text, message):
+    with pytest.raises(ValueError, match=message):
+        scene_engine().parse(text)
+
+
+def test_activate_reports_each_action():
+    futures = []
+
+    def apply(device_id, field, value, source):
+        futures.append(Future())
+        return futures[-1]
+
+    engine = scene_engine(apply, timeout=0.2)
+    engine.load([{"name": "Night", "devices": ["light1: off", "door1: lock", "fan1: off", "thermostat: set (18)"]}])
+    scene = engine.activate("Night")
+    assert not scene.done()
+    futures[0].set_result("OFF")
+    futures[1].set_exception(RuntimeError("jammed"))
+    futures[2].cancel()
+    result = scene.result(1)
+    assert [(r["ok"], r["error"]) for r in result["results"]] == [
+        (True, None), (False, "jammed"), (False, "cancelled"), (False, "timeout"),
+    ]
+    assert not result["ok"]
+    assert futures[3].cancelled()
+
+
+# RuleEngine matching
+
+def rule_engine(rules, apply):
+    engine = RuleEngine(scene_engine().parse, apply)
+    engine.load(rules)
+    return engine
+
+
+def at(hour, minute=0):
+    return time.mktime((2026, 1, 5, hour, minute, 0, 0, 0, -1))
+
+
+def test_rule_fires_on_matching_change():
+    applied = []
+    engine = rule_engine(
+        [{"name": "welcome", "when": "door1: unlock", "then": ["light1: on", "thermostat: set (21)"]}],
+        lambda *change: applied.append(change),
+    )
+    assert engine.evaluate("door1", "locked", True, at(12)) == []
+    assert engine.evaluate("light1", "status", "ON", at(12)) == []
+    fired = engine.evaluate("door1", "locked", False, at(12))
+    assert [rule.name for rule in fired] == ["welcome"]
+    assert applied == [("light1", "status", "ON", "rule: welcome"), ("thermostat", "target", 21, "rule: welcome")]
+    assert fired[0].fired == 1
+
+
+def test_rule_window_wraps_midnight():
+    engine = rule_engine(
+        [{"name": "night", "when": "door1: unlock", "then": ["light1: on"], "after": "22:00", "before": "06:00"}],
+        lambda *change: None,
+    )
+    assert engine.evaluate("door1", "locked", False, at(23, 30))
+    assert engine.evaluate("door1", "locked", False, at(5, 59))
+    assert not engine.evaluate("door1", "locked", False, at(6))
+    assert not engine.evaluate("door1", "locked", False, at(12))
+
+
+def test_disabled_rule_and_own_writes_do_not_fire():
+    engine = rule_engine(
+        [{"name": "echo", "when": "light1: on", "then": ["light1: on"], "enabled": False}],
+        lambda *change: None,
+    )
+    assert not engine.evaluate("light1", "status", "ON", at(12))
+    engine.rules["echo"].enabled = True
+    assert not engine.evaluate("light1", "status", "ON", at(12), source="rule: echo")
+    assert engine.evaluate("light1", "status", "ON", at(12), source="user")
+
+
+def test_rule_chains_stop_at_max_depth():
+    applied = []
+
+    def apply(device_id, field, value, source):
+        applied.append((device_id, field, value))
+        engine.notify(device_id, field, value, source)
+
+    # Each rule undoes the other, which would loop forever without the depth limit
+    engine = rule_engine([
+        {"name": "relock", "when": "door1: unlock", "then": ["door1: lock"]},
+        {"name": "reopen", "when": "door1: lock", "then": ["door1: unlock"]},
+    ], apply)
+    engine.notify("door1", "locked", False, "revert")
+    engine.notify("door1", "locked", False, "user")
+    engine.wait_idle()
+    assert len(applied) == engine.max_depth + 1
+    assert engine.stats["ignored"] == 2
+
+
+# StateStore snapshot and log recovery
+
+def test_state_store_replays_log_after_snapshot(tmp_path):
+    store = StateStore(tmp_path)
+    assert store.load() == (None, [])
+    store.save({"devices": ["a"]})
+    store.append("set", "light1", "status", "ON")
+    store.append("set", "light1", "brightness", 40)
+    store.sync()
+
+    state, records = StateStore(tmp_path).load()
+    assert state["devices"] == ["a"]
+    assert [record[1:] for record in records] == [("set", "light1", "status", "ON"), ("set", "light1", "brightness", 40)]
+
+
+def test_state_store_drops_torn_record(tmp_path):
+    store = StateStore(tmp_path)
+    store.load()
+    store.append("set", "light1", "status", "ON")
+    store.append("set", "light1", "status", "OFF")
+    store.sync()
+    wal_path = os.path.join(tmp_path, "wal.log")
+    with open(wal_path, "r+b") as f:
+        f.truncate(os.path.getsize(wal_path) - 3)
+
+    recovered = StateStore(tmp_path)
+    _, records = recovered.load()
+    assert [record[1:] for record in records] == [("set", "light1", "status", "ON")]
+    # New records go after the last intact one
+    recovered.append("set", "light1", "status", "OFF")
+    recovered.sync()
+    _, records = StateStore(tmp_path).load()
+    assert [record[-1] for record in records] == ["ON", "OFF"]
+
+
+def test_state_store_compaction_skips_folded_records(tmp_path):
+    store = StateStore(tmp_path)
+    store.load()
+    store.dump = lambda: {"devices": ["compacted"]}
+    store.append("set", "light1", "status", "ON")
+    store.compact()
+    store.append("set", "light1", "status", "OFF")
+    store.sync()
+
+    state, records = StateStore(tmp_path).load()
+    assert state["devices"] == ["compacted"]
+    assert [record[-1] for record in records] == ["OFF"]
+
+
+# ActionLog index queries
+
+def test_action_log_history_and_recent(tmp_path):
+    log = ActionLog(tmp_path, size=5)
+    entries = [log.record(f"device{i % 3}", "status", i, i + 1) for i in range(20)]
+
+    assert [entry["old"] for entry in log.last(3)] == [19, 18, 17]
+    assert [entry["old"] for entry in log.history("device1")] == list(range(1, 20, 3))
+    middle = entries[9]["ts"]
+    assert [entry["old"] for entry in log.history("device0", middle)] == [9, 12, 15, 18]
+    assert [entry["old"] for entry in log.history("device0", 0, middle)] == [0, 3, 6]
+    assert log.history("unknown") == []
+
+    reopened = ActionLog(tmp_path, size=5)
+    assert reopened.count == 20
+    assert [entry["old"] for entry in reopened.last(10)] == [19, 18, 17, 16, 15]
+    assert reopened.history("device2") == log.history("device2")
+
+
+def test_action_log_repairs_torn_tails(tmp_path):
+    log = ActionLog(tmp_path)
+    for i in range(3):
+        log.record("light1", "status", i, i + 1)
+    # Crash after a journal line was written but before its index record, then a torn line and record
+    line = {"ts": time.time(), "device": "door1", "field": "locked", "old": False, "new": True, "source": "user"}
+    log.journal.write((json.dumps(line) + "\n").encode() + b'{"ts": 1, "dev')
+    log.journal.flush()
+    log.index.write(b"\0" * 7)
+    log.index.flush()
+
+    recovered = ActionLog(tmp_path)
+    assert recovered.count == 4
+    assert [entry["device"] for entry in recovered.history("door1")] == ["door1"]
+    assert os.path.getsize(os.path.join(tmp_path, "actions.idx")) % ActionLog.INDEX.size == 0
+    recovered.record("light1", "status", 3, 4)
+    assert [entry["old"] for entry in ActionLog(tmp_path).history("light1")] == [0, 1, 2, 3]
+
+
+# min_max_downsample
+
+def test_downsample_keeps_peaks_in_order():
+    values = np.zeros(1000)
+    values[123], values[877] = 50.0, -20.0
+    indices = min_max_downsample(values, 10)
+    assert 123 in indices and 877 in indices
+    assert np.all(np.diff(indices) > 0)
+    assert len(indices) <= 20
+
+
+def test_downsample_short_and_flat_series():
+    assert min_max_downsample(np.arange(5.0), 10).tolist() == [0, 1, 2, 3, 4]
+    assert min_max_downsample(np.full(100, 3.0), 10).tolist() == list(range(0, 100, 10))
+    indices = min_max_downsample(np.arange(7.0), 3)
+    assert indices.max() < 7
+
+
+# SliderCoalescer
+
+def drag(slider, values, pause=0.0):
+    for value in values:
+        slider.on_change(SimpleNamespace(control=SimpleNamespace(value=value)))
+        time.sleep(pause)
+
+
+def test_slider_commits_last_value_once_it_rests():
+    committed, metrics = [], Metrics()
+    slider = SliderCoalescer(lambda value: None, committed.append, metrics, quiet=0.05)
+    drag(slider, range(10, 30), pause=0.005)
+    assert committed == []
+    time.sleep(0.2)
+    assert committed == [29]
+    assert metrics.value("slider.ticks") == 20
+    assert metrics.value("slider.dropped") == 19
+    assert metrics.value("slider.committed") == 1
+
+
+def test_slider_drag_end_commits_at_once():
+    committed, previews = [], []
+    slider = SliderCoalescer(previews.append, committed.append, Metrics(), quiet=10, frame=10)
+    drag(slider, [1, 2, 3])
+    slider.on_change_end(None)
+    assert committed == [3]
+    # The first tick previews at once; the rest are throttled until the commit
+    assert previews == [1, 3]
+    slider.on_change_end(None)
+    assert committed == [3]
+
+
+def test_slider_uses_one_timer_per_drag():
+    slider = SliderCoalescer(lambda value: None, lambda value: None, Metrics(), quiet=0.05)
+    before = threading.active_count()
+    drag(slider, range(50))
+    assert threading.active_count() <= before + 1
+    slider.on_change_end(None)